@@ -1,21 +1,48 @@
+import asyncio
+import functools
+import hashlib
+import json
 import os
-from typing import Any, Coroutine, List
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Tuple
 
-import google.generativeai as genai
-import instructor
 from dotenv import load_dotenv
 from pydantic import BaseModel
 
 load_dotenv()
 
-genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-client = instructor.from_gemini(
-    client=genai.GenerativeModel(
-        model_name="models/gemini-1.5-flash-latest",
-    ),
-    mode=instructor.Mode.GEMINI_JSON,
+# Matches kept per kind of query, least recently used first out.
+MATCH_CACHE_SIZE = 256
+# Seconds a MatchBatcher waits for more queries against the same cart before it sends them as one request.
+BATCH_WINDOW = 0.01
 
-)
+
+def _build_client(use_async: bool) -> Any:
+    """Build a structured-output Gemini client, importing and configuring Gemini on first use."""
+    import google.generativeai as genai
+    import instructor
+
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    return instructor.from_gemini(
+        client=genai.GenerativeModel(
+            model_name="models/gemini-1.5-flash-latest",
+        ),
+        mode=instructor.Mode.GEMINI_JSON,
+        use_async=use_async,
+    )
+
+
+@functools.cache
+def get_client() -> Any:
+    """Return the structured-output Gemini client, created on first use."""
+    return _build_client(use_async=False)
+
+
+@functools.cache
+def get_async_client() -> Any:
+    """Return the asynchronous structured-output Gemini client, created on first use."""
+    return _build_client(use_async=True)
 
 
 class Product(BaseModel):
@@ -31,34 +58,233 @@ class AlternativeProduct(BaseModel):
     product_name: str
 
 
-def find_product_in_cart(cart: List[dict], product_name: str) -> Coroutine[Any, Any, Product | Any]:
+class ProductMatch(Product):
+    search_term: str
+
+
+class ProductMatches(BaseModel):
+    matches: List[ProductMatch]
+
+
+class MatchCache:
+    """Least recently used answers of the model, by (cart fingerprint, query). Safe to share between threads."""
+
+    def __init__(self, maxsize: int = MATCH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached answer, or None."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+product_matches = MatchCache()
+alternative_matches = MatchCache()
+
+
+def cart_fingerprint(products: List[dict]) -> str:
+    """Return a short digest of a list of products that changes whenever a product, price or the order changes."""
+    text = json.dumps(products, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def _normalize(product_name: str) -> str:
+    return " ".join(product_name.lower().split())
+
+
+def _products_prompt(products: List[dict], task: str, product_names: List[str]) -> str:
+    # The products and search terms are compact JSON on lines of their own, the task is around them.
+    return (f"Here is a list of products:\n{json.dumps(products, separators=(',', ':'), ensure_ascii=False)}\n"
+            f"{task}\n{json.dumps(product_names, ensure_ascii=False)}")
+
+
+def _match_prompt(products: List[dict], product_names: List[str]) -> str:
+    if len(product_names) == 1:
+        task = "Find the product that matches the following search term:"
+    else:
+        task = ("For every one of the following search terms, find the product that matches it. Answer with one match "
+                "per search term, in the same order, and repeat the search term in search_term:")
+    return _products_prompt(products, task, product_names)
+
+
+def _alternative_prompt(products: List[dict], product_name: str) -> str:
+    return _products_prompt(products, "Find the product that is the cheapest of all and that fits to the following "
+                                      "product name. Low product price is very important!", [product_name])
+
+
+def _messages(prompt: str) -> List[dict]:
+    return [{"role": "user", "content": prompt}]
+
+
+def _sort_matches(product_names: List[str], matches: List[ProductMatch]) -> List[Product]:
+    """Return the match of every search term; the model may reorder them, but usually keeps the order."""
+    by_term = {_normalize(match.search_term): match for match in matches}
+    result = []
+    for index, product_name in enumerate(product_names):
+        match = by_term.get(_normalize(product_name))
+        if match is None:
+            if index >= len(matches):
+                raise ValueError(f"No match for search term {product_name!r}")
+            match = matches[index]
+        result.append(Product(**match.model_dump(exclude={"search_term"})))
+    return result
+
+
+def find_product_in_cart(cart: List[dict], product_name: str, client: Any = None) -> Product:
     """Searches for a specific product in a list of products by its name."""
+    key = (cart_fingerprint(cart), _normalize(product_name))
+    product = product_matches.get(key)
+    if product is None:
+        product = (client or get_client()).chat.completions.create(
+            messages=_messages(_match_prompt(cart, [product_name])),
+            response_model=Product,
+        )
+        product_matches.put(key, product)
+    return product
 
-    resp = client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"Here is a list of products: \n {cart} \n"
-                           f"Find the product that matches the following search term: {product_name}",
-            }
-        ],
-        response_model=Product,
-    )
-    return resp
 
+def find_cheapest_alternative(cart: List[dict], product_name: str, client: Any = None) -> AlternativeProduct:
+    """Find a cheap alternative product in a list of products by name."""
+    key = (cart_fingerprint(cart), _normalize(product_name))
+    alternative = alternative_matches.get(key)
+    if alternative is None:
+        alternative = (client or get_client()).chat.completions.create(
+            messages=_messages(_alternative_prompt(cart, product_name)),
+            response_model=AlternativeProduct,
+        )
+        alternative_matches.put(key, alternative)
+    return alternative
+
+
+async def find_products_in_cart_async(cart: List[dict], product_names: List[str], client: Any = None) -> List[Product]:
+    """Find the product of every search term in a list of products, with a single request for all uncached terms.
+
+    Returns:
+        The matching product of every search term, in order.
+    """
+    fingerprint = cart_fingerprint(cart)
+    found: Dict[str, Product] = {}
+    missing: List[str] = []
+    for product_name in product_names:
+        term = _normalize(product_name)
+        if term in found or term in missing:
+            continue
+        product = product_matches.get((fingerprint, term))
+        if product is None:
+            missing.append(term)
+        else:
+            found[term] = product
 
-def find_cheapest_alternative(cart: dict, product_name: str) -> Coroutine[Any, Any, AlternativeProduct | Any]:
+    if len(missing) == 1:
+        found[missing[0]] = await (client or get_async_client()).chat.completions.create(
+            messages=_messages(_match_prompt(cart, missing)),
+            response_model=Product,
+        )
+    elif missing:
+        response = await (client or get_async_client()).chat.completions.create(
+            messages=_messages(_match_prompt(cart, missing)),
+            response_model=ProductMatches,
+        )
+        found.update(zip(missing, _sort_matches(missing, response.matches)))
+    for term in missing:
+        product_matches.put((fingerprint, term), found[term])
+    return [found[_normalize(product_name)] for product_name in product_names]
+
+
+async def find_product_in_cart_async(cart: List[dict], product_name: str, client: Any = None) -> Product:
+    """Searches for a specific product in a list of products by its name."""
+    return (await find_products_in_cart_async(cart, [product_name], client))[0]
+
+
+async def find_cheapest_alternative_async(cart: List[dict], product_name: str,
+                                          client: Any = None) -> AlternativeProduct:
     """Find a cheap alternative product in a list of products by name."""
+    key = (cart_fingerprint(cart), _normalize(product_name))
+    alternative = alternative_matches.get(key)
+    if alternative is None:
+        alternative = await (client or get_async_client()).chat.completions.create(
+            messages=_messages(_alternative_prompt(cart, product_name)),
+            response_model=AlternativeProduct,
+        )
+        alternative_matches.put(key, alternative)
+    return alternative
 
-    resp = client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": f"Here is a list of products: \n {cart} \nFind the product that is the cheapest of all and "
-                           f"that fit to the following product name: {product_name} \n"
-                           f"Low product price is very important!",
-            }
-        ],
-        response_model=AlternativeProduct,
-    )
-    return resp
+
+class MatchBatcher:
+    """Coalesces concurrent match queries against the same cart into one request.
+
+    The first query against a cart opens a batch; queries against the same cart within the batch window join it, and
+    the batch is sent as one structured-output request once the window closes or it is full.
+
+    Args:
+        client: The asynchronous structured-output client, by default the Gemini one.
+        window: Seconds to wait for more queries after the first one of a batch.
+        max_batch_size: Number of search terms after which a batch is sent right away.
+    """
+
+    def __init__(self, client: Any = None, window: float = BATCH_WINDOW, max_batch_size: int = 16):
+        self.client = client
+        self.window = window
+        self.max_batch_size = max_batch_size
+        # Cart fingerprint -> the cart, the futures of its pending search terms and the timer that sends them.
+        self._pending: Dict[str, Tuple[List[dict], Dict[str, asyncio.Future], asyncio.TimerHandle]] = {}
+
+    async def match(self, cart: List[dict], product_name: str) -> Product:
+        """Return the product of a list of products that matches a search term."""
+        fingerprint = cart_fingerprint(cart)
+        term = _normalize(product_name)
+        cached = product_matches.get((fingerprint, term))
+        if cached is not None:
+            return cached
+        loop = asyncio.get_running_loop()
+        if fingerprint not in self._pending:
+            self._pending[fingerprint] = (cart, {}, loop.call_later(self.window, self._flush, fingerprint))
+        futures = self._pending[fingerprint][1]
+        if term not in futures:
+            futures[term] = loop.create_future()
+            if len(futures) >= self.max_batch_size:
+                self._flush(fingerprint)
+        return await asyncio.shield(futures[term])
+
+    def _flush(self, fingerprint: str) -> None:
+        cart, futures, timer = self._pending.pop(fingerprint)
+        timer.cancel()
+        asyncio.ensure_future(self._send(cart, futures))
+
+    async def _send(self, cart: List[dict], futures: Dict[str, asyncio.Future]) -> None:
+        terms = list(futures)
+        try:
+            products = await find_products_in_cart_async(cart, terms, self.client)
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for term, product in zip(terms, products):
+            if not futures[term].done():
+                futures[term].set_result(product)
@@ -0,0 +1,127 @@
+import array
+import functools
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Iterable, List, Protocol
+
+CHANNELS = 1
+SAMPLE_WIDTH = 2  # 16 bit PCM
+# Root mean square of 16 bit samples above which a chunk is taken to be speech rather than background noise.
+SPEECH_LEVEL = 500
+
+
+def is_speech(chunk: bytes, level: int = SPEECH_LEVEL) -> bool:
+    """Return whether a chunk of 16 bit PCM is loud enough to be speech, a rough check for voice activity."""
+    samples = array.array("h", chunk[:len(chunk) - len(chunk) % SAMPLE_WIDTH])
+    if not samples:
+        return False
+    return math.sqrt(sum(sample * sample for sample in samples) / len(samples)) >= level
+
+
+class InputStream(Protocol):
+    def read(self, num_frames: int, exception_on_overflow: bool = True) -> bytes: ...
+
+    def close(self) -> None: ...
+
+
+class OutputStream(Protocol):
+    def write(self, data: bytes) -> Any: ...
+
+    def close(self) -> None: ...
+
+
+class AudioBackend(Protocol):
+    def open_input(self, rate: int, frames_per_buffer: int) -> InputStream: ...
+
+    def open_output(self, rate: int) -> OutputStream: ...
+
+
+class PyAudioBackend:
+    """Microphone and speakers through PyAudio, which is only imported and initialized on first use."""
+
+    @functools.cached_property
+    def _pyaudio(self) -> Any:
+        import pyaudio
+        return pyaudio
+
+    @functools.cached_property
+    def _instance(self) -> Any:
+        return self._pyaudio.PyAudio()
+
+    def warm_up(self) -> None:
+        """Initialize PyAudio ahead of time, e.g. in a background thread during startup."""
+        self._instance
+
+    def open_input(self, rate: int, frames_per_buffer: int) -> InputStream:
+        mic_info = self._instance.get_default_input_device_info()
+        return self._instance.open(
+            format=self._pyaudio.paInt16,
+            channels=CHANNELS,
+            rate=rate,
+            input=True,
+            input_device_index=mic_info["index"],
+            frames_per_buffer=frames_per_buffer,
+        )
+
+    def open_output(self, rate: int) -> OutputStream:
+        return self._instance.open(format=self._pyaudio.paInt16, channels=CHANNELS, rate=rate, output=True)
+
+
+class _InMemoryInputStream:
+    def __init__(self, backend: "InMemoryAudioBackend"):
+        self._backend = backend
+
+    def read(self, num_frames: int, exception_on_overflow: bool = True) -> bytes:
+        return self._backend._next_input(num_frames)
+
+    def close(self) -> None:
+        pass
+
+
+class _InMemoryOutputStream:
+    def __init__(self, backend: "InMemoryAudioBackend"):
+        self._backend = backend
+
+    def write(self, data: bytes) -> None:
+        with self._backend._lock:
+            self._backend.played.append(bytes(data))
+
+    def close(self) -> None:
+        pass
+
+
+class InMemoryAudioBackend:
+    """Audio backend without devices, for tests and benchmarks.
+
+    The microphone returns the given chunks and then silence, paced like a real microphone; everything that is
+    played is collected in ``played``.
+    """
+
+    def __init__(self, chunks: Iterable[bytes] = (), realtime: bool = True):
+        self.realtime = realtime
+        self.played: List[bytes] = []
+        self._chunks: Deque[bytes] = deque(chunks)
+        self._lock = threading.Lock()
+        self._rate = 16000
+
+    def open_input(self, rate: int, frames_per_buffer: int) -> InputStream:
+        self._rate = rate
+        return _InMemoryInputStream(self)
+
+    def open_output(self, rate: int) -> OutputStream:
+        return _InMemoryOutputStream(self)
+
+    def feed(self, chunk: bytes) -> None:
+        """Queue audio that the microphone returns next."""
+        with self._lock:
+            self._chunks.append(chunk)
+
+    def _next_input(self, num_frames: int) -> bytes:
+        if self.realtime:
+            time.sleep(num_frames / self._rate)
+        with self._lock:
+            if self._chunks:
+                return self._chunks.popleft()
+        return bytes(num_frames * SAMPLE_WIDTH * CHANNELS)
@@ -0,0 +1,161 @@
+"""Cheapest-basket optimizer on large carts: gathering candidates, scoring and applying the plan.
+
+The cart is the largest cart of a recording made with PICNIC_RECORD_SESSION, or a synthetic cart. The stub server
+serves the cart products and, for every line, variants with other pack sizes and prices. Each stage is compared with
+its straightforward counterpart: searching the lines one by one, scoring every need and candidate in a Python loop and
+sending the cart changes one by one.
+
+Usage: python -m benchmarks.basket_benchmark [RECORDING] [--lines 300] [--variants 12] [--latency 0.02]
+"""
+import argparse
+import math
+import random
+import time
+from pathlib import Path
+from typing import Callable, Sequence, TypeVar
+
+from python_picnic_api.python_picnic_api import Cart, PicnicAPI, codec
+from python_picnic_api.python_picnic_api.session import PicnicAPISession
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from python_picnic_api.python_picnic_api.throttle import DEFAULT_BUDGETS, RequestThrottle
+from recording import load_recording
+from tools.basket_optimizer import MAX_OVERBUY, PACK, Candidate, Need, apply_basket_plan, candidates_from_search, \
+    needs_from_cart, parse_unit_quantity, plan_basket, select_candidates
+
+T = TypeVar("T")
+
+UNIT_QUANTITIES = ["250 gram", "500 gram", "1 kg", "330 ml", "1 liter", "6 x 330 ml", "6 stuks", "10 stuks"]
+PACK_FACTORS = [0.5, 1, 2, 3, 6]
+
+
+def recorded_cart(path: Path) -> list[dict]:
+    """Return the cart lines of the largest cart in a recording as name, price, unit quantity and count."""
+    largest: list[dict] = []
+    for event in load_recording(path):
+        if event["kind"] != "http" or not event["response"].startswith("{"):
+            continue
+        payload = codec.loads(event["response"])
+        if payload.get("type") == "ORDER" and len(payload.get("items", [])) > len(largest):
+            largest = [{"name": line.name, "price": line.price, "unit_quantity": line.unit_quantity,
+                        "count": line.count} for line in Cart.from_payload(payload)]
+    return largest
+
+
+def synthetic_cart(lines: int, rng: random.Random) -> list[dict]:
+    return [{"name": f"product {index}", "price": rng.randint(79, 999),
+             "unit_quantity": rng.choice(UNIT_QUANTITIES), "count": rng.randint(1, 3)} for index in range(lines)]
+
+
+def catalog(cart: list[dict], variants: int, rng: random.Random) -> tuple[dict[str, dict], dict[str, int]]:
+    """Return the products of the cart lines and their variants, and the count of every cart product."""
+    products: dict[str, dict] = {}
+    counts: dict[str, int] = {}
+    for index, line in enumerate(cart):
+        product_id = f"c{index}"
+        products[product_id] = {"name": line["name"], "price": line["price"], "unit_quantity": line["unit_quantity"]}
+        counts[product_id] = line["count"]
+        quantity = parse_unit_quantity(line["unit_quantity"])
+        for variant in range(variants if quantity else 0):
+            factor = rng.choice(PACK_FACTORS)
+            amount, unit = quantity  # type: ignore[misc]
+            unit_name = {"g": "gram", "ml": "ml", "piece": "stuks"}[unit]
+            products[f"v{index}-{variant}"] = {
+                "name": f"{line['name']} variant {variant}",
+                "price": max(1, round(line["price"] * factor * rng.uniform(0.7, 1.3))),
+                "unit_quantity": f"{amount * factor:g} {unit_name}",
+            }
+    return products, counts
+
+
+def select_reference(needs: Sequence[Need], candidates: Sequence[Sequence[Candidate]],
+                     max_overbuy: float = MAX_OVERBUY) -> list[tuple[int, int] | None]:
+    """select_candidates as a loop over every need and candidate."""
+    selections: list[tuple[int, int] | None] = []
+    for need, need_candidates in zip(needs, candidates):
+        best: tuple[float, int, int] | None = None
+        for column, candidate in enumerate(need_candidates):
+            if need.unit != PACK and candidate.unit != need.unit:
+                continue
+            amount = 1 if need.unit == PACK else candidate.amount
+            packs = max(math.ceil(need.amount / amount - 1e-9), 1)
+            overbuy = packs * amount / need.amount - 1
+            if overbuy > max_overbuy + 1e-9:
+                continue
+            score = packs * candidate.price + min(overbuy, 1) * 1e-3
+            if best is None or score < best[0]:
+                best = (score, column, packs)
+        selections.append(None if best is None else (best[1], best[2]))
+    return selections
+
+
+def timed(function: Callable[[], T]) -> tuple[T, float]:
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def best_of(function: Callable[[], object], repeat: int = 5) -> float:
+    return min(timed(function)[1] for _ in range(repeat))
+
+
+def unthrottled_client(stub: PicnicStubServer) -> PicnicAPI:
+    """A client of the stub without the rate budgets that protect Picnic, which would dominate every timing."""
+    client = stub.client()
+    budgets = {name: (1e6, 1_000_000) for name in DEFAULT_BUDGETS}
+    client.session = PicnicAPISession(auth_token=client.session.auth_token, throttle=RequestThrottle(budgets))
+    return client
+
+
+def fill_cart(client: PicnicAPI, counts: dict[str, int]) -> Cart:
+    client.clear_cart()
+    client.update_cart(counts, max_parallel=8)
+    return Cart.from_payload(client.get_cart())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", type=Path, nargs="?")
+    parser.add_argument("--lines", type=int, default=300, help="lines of the synthetic cart")
+    parser.add_argument("--variants", type=int, default=12, help="products per line besides the one in the cart")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the stub server needs per request")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cart_lines = recorded_cart(args.recording) if args.recording else synthetic_cart(args.lines, rng)
+    products, counts = catalog(cart_lines, args.variants, rng)
+    with PicnicStubServer(products=products, latency=args.latency) as stub:
+        client = unthrottled_client(stub)
+        needs = needs_from_cart(fill_cart(client, counts))
+        terms = [need.term for need in needs]
+        print(f"{len(cart_lines)} cart lines, {len(needs)} with a known unit quantity, {len(products)} products")
+
+        sequential_client = unthrottled_client(stub)
+        _, sequential = timed(lambda: [sequential_client.search(term) for term in terms])
+        results, concurrent = timed(lambda: unthrottled_client(stub).search_many(terms))
+        rate, burst = DEFAULT_BUDGETS["search"]
+        print(f"candidates: one by one {sequential:6.2f} s, search_many {concurrent:6.2f} s "
+              f"({sequential / concurrent:.1f}x); the search budget for Picnic allows it in "
+              f"{max(0.0, (len(terms) - burst) / rate):.0f} s at best")
+
+        candidates = [candidates_from_search(results[" ".join(term.lower().split())]["items"]) for term in terms]
+        assert select_candidates(needs, candidates) == select_reference(needs, candidates)
+        loop = best_of(lambda: select_reference(needs, candidates))
+        vectorized = best_of(lambda: select_candidates(needs, candidates))
+        print(f"scoring:    Python loop {loop * 1000:6.2f} ms, NumPy {vectorized * 1000:6.2f} ms "
+              f"({loop / vectorized:.1f}x)")
+
+        plan, planning = timed(lambda: plan_basket(client, needs))
+        print(f"plan:       {len(plan.replacements)} replacements saving {plan.saving / 100:.2f} Euro, planned in "
+              f"{planning:.2f} s")
+
+        changes = plan.cart_changes()
+        _, one_by_one = timed(lambda: [client._change_product(product_id, count)
+                                       for product_id, count in changes.items()])
+        fill_cart(client, counts)
+        _, batched = timed(lambda: apply_basket_plan(client, plan))
+        print(f"apply:      one by one {one_by_one:6.2f} s, batched {batched:6.2f} s ({one_by_one / batched:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Turn latency over a long conversation, with and without compaction of the context.
+
+A scripted Live session answers every prompt with a shopping turn: a tool call and a reply. It takes longer the more
+tokens its context holds, like the model, and every connect starts with an empty context. The conversation is run
+once with a context limit that is never reached, so that everything stays in the context, and once with the limit of
+ConversationState, which starts fresh, seeded sessions. The latency of the first and last tenth of the turns shows
+whether it stays flat.
+
+Usage: python -m benchmarks.conversation_benchmark [--turns 240] [--seconds-per-token 0.00002] [--token-limit 32000]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+
+from audio import InMemoryAudioBackend
+from conversation_state import CONTEXT_TOKEN_LIMIT, ConversationState
+from fake_live import ScriptedLiveSession, silence
+from picnic_agent import AudioLoop
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from tools.picnic_tools import ShopperSession, use_session
+
+PROMPTS_AND_CALLS = [
+    ("I need milk", "search_for_products", {"search_query": "milk"}),
+    ("Add the first one", "add_product_to_cart", {"product_id": "s1001"}),
+    ("What is in my cart?", "get_all_current_products_in_cart", {}),
+    ("Find me a pancake recipe", "search_for_recipes", {"search_query": "pancakes"}),
+    ("And butter", "search_for_products", {"search_query": "butter"}),
+    ("Add two of them", "add_product_to_cart", {"product_id": "s1003", "count": 2}),
+    ("Show my cart again", "get_all_current_products_in_cart", {}),
+    ("Remove the butter", "remove_product_from_cart", {"product_id": "s1003", "count": 2}),
+]
+
+
+def script(turns: int) -> tuple[list[str], list[list[dict]]]:
+    prompts = []
+    scripted_turns: list[list[dict]] = []
+    for index in range(turns):
+        prompt, name, args = PROMPTS_AND_CALLS[index % len(PROMPTS_AND_CALLS)]
+        prompts.append(prompt)
+        scripted_turns.append([
+            {"event": "tool_call", "function_calls": [{"name": name, "args": args, "id": f"call-{index}"}]},
+            {"event": "text", "text": f"Done, that was {name.replace('_', ' ')}. Is there anything else I can do?"}])
+    return prompts, scripted_turns
+
+
+async def converse(turns: int, seconds_per_token: float, conversation: ConversationState) -> list[float]:
+    """Run a conversation and return the latency of every turn."""
+    prompts, scripted_turns = script(turns)
+    scripted = ScriptedLiveSession(scripted_turns, seconds_per_context_token=seconds_per_token)
+    audio_loop = AudioLoop(audio=InMemoryAudioBackend(realtime=False), connect=scripted.connect, speak=silence,
+                           conversation=conversation)
+    audio_loop.session = scripted
+    audio_loop.audio_in_queue = asyncio.Queue()
+    task = asyncio.create_task(audio_loop.receive_audio())
+    latencies = []
+    for count, prompt in enumerate(prompts, start=1):
+        start = time.perf_counter()
+        await audio_loop.send_prompt(prompt)
+        await scripted.wait_for_turns(count)
+        latencies.append(time.perf_counter() - start)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return latencies
+
+
+def _summary(latencies: list[float]) -> str:
+    tenth = max(1, len(latencies) // 10)
+    return (f"first tenth {statistics.median(latencies[:tenth]) * 1000:6.0f} ms, "
+            f"last tenth {statistics.median(latencies[-tenth:]) * 1000:6.0f} ms, "
+            f"total {sum(latencies):6.1f} s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=240,
+                        help="turns of the conversation, e.g. one every 15 s for an hour")
+    parser.add_argument("--seconds-per-token", type=float, default=2e-5,
+                        help="seconds the scripted model needs per token in its context")
+    parser.add_argument("--token-limit", type=int, default=CONTEXT_TOKEN_LIMIT)
+    args = parser.parse_args()
+
+    with PicnicStubServer() as stub:
+        for label, token_limit in [("without compaction", 10 ** 12), ("with compaction", args.token_limit)]:
+            session = ShopperSession(picnic=stub.client())
+            use_session(session)
+            conversation = ConversationState(token_limit=token_limit)
+            # The agent prints responses and tool results, which are not of interest here.
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencies = asyncio.run(converse(args.turns, args.seconds_per_token, conversation))
+            session.close()
+            print(f"{label:>18}: {_summary(latencies)}, {conversation.rotations} fresh sessions, "
+                  f"{conversation.saved_tokens} tokens saved by compacted tool responses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Decoding and encoding speed of the installed JSON codecs over Picnic payloads.
+
+By default the payloads are a large search page, a recipe details page and a cart as served by the stub server.
+Recorded responses can be used instead by passing a directory of .json files.
+
+Usage: python -m benchmarks.json_codec_benchmark [--payloads DIR] [--repeat 20]
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from benchmarks.parsing_benchmark import search_page
+from python_picnic_api.python_picnic_api.codec import JsonCodec, available_codecs
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+
+
+def stub_payloads() -> dict[str, bytes]:
+    with PicnicStubServer() as stub:
+        client = stub.client()
+        for product_id in stub.products:
+            client.add_product(product_id, 2)
+        recipe_id = next(iter(stub.recipes))
+        recipe_page = client.session.get(f"{stub.url}/pages/recipe-details-page?recipe_id={recipe_id}").content
+        cart = client.session.get(f"{stub.url}/cart").content
+    return {"search page": search_page(2000), "recipe details": recipe_page, "cart": cart}
+
+
+def recorded_payloads(directory: Path) -> dict[str, bytes]:
+    return {path.name: path.read_bytes() for path in sorted(directory.glob("*.json"))}
+
+
+def _seconds_per_call(function: Callable[[Any], Any], argument: Any, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function(argument)
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def benchmark(codec: JsonCodec, content: bytes, repeat: int) -> tuple[float, float]:
+    """Return the seconds per decode and per encode of a payload."""
+    value = codec.loads(content)
+    return _seconds_per_call(codec.loads, content, repeat), _seconds_per_call(codec.dumps, value, repeat)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", type=Path, help="directory with recorded responses as .json files")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = recorded_payloads(args.payloads) if args.payloads else stub_payloads()
+    codecs = available_codecs()
+    for name, content in payloads.items():
+        print(f"{name} ({len(content) / 1024:.0f} KiB)")
+        baseline = None
+        for codec in codecs[::-1]:
+            decode, encode = benchmark(codec, content, args.repeat)
+            baseline = baseline or decode
+            print(f"  {codec.name:>8}: decode {decode * 1000:8.3f} ms ({len(content) / decode / 1e6:7.1f} MB/s, "
+                  f"{baseline / decode:4.1f}x json), encode {encode * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""How many concurrent shoppers one process can serve, with simulated shoppers against the stub server.
+
+Every shopper is a thread with its own tool session and Picnic client, which calls handle_picnic_tool_operations
+with a weighted mix of tool calls, like the model does in a conversation, and waits a random think time between
+them. The number of shoppers is swept; for every level the benchmark reports throughput, latency percentiles overall
+and per tool, and error rates. Before the sweep, the memory of a session is measured after a short conversation.
+
+The knee is the level with the highest power, i.e. throughput divided by p95 latency: beyond it, more shoppers mostly
+add latency instead of throughput.
+
+Usage: python -m benchmarks.load_benchmark [--levels 1 2 4 8 16 32 64] [--duration 10] [--think-time 0.5]
+"""
+import argparse
+import math
+import random
+import re
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable
+
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from tools.picnic_tools import ShopperSession, handle_picnic_tool_operations, use_session
+
+PRODUCT_QUERIES = ["milk", "butter", "eggs", "coffee", "bananas", "organic"]
+RECIPE_QUERIES = ["pancakes", "banana", "coffee"]
+
+# Relative frequency of the tools in a conversation.
+TOOL_MIX = {
+    "search_for_products": 25,
+    "search_shopping_list": 5,
+    "add_product_to_cart": 20,
+    "get_all_current_products_in_cart": 15,
+    "remove_product_from_cart": 8,
+    "search_for_recipes": 10,
+    "add_recipe_to_cart": 5,
+    "plan_meals": 2,
+    "search_for_cheaper_product_alternative": 5,
+    "replace_existing_product": 5,
+}
+
+# Picnic error codes that tools return instead of a confirmation, e.g. "PRODUCT_NOT_FOUND".
+ERROR_CODE_PATTERN = re.compile(r"^[A-Z][A-Z_]+$")
+
+
+def match_product(cart: list[dict], product_name: str) -> object:
+    """Stand-in for the Gemini product matcher: the first cart product whose name contains the product name."""
+    for product in cart:
+        if product_name.lower() in str(product.get("name", "")).lower():
+            return _MatchedProduct(str(product["name"]))
+    return _MatchedProduct(product_name)
+
+
+@dataclass
+class _MatchedProduct:
+    short_product_name_version: str
+
+
+def think_time_sampler(distribution: str, mean: float) -> Callable[[random.Random], float]:
+    """Return a function that draws think times in seconds with the given distribution and mean."""
+    if mean <= 0 or distribution == "fixed":
+        return lambda rng: mean
+    if distribution == "exponential":
+        return lambda rng: rng.expovariate(1 / mean)
+    if distribution == "lognormal":
+        # Most pauses are short, a few are long; sigma 1 and mu chosen so that the mean is the given one.
+        sigma = 1.0
+        mu = math.log(mean) - sigma ** 2 / 2
+        return lambda rng: rng.lognormvariate(mu, sigma)
+    raise ValueError(f"Unknown think time distribution: {distribution}")
+
+
+class Shopper:
+    """Draws tool calls with arguments that fit what the shopper saw before, like product ids of search results."""
+
+    def __init__(self, stub: PicnicStubServer, rng: random.Random):
+        self.rng = rng
+        self.product_ids = list(stub.products)
+        self.recipe_ids = list(stub.recipes)
+        self._tools = list(TOOL_MIX)
+        self._weights = list(TOOL_MIX.values())
+        self._calls = 0
+
+    def next_call(self) -> tuple[str, dict]:
+        name = self.rng.choices(self._tools, self._weights)[0]
+        return name, self.arguments(name)
+
+    def arguments(self, name: str) -> dict:
+        rng = self.rng
+        if name == "search_for_products":
+            return {"search_query": rng.choice(PRODUCT_QUERIES)}
+        if name == "search_shopping_list":
+            return {"items": rng.sample(PRODUCT_QUERIES, rng.randint(2, 5))}
+        if name in ("add_product_to_cart", "remove_product_from_cart"):
+            return {"product_id": rng.choice(self.product_ids), "count": rng.randint(1, 2)}
+        if name == "search_for_recipes":
+            return {"search_query": rng.choice(RECIPE_QUERIES)}
+        if name == "add_recipe_to_cart":
+            return {"recipe_id": rng.choice(self.recipe_ids)}
+        if name == "plan_meals":
+            return {"recipe_ids": rng.sample(self.recipe_ids, min(2, len(self.recipe_ids)))}
+        if name == "search_for_cheaper_product_alternative":
+            return {"product_name": rng.choice(PRODUCT_QUERIES)}
+        if name == "replace_existing_product":
+            old, new = rng.sample(self.product_ids, 2)
+            return {"old_product_id": old, "new_product_id": new}
+        return {}
+
+    def call(self, name: str, args: dict) -> bool:
+        """Make a tool call and return whether it succeeded."""
+        self._calls += 1
+        try:
+            response = handle_picnic_tool_operations(name, args, f"call-{self._calls}")
+        except Exception:
+            return False
+        result = response["response"]["result"]
+        picnic_response = result.get("picnic_response")
+        if isinstance(picnic_response, str) and ERROR_CODE_PATTERN.match(picnic_response):
+            return False
+        return not result.get("failed_cart_updates")
+
+
+@dataclass
+class LevelResult:
+    shoppers: int
+    duration: float
+    # Tool -> latencies in seconds and number of failed calls.
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+    @property
+    def calls(self) -> int:
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    @property
+    def throughput(self) -> float:
+        return self.calls / self.duration
+
+    @property
+    def all_latencies(self) -> list[float]:
+        return [latency for latencies in self.latencies.values() for latency in latencies]
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.errors.values()) / self.calls if self.calls else 0.0
+
+    @property
+    def power(self) -> float:
+        latencies = self.all_latencies
+        return self.throughput / percentile(latencies, 0.95) if latencies else 0.0
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _new_session(stub: PicnicStubServer, index: int) -> ShopperSession:
+    return ShopperSession(picnic=stub.client(auth_token=f"shopper-{index}"), product_matcher=match_product)
+
+
+def run_level(stub: PicnicStubServer, shoppers: int, duration: float, think_time: Callable[[random.Random], float],
+              seed: int = 0) -> LevelResult:
+    """Run the given number of shoppers for the given number of seconds."""
+    result = LevelResult(shoppers, duration)
+    lock = threading.Lock()
+    stop = threading.Event()
+    start = threading.Barrier(shoppers + 1)
+    sessions = [_new_session(stub, index) for index in range(shoppers)]
+
+    def shop(index: int) -> None:
+        use_session(sessions[index])
+        rng = random.Random(seed * 1_000_003 + index)
+        shopper = Shopper(stub, rng)
+        start.wait()
+        # Shoppers do not all start at the same moment.
+        stop.wait(rng.uniform(0, think_time(rng)))
+        while not stop.is_set():
+            name, args = shopper.next_call()
+            call_start = time.perf_counter()
+            succeeded = shopper.call(name, args)
+            latency = time.perf_counter() - call_start
+            with lock:
+                if not stop.is_set():
+                    result.latencies[name].append(latency)
+                    if not succeeded:
+                        result.errors[name] += 1
+            stop.wait(think_time(rng))
+
+    threads = [threading.Thread(target=shop, args=(index,), daemon=True) for index in range(shoppers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    for session in sessions:
+        session.close()
+    stub.requests.clear()
+    return result
+
+
+def memory_per_session(stub: PicnicStubServer, sessions: int = 20) -> float:
+    """Bytes that a session holds after a short conversation: a search, adding products, a cart read and recipes."""
+    conversation: list[tuple[str, dict]] = [
+        ("search_for_products", {"search_query": "milk"}),
+        ("add_product_to_cart", {"product_id": "s1001"}),
+        ("search_for_products", {"search_query": "butter"}),
+        ("add_product_to_cart", {"product_id": "s1003", "count": 2}),
+        ("get_all_current_products_in_cart", {}),
+        ("search_for_recipes", {"search_query": "pancakes"}),
+    ]
+    # Warm up imports and module level caches, so that only the sessions are measured.
+    _converse(_new_session(stub, -1), stub, conversation)
+    held = []
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for index in range(sessions):
+        session = _new_session(stub, 10_000 + index)
+        _converse(session, stub, conversation)
+        held.append(session)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    for session in held:
+        session.close()
+    stub.requests.clear()
+    return (after - before) / sessions
+
+
+def _converse(session: ShopperSession, stub: PicnicStubServer, conversation: list[tuple[str, dict]]) -> None:
+    def run() -> None:
+        use_session(session)
+        shopper = Shopper(stub, random.Random(0))
+        for name, args in conversation:
+            shopper.call(name, args)
+        # Wait for the prefetches, whose results are part of what a session holds.
+        time.sleep(0.05)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+
+def _format_latencies(latencies: list[float]) -> str:
+    return (f"p50 {statistics.median(latencies) * 1000:7.1f} ms, p95 {percentile(latencies, 0.95) * 1000:7.1f} ms, "
+            f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms")
+
+
+def report(result: LevelResult, per_tool: bool) -> None:
+    latencies = result.all_latencies
+    if not latencies:
+        print(f"{result.shoppers:4d} shoppers: no calls")
+        return
+    print(f"{result.shoppers:4d} shoppers: {result.throughput:7.1f} calls/s, {_format_latencies(latencies)}, "
+          f"errors {result.error_rate:6.2%}")
+    if per_tool:
+        for name in TOOL_MIX:
+            if tool_latencies := result.latencies.get(name):
+                errors = result.errors.get(name, 0) / len(tool_latencies)
+                print(f"      {name:>38}: {len(tool_latencies):6d} calls, {_format_latencies(tool_latencies)}, "
+                      f"errors {errors:6.2%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64],
+                        help="numbers of concurrent shoppers to sweep")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean seconds between the calls of a shopper")
+    parser.add_argument("--think-distribution", choices=["exponential", "lognormal", "fixed"], default="exponential")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the stub server needs per request")
+    parser.add_argument("--jitter", type=float, default=0.01, help="maximum seconds added to the stub latency")
+    parser.add_argument("--per-tool", action="store_true", help="report the latencies of every tool at every level")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    think_time = think_time_sampler(args.think_distribution, args.think_time)
+    with PicnicStubServer(latency=args.latency, jitter=args.jitter) as stub:
+        print(f"memory per session: {memory_per_session(stub) / 1024:.1f} KiB")
+        results = []
+        for shoppers in args.levels:
+            result = run_level(stub, shoppers, args.duration, think_time, seed=args.seed)
+            report(result, args.per_tool)
+            results.append(result)
+
+    knee = max(results, key=lambda result: result.power)
+    print(f"knee: {knee.shoppers} shoppers, {knee.throughput:.1f} calls/s")
+    report(knee, per_tool=True)
+
+
+if __name__ == "__main__":
+    main()
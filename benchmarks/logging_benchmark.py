@@ -0,0 +1,70 @@
+"""Time the receive loop spends on logging the function responses of a turn.
+
+The responses hold a large shopping cart. They are logged once like AudioLoop did before, pretty-printed with pprint
+straight to the stream, and through structured_logging: at a disabled level, and enabled with the background
+writer. Only the time in the calling thread is measured; the stream is a file, as stdout is when it is redirected.
+
+Usage: python -m benchmarks.logging_benchmark [--turns 200] [--cart-lines 200]
+"""
+import argparse
+import logging
+import os
+import statistics
+import time
+from pprint import pprint
+from typing import Callable
+
+from structured_logging import configure_logging, log_event, log_stats
+
+logger = logging.getLogger("benchmarks.logging")
+
+
+def function_responses(cart_lines: int) -> list[dict]:
+    cart = [{"product_id": f"s{1000 + index}", "product_name": f"Product number {index} with a long name",
+             "price": 100 + index, "count": 1 + index % 3} for index in range(cart_lines)]
+    return [{"name": "get_all_current_products_in_cart", "response": {"result": {"picnic_response": cart}},
+             "id": "call-1"}]
+
+
+def _measure(log: Callable[[list[dict]], object], turns: int, responses: list[dict]) -> list[float]:
+    latencies = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        log(responses)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _summary(latencies: list[float]) -> str:
+    quantiles = statistics.quantiles(latencies, n=100)
+    return f"median {statistics.median(latencies) * 1e6:8.1f} µs, p99 {quantiles[98] * 1e6:8.1f} µs"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--cart-lines", type=int, default=200)
+    args = parser.parse_args()
+    responses = function_responses(args.cart_lines)
+
+    with open(os.devnull, "w") as sink:
+        pretty_printed = _measure(lambda value: pprint(value, stream=sink, width=180, indent=2, compact=False),
+                                  args.turns, responses)
+        print(f"{'pprint':>22}: {_summary(pretty_printed)}")
+
+        writer = configure_logging(level=logging.INFO, stream=sink)
+        try:
+            disabled = _measure(lambda value: log_event(logger, logging.DEBUG, "tool_responses", responses=value),
+                                args.turns, responses)
+            print(f"{'structured, disabled':>22}: {_summary(disabled)}")
+            enabled = _measure(lambda value: log_event(logger, logging.INFO, "tool_responses", responses=value),
+                               args.turns, responses)
+            print(f"{'structured, enabled':>22}: {_summary(enabled)}")
+        finally:
+            writer.stop()
+        stats = log_stats()
+        print(f"{stats.written} events written, {stats.dropped} dropped, {stats.truncated_fields} fields truncated")
+
+
+if __name__ == "__main__":
+    main()
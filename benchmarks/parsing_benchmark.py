@@ -0,0 +1,106 @@
+"""Event-loop latency while search pages are parsed, with parsing inline and in worker processes.
+
+An asyncio loop ticks every few milliseconds, like the audio loop of a conversation, while other conversations
+parse large search pages in threads. The lateness of the ticks shows how much the parsing stalls the loop.
+
+Usage: python -m benchmarks.parsing_benchmark [--seconds 5] [--parsers 4] [--tiles 2000] [--workers 2]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from functools import partial
+
+from python_picnic_api.python_picnic_api.parsing import Parser, ParsingExecutor, parse_search_results
+
+TICK_SECONDS = 0.005
+
+
+def search_page(tiles: int) -> bytes:
+    """A search page with the nesting of Picnic's search pages, where every tile is wrapped in a few containers."""
+    def tile(index: int) -> dict:
+        node: dict = {
+            "id": f"selling-unit-s{index}-tile",
+            "content": {
+                "type": "SELLING_UNIT_TILE",
+                "sellingUnit": {"id": f"s{index}", "name": f"Product {index}", "display_price": index,
+                                "unit_quantity": "1 kg", "decorators": [{"type": "LABEL", "text": "Bio"}] * 3},
+            },
+            "children": [],
+            "analytics": {"contexts": [{"data": {"sole_article_id": f"s{index}"}}]},
+        }
+        for depth in range(4):
+            node = {"id": f"container-{index}-{depth}", "content": {"type": "BLOCK"}, "children": [node]}
+        return node
+
+    page = {"body": {"child": {"id": "search-results", "children": [tile(index) for index in range(tiles)]}}}
+    return json.dumps(page).encode("utf-8")
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def _measure(
+        content: bytes, parse: Parser, executor: ParsingExecutor | None, parsers: int, seconds: float
+) -> dict:
+    stop = threading.Event()
+    parsed = 0
+    lock = threading.Lock()
+
+    def parse_continuously() -> None:
+        nonlocal parsed
+        while not stop.is_set():
+            if executor is None:
+                parse(content)
+            else:
+                executor.parse(parse, content)
+            with lock:
+                parsed += 1
+
+    threads = [asyncio.create_task(asyncio.to_thread(parse_continuously)) for _ in range(parsers)]
+    lags = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append(time.perf_counter() - start - TICK_SECONDS)
+    stop.set()
+    await asyncio.gather(*threads)
+    return {
+        "lag_p50_ms": statistics.median(lags) * 1000,
+        "lag_p99_ms": _percentile(lags, 0.99) * 1000,
+        "lag_max_ms": max(lags) * 1000,
+        "parses_per_second": parsed / seconds,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--parsers", type=int, default=4, help="number of threads that parse at the same time")
+    parser.add_argument("--tiles", type=int, default=2000, help="number of product tiles on the search page")
+    parser.add_argument("--workers", type=int, default=2, help="number of worker processes")
+    args = parser.parse_args()
+
+    content = search_page(args.tiles)
+    # All tiles are extracted, so that the parsing cost grows with the page.
+    parse = partial(parse_search_results, max_items=args.tiles)
+    print(f"search page: {len(content) / 1024:.0f} KiB, {args.parsers} parsing threads")
+    executor = ParsingExecutor(max_workers=args.workers)
+    # Start the workers before measuring.
+    for _ in range(args.workers):
+        executor.parse(parse, content)
+    try:
+        for name, mode in (("inline", None), (f"{args.workers} workers", executor)):
+            result = asyncio.run(_measure(content, parse, mode, args.parsers, args.seconds))
+            print(f"{name:>10}: loop lag p50 {result['lag_p50_ms']:.2f} ms, p99 {result['lag_p99_ms']:.2f} ms, "
+                  f"max {result['lag_max_ms']:.2f} ms, {result['parses_per_second']:.1f} parses/s")
+    finally:
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Re-buying a past order: one batched reorder_list compared with searching and adding the products one by one.
+
+The stub serves a list of previously bought products that names them by id and count only, like a past order.
+Product by product, the agent reads the list, then searches every product and adds it, each after the previous one.
+The batched reorder reads the list once, resolves the products to their cached articles and adds all of them
+concurrently. Both exclude the model turns that every product by product tool call would take in addition.
+
+Usage: python -m benchmarks.reorder_benchmark [--products 40] [--latency 0.02]
+"""
+import argparse
+import time
+
+from python_picnic_api.python_picnic_api.client import PicnicAPI
+from python_picnic_api.python_picnic_api.session import PicnicAPISession
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from python_picnic_api.python_picnic_api.throttle import DEFAULT_BUDGETS, RequestThrottle
+
+
+def client(stub: PicnicStubServer) -> PicnicAPI:
+    api = stub.client()
+    # Without the rate budgets that protect Picnic, which would dominate every timing.
+    budgets = {name: (1e6, 1_000_000) for name in DEFAULT_BUDGETS}
+    api.session = PicnicAPISession(auth_token=api.session.auth_token, throttle=RequestThrottle(budgets))
+    return api
+
+
+def one_by_one(stub: PicnicStubServer) -> float:
+    api = client(stub)
+    start = time.perf_counter()
+    entries = api.get_sublist("purchases", "last-order")
+    for entry in entries:
+        api.search(stub.products[entry["id"]]["name"])
+        api.add_product(entry["id"], entry["decorators"][0]["quantity"])
+    return time.perf_counter() - start
+
+
+def batched(stub: PicnicStubServer) -> tuple[float, dict]:
+    api = client(stub)
+    start = time.perf_counter()
+    result = api.reorder_list("purchases", "last-order")
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=40, help="products in the past order")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the stub takes per request")
+    args = parser.parse_args()
+
+    products = {f"p{index}": {"name": f"product {index}", "price": 100 + index} for index in range(args.products)}
+    lists = [{"id": "purchases", "name": "Previously bought", "items": [
+        {"id": "last-order", "name": "Last order", "products": {product_id: 1 + index % 3 for index, product_id
+                                                                in enumerate(products)}}]}]
+    with PicnicStubServer(products=products, lists=lists, latency=args.latency) as stub:
+        sequential = one_by_one(stub)
+        stub.requests.clear()
+        seconds, result = batched(stub)
+        requests = len(stub.requests)
+
+    failed = sum(1 for item in result["items"] if item["error"])
+    print(f"{'one by one':>12}: {sequential * 1000:8.1f} ms, {1 + 2 * args.products} requests, "
+          f"{2 * args.products} tool calls")
+    print(f"{'batched':>12}: {seconds * 1000:8.1f} ms, {requests} requests, 1 tool call, {failed} failed")
+    print(f"{'estimate':>12}: {result['sequential_seconds'] * 1000:8.1f} ms one by one without searches, "
+          f"{(result['sequential_seconds'] - result['seconds']) * 1000:.1f} ms saved")
+
+
+if __name__ == "__main__":
+    main()
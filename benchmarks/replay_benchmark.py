@@ -0,0 +1,117 @@
+"""End-to-end turn latency of the agent, replayed offline from a recorded session.
+
+Record a real session with PICNIC_RECORD_SESSION=session.jsonl.gz uv run python picnic_agent.py and replay it
+with this benchmark. Without a recording, a demo session is recorded first, with a scripted Live session against
+the stub server. Replayed turns include the real tool handling of the agent; Gemini and Picnic answer with their
+recorded timing divided by the speed.
+
+Usage: python -m benchmarks.replay_benchmark [RECORDING] [--speed 1]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import tempfile
+from pathlib import Path
+
+from audio import InMemoryAudioBackend
+from fake_live import ScriptedLiveSession, silence
+from picnic_agent import AudioLoop
+from python_picnic_api.python_picnic_api import PicnicAPI
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from recording import RecordingHTTPAdapter, ReplayHTTPAdapter, ReplayLiveSession, SessionRecorder, \
+    install_http_adapter, load_recording, recording_connect, replay_session
+from tools.picnic_tools import use_picnic
+
+RECIPE_ID = "665d879b27b9fb2099389e95"
+
+DEMO_PROMPTS = ["I need milk", "Add the first one", "What is in my cart?", "Find me a pancake recipe",
+                "Add the pancakes"]
+DEMO_TURNS: list[list[dict]] = [
+    [{"event": "tool_call", "function_calls": [
+        {"name": "search_for_products", "args": {"search_query": "milk"}, "id": "call-1"}]},
+     {"event": "text", "text": "I found milk and organic milk."}],
+    [{"event": "tool_call", "function_calls": [
+        {"name": "add_product_to_cart", "args": {"product_id": "s1001"}, "id": "call-2"}]},
+     {"event": "text", "text": "I added the milk."}],
+    [{"event": "tool_call", "function_calls": [
+        {"name": "get_all_current_products_in_cart", "args": {}, "id": "call-3"}]},
+     {"event": "text", "text": "Your cart contains milk."}],
+    [{"event": "tool_call", "function_calls": [
+        {"name": "search_for_recipes", "args": {"search_query": "pancakes"}, "id": "call-4"}]},
+     {"event": "text", "text": "I found pancakes."}],
+    [{"event": "tool_call", "function_calls": [
+        {"name": "add_recipe_to_cart", "args": {"recipe_id": RECIPE_ID}, "id": "call-5"}]},
+     {"event": "text", "text": "The pancakes are in your cart."}],
+]
+
+
+async def record_demo(path: Path, model_latency: float = 0.3, picnic_latency: float = 0.05) -> None:
+    """Record a scripted session against the stub server."""
+    with PicnicStubServer(latency=picnic_latency) as stub, SessionRecorder(path) as recorder:
+        client = stub.client()
+        install_http_adapter(client.session, RecordingHTTPAdapter(recorder))
+        use_picnic(client)
+        scripted = ScriptedLiveSession(DEMO_TURNS, latency=model_latency)
+        audio_loop = AudioLoop(audio=InMemoryAudioBackend(realtime=False), speak=silence)
+        async with recording_connect(scripted.connect, recorder)() as session:
+            audio_loop.session = session
+            audio_loop.audio_in_queue = asyncio.Queue()
+            tasks = [asyncio.create_task(audio_loop.receive_audio()), asyncio.create_task(audio_loop.play_audio())]
+            for count, prompt in enumerate(DEMO_PROMPTS, start=1):
+                await session.send(prompt, end_of_turn=True)
+                await scripted.wait_for_turns(count)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def recorded_turn_latencies(events: list[dict]) -> list[float]:
+    latencies = []
+    started_at = events[0]["t"] if events else 0.0
+    for event in events:
+        if event["kind"] == "sent" and event["input"] == "text" and event.get("end_of_turn"):
+            started_at = event["t"]
+        elif event["kind"] == "received" and event["event"] == "turn_complete":
+            latencies.append(event["t"] - started_at)
+    return latencies
+
+
+async def replay(events: list[dict], speed: float) -> list[float]:
+    client = PicnicAPI(auth_token="replay")
+    install_http_adapter(client.session, ReplayHTTPAdapter(events, speed=speed))
+    use_picnic(client)
+    session = ReplayLiveSession(events, speed=speed)
+    await replay_session(AudioLoop(audio=InMemoryAudioBackend(realtime=False), speak=silence), session)
+    return session.turn_latencies
+
+
+def _summary(latencies: list[float]) -> str:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (f"{len(latencies)} turns, p50 {statistics.median(latencies) * 1000:.0f} ms, "
+            f"p95 {p95 * 1000:.0f} ms, max {ordered[-1] * 1000:.0f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", type=Path, nargs="?")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay this many times faster than recorded")
+    args = parser.parse_args()
+
+    # The agent prints responses and tool results, which are not of interest here.
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        path = args.recording
+        if path is None:
+            path = Path(directory) / "demo.jsonl"
+            asyncio.run(record_demo(path))
+        events = load_recording(path)
+        latencies = asyncio.run(replay(events, args.speed))
+
+    print(f"recorded: {_summary(recorded_turn_latencies(events))}")
+    print(f"replayed at {args.speed:g}x: {_summary(latencies)}")
+
+
+if __name__ == "__main__":
+    main()
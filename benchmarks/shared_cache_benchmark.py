@@ -0,0 +1,77 @@
+"""Upstream requests and lookup latency of several worker processes, with caches per process and a shared cache.
+
+A load balancer spreads the turns of every shopper over all worker processes, so every worker sees the searches of
+every shopper. With caches per process, each worker fetches every search once; with the SQLite cache shared by the
+workers, a search of a shopper is fetched by the first worker that needs it and read from the cache by the others.
+The stub answers with a delay like Picnic, and counts the requests that reach it.
+
+Usage: python -m benchmarks.shared_cache_benchmark [--workers 4] [--shoppers 8] [--searches 20] [--latency 0.05]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from python_picnic_api.python_picnic_api.client import PicnicAPI
+from python_picnic_api.python_picnic_api.session import PicnicAPISession
+from python_picnic_api.python_picnic_api.shared_cache import SharedCacheStore
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from python_picnic_api.python_picnic_api.throttle import DEFAULT_BUDGETS, RequestThrottle
+
+TERMS = ["milk", "organic milk", "butter", "eggs", "coffee", "coffee beans", "bananas", "oat milk", "cheese", "bread",
+         "apples", "yoghurt", "pasta", "rice", "tomatoes", "onions", "chicken", "tea", "juice", "water"]
+
+
+def serve_turns(url: str, store_path: str | None, worker: int, shoppers: int, searches: int) -> list[float]:
+    """Run the searches of every shopper in a worker process, in a random order, and return their latencies."""
+    store = SharedCacheStore(store_path) if store_path else None
+    budgets = {name: (1e6, 1_000_000) for name in DEFAULT_BUDGETS}
+    clients = []
+    for shopper in range(shoppers):
+        auth_token = f"shopper-{shopper}"
+        client = PicnicAPI(auth_token=auth_token, cache_store=store, base_url=url)
+        # Without the rate budgets that protect Picnic, which would dominate every timing.
+        client.session = PicnicAPISession(auth_token=auth_token, throttle=RequestThrottle(budgets))
+        clients.append(client)
+    turns = [(client, term) for client in clients for term in (TERMS * searches)[:searches]]
+    random.Random(worker).shuffle(turns)
+
+    latencies = []
+    for client, term in turns:
+        start = time.perf_counter()
+        client.search(term)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run(stub: PicnicStubServer, store_path: str | None, workers: int, shoppers: int, searches: int) -> str:
+    stub.requests.clear()
+    start = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        results = pool.starmap(serve_turns, [(stub.url, store_path, worker, shoppers, searches)
+                                             for worker in range(workers)])
+    elapsed = time.perf_counter() - start
+    latencies = [latency for result in results for latency in result]
+    return (f"{len(stub.requests):5d} upstream requests, lookup mean {statistics.mean(latencies) * 1000:6.2f} ms, "
+            f"p50 {statistics.median(latencies) * 1000:6.2f} ms, {elapsed:5.1f} s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--shoppers", type=int, default=8)
+    parser.add_argument("--searches", type=int, default=20, help="distinct searches per shopper")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the stub takes per request")
+    args = parser.parse_args()
+
+    with PicnicStubServer(latency=args.latency) as stub, tempfile.TemporaryDirectory() as directory:
+        print(f"{'caches per process':>20}: {run(stub, None, args.workers, args.shoppers, args.searches)}")
+        store_path = os.path.join(directory, "cache.sqlite")
+        print(f"{'shared cache':>20}: {run(stub, store_path, args.workers, args.shoppers, args.searches)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Startup benchmark of the agent: import time of picnic_agent and time until the first prompt is shown.
+
+The Live session is replaced by a fake one and audio by the in-memory backend, so only the agent's own startup
+is measured. Exits with status 1 if the median of a metric exceeds its budget (or the baseline times the
+tolerance), which makes it usable as a regression gate in CI.
+
+Usage: python -m benchmarks.startup_benchmark [--runs 5] [--baseline FILE [--write-baseline]]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Budgets in seconds that the medians must stay within if no baseline is given.
+DEFAULT_BUDGETS = {"import_seconds": 0.5, "first_prompt_seconds": 1.0}
+
+
+class _IdleLiveSession:
+    async def send(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    async def receive(self) -> AsyncIterator[Any]:
+        await asyncio.Event().wait()
+        yield None
+
+
+@asynccontextmanager
+async def _connect_idle_session() -> AsyncIterator[_IdleLiveSession]:
+    yield _IdleLiveSession()
+
+
+def _measure_once() -> dict:
+    """Measure a single startup in this (fresh) process."""
+    start = time.perf_counter()
+    import picnic_agent
+    from audio import InMemoryAudioBackend
+    import_seconds = time.perf_counter() - start
+
+    audio_loop = picnic_agent.AudioLoop(audio=InMemoryAudioBackend(), connect=_connect_idle_session)
+
+    async def run_until_ready() -> None:
+        asyncio.create_task(audio_loop.run())
+        await audio_loop.ready.wait()
+
+    asyncio.run(run_until_ready())
+    return {"import_seconds": import_seconds, "first_prompt_seconds": time.perf_counter() - start}
+
+
+def _measure(runs: int) -> dict:
+    env = dict(os.environ, PICNIC_USERNAME="", PICNIC_PASSWORD="")
+    samples: dict[str, list[float]] = {name: [] for name in DEFAULT_BUDGETS}
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup_benchmark", "--child"],
+            cwd=REPO_ROOT, env=env, stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        for name in samples:
+            samples[name].append(result[name])
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline", type=Path, help="JSON file with the medians of a previous run")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown relative to the baseline")
+    parser.add_argument("--write-baseline", action="store_true", help="store the measured medians as baseline")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_measure_once()), flush=True)
+        # The prompt thread is blocked on input(), so do not wait for it to finish.
+        os._exit(0)
+
+    medians = _measure(args.runs)
+    if args.write_baseline and args.baseline:
+        args.baseline.write_text(json.dumps(medians, indent=2) + "\n")
+
+    if args.baseline and args.baseline.exists() and not args.write_baseline:
+        baseline = json.loads(args.baseline.read_text())
+        limits = {name: baseline[name] * args.tolerance for name in medians}
+    else:
+        limits = DEFAULT_BUDGETS
+
+    failed = False
+    for name, value in medians.items():
+        ok = value <= limits[name]
+        failed = failed or not ok
+        print(f"{name}: {value * 1000:.1f} ms (limit {limits[name] * 1000:.1f} ms) {'OK' if ok else 'REGRESSION'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
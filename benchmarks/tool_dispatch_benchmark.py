@@ -0,0 +1,129 @@
+"""Overhead of dispatching a tool call, from the name and arguments the model sent to the call of the tool function.
+
+The tools are replaced by functions that return right away, so that only the dispatch is measured: once like
+handle_picnic_tool_operations did before the tool registry, with closures and an operations dict built per call
+and ad hoc casts, and through the registry with its compiled argument converters, with and without its counters.
+
+Usage: python -m benchmarks.tool_dispatch_benchmark [--calls 200000]
+"""
+import argparse
+import time
+from typing import Callable
+
+from tools.registry import ToolRegistry
+
+CALLS: list[tuple[str, dict]] = [
+    ("search_for_products", {"search_query": "milk"}),
+    ("add_product_to_cart", {"product_id": "s1001", "count": 2.0}),
+    ("get_all_current_products_in_cart", {}),
+    ("search_for_recipes", {"search_query": "pancakes", "max_item_return_count": 3.0}),
+    ("plan_meals", {"recipe_ids": ["665d879b27b9fb2099389e95", "665d879b27b9fb2099389e96"], "portions": 2.0}),
+    ("replace_existing_product", {"old_product_id": "s1001", "new_product_id": "s1002"}),
+]
+
+
+def search_for_products(search_query: str, max_item_return_count: int = 3) -> dict:
+    return {}
+
+
+def add_product_to_cart(product_id: str, count: int = 1) -> dict:
+    return {}
+
+
+def get_all_current_products_in_cart() -> dict:
+    return {}
+
+
+def search_for_recipes(search_query: str, max_item_return_count: int = 3, offset: int = 0) -> dict:
+    return {}
+
+
+def plan_meals(recipe_ids: list[str], portions: int | None = None) -> dict:
+    return {}
+
+
+def replace_existing_product(old_product_id: str, new_product_id: str) -> dict:
+    return {}
+
+
+def dispatch_with_closures(name: str, args: dict) -> dict:
+    """The dispatch of handle_picnic_tool_operations before the registry."""
+    def handle_product_search() -> dict:
+        search_query = args["search_query"]
+        return search_for_products(search_query)
+
+    def handle_recipe_search() -> dict:
+        search_query = args["search_query"]
+        return search_for_recipes(search_query, args.get("max_item_return_count", 3), args.get("offset", 0))
+
+    def handle_plan_meals() -> dict:
+        return plan_meals(list(args["recipe_ids"]), args.get("portions"))
+
+    def handle_add_product() -> dict:
+        product_id = args["product_id"]
+        count = args.get("count", 1)
+        return add_product_to_cart(str(product_id), int(count))
+
+    def handle_get_products() -> dict:
+        return get_all_current_products_in_cart()
+
+    def handle_replace_product() -> dict:
+        return replace_existing_product(str(args["old_product_id"]), str(args["new_product_id"]))
+
+    operations = {
+        "search_for_products": handle_product_search,
+        "search_for_recipes": handle_recipe_search,
+        "plan_meals": handle_plan_meals,
+        "add_product_to_cart": handle_add_product,
+        "get_all_current_products_in_cart": handle_get_products,
+        "replace_existing_product": handle_replace_product,
+    }
+    if name in operations:
+        return operations[name]()
+    raise ValueError(f"Unknown operation: {name}")
+
+
+def build_registry() -> ToolRegistry:
+    registry = ToolRegistry()
+    for function in [search_for_products, add_product_to_cart, get_all_current_products_in_cart, search_for_recipes,
+                     plan_meals, replace_existing_product]:
+        parameters = function.__code__.co_varnames[:function.__code__.co_argcount]
+        registry.register(function, function.__name__, {parameter: parameter for parameter in parameters})
+    return registry
+
+
+def nanoseconds_per_call(dispatch: Callable[[str, dict], object], calls: int) -> float:
+    best = float("inf")
+    rounds = max(1, calls // len(CALLS))
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for name, args in CALLS:
+                dispatch(name, args)
+        best = min(best, (time.perf_counter() - start) / (rounds * len(CALLS)))
+    return best * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    registry = build_registry()
+    print(f"registry built in {(time.perf_counter() - start) * 1e6:.0f} us")
+    closures = nanoseconds_per_call(dispatch_with_closures, args.calls)
+    print(f"closures:                   {closures:6.0f} ns per call")
+
+    def dispatch_without_counters(name: str, arguments: dict) -> object:
+        tool = registry[name]
+        return tool.function(**tool.bind(arguments))
+
+    validated = nanoseconds_per_call(dispatch_without_counters, args.calls)
+    print(f"registry, without counters: {validated:6.0f} ns per call ({validated / closures:.2f}x)")
+    compiled = nanoseconds_per_call(registry.call, args.calls)
+    print(f"registry:                   {compiled:6.0f} ns per call ({compiled / closures:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Size of the context of a Gemini Live session, and the summary that a fresh session is seeded with.
+
+Everything that is sent to or received from a Live session stays in its context, so every turn gets slower and more
+expensive the longer a conversation goes on. ConversationState estimates the size of the context and keeps a compact
+account of the conversation: the prompts, the replies and one line per tool call instead of its payload. Tool
+payloads that repeat what the model already has, like an unchanged shopping cart, are replaced by a short reference
+before they are sent. Once the context exceeds its limit, AudioLoop connects a fresh session and seeds it with the
+summary, which holds the recent turns and only the latest shopping cart.
+"""
+import hashlib
+import json
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, List
+
+from tools.response_shaping import BYTES_PER_TOKEN, payload_size
+
+# A fresh session is started once the estimated context exceeds this many tokens.
+CONTEXT_TOKEN_LIMIT = int(os.environ.get("PICNIC_CONTEXT_TOKENS", "32000"))
+# Gemini counts 32 tokens per second of audio.
+AUDIO_TOKENS_PER_SECOND = 32
+# Silence of the microphone is counted up to this long after speech, as the pauses of the user. Longer silence is
+# not, or an open microphone in a quiet room would start a fresh session every quarter of an hour.
+SPEECH_PAUSE_SECONDS = 2.0
+# Turns in the summary; older turns are only counted.
+SUMMARY_TURNS = 40
+# Of these, the most recent ones keep their prompt and reply in full, older ones are cut off.
+RECENT_TURNS = 6
+SUMMARY_TEXT_LENGTH = 160
+# The oldest turns are also left out while the summary takes more than this share of the token limit, so that a fresh
+# session has room for new turns.
+MAX_SUMMARY_SHARE = 0.25
+# Tools whose result is the whole shopping cart.
+CART_TOOLS = {"get_all_current_products_in_cart", "plan_meals", "apply_cheapest_basket", "reorder_from_list"}
+# Tools that change the shopping cart without returning it, after which the latest cart is outdated.
+CART_CHANGING_TOOLS = {"add_product_to_cart", "remove_product_from_cart", "replace_existing_product",
+                       "add_recipe_to_cart"}
+
+
+def _cut(text: str, max_length: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_length else text[:max_length - 1].rstrip() + "…"
+
+
+def cart_digest(cart: Any) -> str:
+    """Return a short digest of a cart payload, which changes whenever a line, count or price changes."""
+    text = json.dumps(cart, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(text.encode(), digest_size=6).hexdigest()
+
+
+def _outcome(name: str, result: dict) -> str:
+    """Describe a tool result in a few words."""
+    response = result.get("picnic_response")
+    if isinstance(response, str):
+        return _cut(response, 80)
+    if name in CART_TOOLS:
+        return f"cart {cart_digest(response)}"
+    for key in ("products", "recipes", "shopping_list", "replacements", "planned_recipes"):
+        if isinstance(result.get(key), list):
+            return f"{len(result[key])} {key.replace('_', ' ')}"
+    if isinstance(response, list):
+        return f"{len(response)} entries"
+    return _cut(json.dumps(result, separators=(",", ":"), default=str), 80)
+
+
+@dataclass
+class Turn:
+    prompt: str = ""
+    tool_calls: List[str] = field(default_factory=list)
+    reply: str = ""
+
+
+class ConversationState:
+    """Estimated context size and compact account of a conversation with a Live session.
+
+    Args:
+        token_limit: Estimated context tokens above which a fresh session should be started.
+    """
+
+    def __init__(self, token_limit: int = CONTEXT_TOKEN_LIMIT):
+        self.token_limit = token_limit
+        self.context_tokens = 0
+        # Fresh sessions that were started, and the tokens that compacted tool payloads saved.
+        self.rotations = 0
+        self.saved_tokens = 0
+        # The latest shopping cart that a tool returned, whether a tool changed the cart since, and the digest of the
+        # cart the current session has.
+        self.cart: Any = None
+        self.cart_outdated = False
+        self._sent_cart_digest: str | None = None
+        self._turns: Deque[Turn] = deque(maxlen=SUMMARY_TURNS)
+        self._turn = Turn()
+        self._turn_count = 0
+        # Seconds of microphone silence since the user last spoke.
+        self._silence_seconds = float("inf")
+
+    @property
+    def needs_rotation(self) -> bool:
+        return self.context_tokens > self.token_limit
+
+    @property
+    def pending_prompt(self) -> str | None:
+        """The prompt of the user whose turn the model has not completed yet, if any."""
+        return self._turn.prompt or None
+
+    def _add(self, value: Any) -> None:
+        self.context_tokens += payload_size(value) // BYTES_PER_TOKEN + 1
+
+    def prompt(self, text: str) -> None:
+        """Account for a prompt of the user."""
+        self._add(text)
+        self._turn.prompt += text
+
+    def reply(self, text: str) -> None:
+        """Account for text of the model."""
+        self._add(text)
+        self._turn.reply += text
+
+    def audio(self, seconds: float) -> None:
+        """Account for audio that was sent or received."""
+        self.context_tokens += int(seconds * AUDIO_TOKENS_PER_SECOND)
+
+    def microphone_audio(self, seconds: float, speech: bool) -> None:
+        """Account for audio of the microphone, of which only speech and the short pauses in it count."""
+        if speech:
+            self._silence_seconds = 0.0
+        else:
+            self._silence_seconds += seconds
+            if self._silence_seconds > SPEECH_PAUSE_SECONDS:
+                return
+        self.audio(seconds)
+
+    def tool_response(self, name: str, args: dict, response: dict) -> dict:
+        """Account for the response of a tool call and return it as it should be sent.
+
+        A shopping cart that the session already has is replaced by a reference to it.
+        """
+        result = response["response"]["result"]
+        arguments = ", ".join(f"{key}={value}" for key, value in (args or {}).items())
+        self._turn.tool_calls.append(f"{name}({_cut(arguments, 80)}) -> {_outcome(name, result)}")
+        if name in CART_CHANGING_TOOLS:
+            self.cart_outdated = True
+        # A message instead of the cart, e.g. of a failed reorder, leaves the cart as it was.
+        if name in CART_TOOLS and isinstance(result.get("picnic_response"), (list, dict)):
+            cart = result["picnic_response"]
+            digest = cart_digest(cart)
+            self.cart = cart
+            self.cart_outdated = False
+            if digest == self._sent_cart_digest:
+                compact = {**response, "response": {"result": {
+                    **result, "picnic_response": f"The shopping cart is unchanged since cart {digest}."}}}
+                self.saved_tokens += (payload_size(response) - payload_size(compact)) // BYTES_PER_TOKEN
+                response = compact
+            self._sent_cart_digest = digest
+        self._add(response)
+        return response
+
+    def end_turn(self) -> None:
+        """Account for the end of a turn of the model."""
+        if self._turn.prompt or self._turn.tool_calls or self._turn.reply:
+            self._turns.append(self._turn)
+            self._turn_count += 1
+        self._turn = Turn()
+
+    def summary(self) -> str:
+        """Return the summary of the conversation so far, to seed a fresh session with."""
+        turns = list(self._turns)
+        while True:
+            summary = self._summarize(turns)
+            if not turns or payload_size(summary) // BYTES_PER_TOKEN <= self.token_limit * MAX_SUMMARY_SHARE:
+                return summary
+            del turns[:max(1, len(turns) // 4)]
+
+    def _summarize(self, turns: List[Turn]) -> str:
+        lines = ["This conversation continues an earlier one with the same user, summarized below. Continue it without "
+                 "greeting the user again and without answering this summary."]
+        if (omitted := self._turn_count - len(turns)) > 0:
+            lines.append(f"({omitted} earlier turns are omitted.)")
+        recent = len(turns) - RECENT_TURNS
+        for index, turn in enumerate(turns):
+            length = SUMMARY_TEXT_LENGTH * 4 if index >= recent else SUMMARY_TEXT_LENGTH
+            if turn.prompt:
+                lines.append(f"User: {_cut(turn.prompt, length)}")
+            lines.extend(f"Tool call: {tool_call}" for tool_call in turn.tool_calls)
+            if turn.reply:
+                lines.append(f"You: {_cut(turn.reply, length)}")
+        if self.cart_outdated:
+            lines.append("The shopping cart was changed after it was last fetched. Call "
+                         "get_all_current_products_in_cart before you tell the user what is in it.")
+        elif self.cart is not None:
+            lines.append(f"The current shopping cart {cart_digest(self.cart)} is: "
+                         f"{json.dumps(self.cart, separators=(',', ':'), ensure_ascii=False, default=str)}")
+        if self.pending_prompt:
+            lines.append(f"The connection was interrupted while you were answering the last request of the user: "
+                         f"{_cut(self.pending_prompt, SUMMARY_TEXT_LENGTH * 4)}")
+            lines.extend(f"Tool call you already made for it: {tool_call}" for tool_call in self._turn.tool_calls)
+            lines.append("Answer this request now.")
+        return "\n".join(lines)
+
+    def rotate(self) -> str:
+        """Start accounting for a fresh session and return the summary to seed it with."""
+        self.rotations += 1
+        return self._start_fresh_session()
+
+    def resume(self) -> str:
+        """Start accounting for a fresh session after the connection dropped, and return the summary to seed it with.
+
+        If the connection dropped during a turn, the summary ends with the request of the user that was not answered,
+        and the fresh session should be asked to answer it right away.
+        """
+        return self._start_fresh_session()
+
+    def _start_fresh_session(self) -> str:
+        summary = self.summary()
+        self.context_tokens = 0
+        self._sent_cart_digest = cart_digest(self.cart) if self.cart is not None and not self.cart_outdated else None
+        self._add(summary)
+        return summary
+
+
+__all__ = ["ConversationState", "cart_digest"]
@@ -0,0 +1,230 @@
+"""Scripted stand-in for a Gemini Live session, for tests and benchmarks."""
+import asyncio
+import json
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncContextManager, AsyncIterator, Deque, List
+
+from recording import live_response
+
+
+class ScriptedLiveSession:
+    """Answers every prompt that ends a turn with the next scripted turn.
+
+    A turn is a list of events in the format of recorded Live events, e.g. {"event": "text", "text": "Hi"} or
+    {"event": "tool_call", "function_calls": [{"name": ..., "args": {...}, "id": ...}]}. After a tool call, the turn
+    continues once the tool responses were sent.
+
+    Args:
+        turns: The scripted turns, in order.
+        latency: Seconds before every event is received, like the time the model needs.
+        seconds_per_context_token: Seconds added before the first event of a turn per token in the context, like
+            the time the model needs to process it. Every connect starts with an empty context.
+    """
+
+    def __init__(self, turns: List[List[dict]], latency: float = 0.0, seconds_per_context_token: float = 0.0):
+        self.latency = latency
+        self.seconds_per_context_token = seconds_per_context_token
+        # Estimated tokens that were sent and received since the last connect, and the number of connects.
+        self.context_tokens = 0
+        self.connections = 0
+        self.sent: List[Any] = []
+        self.completed_turns = 0
+        self._turn_completed = asyncio.Condition()
+        self._turns: Deque[List[dict]] = deque(turns)
+        self._prompts = asyncio.Semaphore(0)
+        self._tool_responses = asyncio.Semaphore(0)
+
+    async def send(self, input: Any, end_of_turn: bool = False) -> None:
+        if isinstance(input, dict) and "data" in input:
+            return
+        self.sent.append(input)
+        self.context_tokens += len(json.dumps(input, default=str)) // 4
+        if isinstance(input, str):
+            if end_of_turn:
+                self._prompts.release()
+        else:
+            self._tool_responses.release()
+
+    async def receive(self) -> AsyncIterator[Any]:
+        await self._prompts.acquire()
+        turn = self._turns.popleft() if self._turns else [{"event": "text", "text": "Is there anything else?"}]
+        await asyncio.sleep(self.context_tokens * self.seconds_per_context_token)
+        for event in turn:
+            await asyncio.sleep(self.latency)
+            self.context_tokens += len(json.dumps(event, default=str)) // 4
+            yield live_response(event)
+            if event["event"] == "tool_call":
+                await self._tool_responses.acquire()
+        async with self._turn_completed:
+            self.completed_turns += 1
+            self._turn_completed.notify_all()
+
+    async def wait_for_turns(self, count: int) -> None:
+        """Wait until the given number of turns was completely received."""
+        async with self._turn_completed:
+            await self._turn_completed.wait_for(lambda: self.completed_turns >= count)
+
+    async def prompt(self, text: str) -> None:
+        """Send a prompt like the user and wait until its turn was completely received."""
+        expected = self.completed_turns + 1
+        await self.send(text, end_of_turn=True)
+        await self.wait_for_turns(expected)
+
+    def connect(self) -> AsyncContextManager["ScriptedLiveSession"]:
+        """Connect function for AudioLoop, which returns this session."""
+        @asynccontextmanager
+        async def connect() -> AsyncIterator[ScriptedLiveSession]:
+            self.context_tokens = 0
+            self.connections += 1
+            yield self
+
+        return connect()
+
+
+class _DroppableLiveSession(ScriptedLiveSession):
+    """A scripted session of a FaultInjectingLiveServer, which fails once it was dropped."""
+
+    def __init__(self, server: "FaultInjectingLiveServer"):
+        super().__init__([], latency=server.latency)
+        # The script is shared by all sessions of the server: a reconnected session continues it.
+        self._turns = server.turns
+        self._server = server
+        self.error: BaseException | None = None
+        self._dropped = asyncio.Event()
+
+    def drop(self, error: BaseException) -> None:
+        self.error = error
+        self._dropped.set()
+
+    async def send(self, input: Any, end_of_turn: bool = False) -> None:
+        if self.error is not None:
+            raise self.error
+        if isinstance(input, dict) and "data" in input:
+            self._server.audio.append(input["data"])
+            return
+        await super().send(input, end_of_turn)
+
+    async def receive(self) -> AsyncIterator[Any]:
+        events = super().receive()
+        dropped = asyncio.ensure_future(self._dropped.wait())
+        try:
+            while True:
+                next_event = asyncio.ensure_future(events.__anext__())
+                await asyncio.wait([next_event, dropped], return_when=asyncio.FIRST_COMPLETED)
+                if not next_event.done():
+                    next_event.cancel()
+                    raise self.error  # type: ignore[misc]
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    return
+                yield event
+        finally:
+            dropped.cancel()
+
+
+class FaultInjectingLiveServer:
+    """Serves scripted Live sessions, like ScriptedLiveSession, and injects connection faults.
+
+    All sessions continue the same script. drop() makes the current session fail like a dropped websocket: a pending
+    receive and every later send raise. refuse() makes the next connect attempts fail.
+
+    Args:
+        turns: The scripted turns, in order.
+        latency: Seconds before every event is received.
+        connect_latency: Seconds every connect attempt takes.
+    """
+
+    def __init__(self, turns: List[List[dict]], latency: float = 0.0, connect_latency: float = 0.0):
+        self.turns: Deque[List[dict]] = deque(turns)
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.sessions: List[_DroppableLiveSession] = []
+        # Mic audio chunks that any session received.
+        self.audio: List[bytes] = []
+        self.connect_attempts = 0
+        self._refused_connects = 0
+
+    @property
+    def session(self) -> _DroppableLiveSession:
+        return self.sessions[-1]
+
+    @property
+    def completed_turns(self) -> int:
+        return sum(session.completed_turns for session in self.sessions)
+
+    def drop(self, error: BaseException | None = None) -> None:
+        """Drop the connection of the current session."""
+        self.session.drop(error or ConnectionResetError("Connection reset by fake Live server"))
+
+    def refuse(self, count: int) -> None:
+        """Refuse the next count connect attempts."""
+        self._refused_connects = count
+
+    async def wait_for_turns(self, count: int) -> None:
+        """Wait until the given number of turns was completely received, by all sessions together."""
+        while self.completed_turns < count:
+            await asyncio.sleep(0.001)
+
+    def connect(self) -> AsyncContextManager[_DroppableLiveSession]:
+        """Connect function for AudioLoop, which returns a new session of this server."""
+        @asynccontextmanager
+        async def connect() -> AsyncIterator[_DroppableLiveSession]:
+            self.connect_attempts += 1
+            await asyncio.sleep(self.connect_latency)
+            if self._refused_connects > 0:
+                self._refused_connects -= 1
+                raise ConnectionRefusedError("Connection refused by fake Live server")
+            session = _DroppableLiveSession(self)
+            self.sessions.append(session)
+            try:
+                yield session
+            finally:
+                session.drop(ConnectionResetError("Session closed"))
+
+        return connect()
+
+
+async def silence(text: str) -> bytes:
+    """Speech synthesis stand-in that returns 10 ms of silence per character at 24 kHz."""
+    return bytes(len(text) * 480)
+
+
+async def scripted_conversation(conversation_id: str, params: dict) -> dict:
+    """Conversation host for a WorkerPool: an AudioLoop talks to a scripted session and to a Picnic stub.
+
+    params holds the URL of the stub ("picnic_url"), the auth token of the shopper ("auth_token", by default the
+    conversation id), the scripted turns ("turns") and the prompts of the user ("prompts"), one per turn.
+    """
+    # Imported here, so that importing this module stays light for the tests that only need the sessions.
+    from audio import InMemoryAudioBackend
+    from picnic_agent import AudioLoop
+    from python_picnic_api.python_picnic_api.client import PicnicAPI
+    from tools.picnic_tools import ShopperSession, use_session
+
+    picnic = PicnicAPI(auth_token=params.get("auth_token", conversation_id), base_url=params["picnic_url"])
+    session = ShopperSession(picnic=picnic)
+    # Before any task is created, so that the tool calls of this conversation use its session.
+    use_session(session)
+    scripted = ScriptedLiveSession(params["turns"], latency=params.get("latency", 0.0))
+    audio_loop = AudioLoop(audio=InMemoryAudioBackend(realtime=False), connect=scripted.connect, speak=silence)
+    await audio_loop.connect_session()
+    audio_loop.audio_in_queue = asyncio.Queue()
+    receive = asyncio.create_task(audio_loop.receive_audio())
+    try:
+        for count, prompt in enumerate(params["prompts"], start=1):
+            await audio_loop.send_prompt(prompt)
+            await scripted.wait_for_turns(count)
+    finally:
+        receive.cancel()
+        await asyncio.gather(receive, return_exceptions=True)
+        if audio_loop._session_stack is not None:
+            await audio_loop._session_stack.aclose()
+        session.close()
+    tool_responses = sum(not isinstance(sent, str) for sent in scripted.sent)
+    return {"turns": scripted.completed_turns, "tool_responses": tool_responses, "pid": os.getpid()}
+
+
+__all__ = ["FaultInjectingLiveServer", "ScriptedLiveSession", "scripted_conversation", "silence"]
@@ -0,0 +1,85 @@
+"""Local stand-in for the structured-output Gemini client of ai_helper_functions, for tests and benchmarks."""
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, List, Type, get_args
+
+from pydantic import BaseModel
+
+
+def _words(text: str) -> set:
+    return set(text.lower().split())
+
+
+class FakeLLMClient:
+    """Answers match prompts without a model, by the words the product names share with the search terms.
+
+    Like the instructor client, it has chat.completions.create(messages=..., response_model=...), which returns an
+    instance of the response model. The products and search terms are read from the JSON lines of the prompt.
+
+    Args:
+        latency: Seconds every request takes, like the round trip to the model.
+        asynchronous: Whether create is a coroutine function, like the client of instructor with use_async=True.
+    """
+
+    def __init__(self, latency: float = 0.0, asynchronous: bool = False):
+        self.latency = latency
+        self.prompts: List[str] = []
+        self.max_concurrent_requests = 0
+        self._concurrent_requests = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self._create_async if asynchronous else self._create))
+
+    @property
+    def requests(self) -> int:
+        return len(self.prompts)
+
+    def _create(self, messages: List[dict], response_model: Type[BaseModel], **kwargs: Any) -> BaseModel:
+        self._enter(messages)
+        try:
+            time.sleep(self.latency)
+        finally:
+            self._exit()
+        return self.answer(messages[-1]["content"], response_model)
+
+    async def _create_async(self, messages: List[dict], response_model: Type[BaseModel], **kwargs: Any) -> BaseModel:
+        self._enter(messages)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self._exit()
+        return self.answer(messages[-1]["content"], response_model)
+
+    def _enter(self, messages: List[dict]) -> None:
+        with self._lock:
+            self.prompts.append(messages[-1]["content"])
+            self._concurrent_requests += 1
+            self.max_concurrent_requests = max(self.max_concurrent_requests, self._concurrent_requests)
+
+    def _exit(self) -> None:
+        with self._lock:
+            self._concurrent_requests -= 1
+
+    def answer(self, prompt: str, response_model: Type[BaseModel]) -> BaseModel:
+        """Return the answer to a prompt as an instance of the response model."""
+        products, terms = [json.loads(line) for line in prompt.splitlines() if line.startswith("[")][:2]
+        cheapest = "cheapest" in prompt
+        matches = [self._match(products, term, cheapest) for term in terms]
+        fields = response_model.model_fields
+        if "matches" in fields:
+            (item_model,) = get_args(fields["matches"].annotation)
+            return response_model(matches=[item_model(**match, search_term=term)
+                                           for match, term in zip(matches, terms)])
+        return response_model(**{name: value for name, value in matches[0].items() if name in fields})
+
+    @staticmethod
+    def _match(products: List[dict], term: str, cheapest: bool) -> dict:
+        def score(product: dict) -> tuple:
+            shared = len(_words(term) & _words(product["product_name"]))
+            return (shared, -product["price"]) if cheapest else (shared, 0)
+
+        product = max(products, key=score)
+        return {**product, "short_product_name_version": " ".join(product["product_name"].split()[:2])}
@@ -1,52 +1,139 @@
 import asyncio
+import functools
 import itertools
+import logging
 import os
+import time
 import traceback
-from pprint import pprint
-from typing import Generator
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Deque, Generator
 
-import pyaudio
 from dotenv import load_dotenv
-from google import genai
-from google.cloud import texttospeech
 
-from tools.picnic_tools import handle_picnic_tool_operations
+from audio import AudioBackend, InputStream, PyAudioBackend, is_speech
+from conversation_state import ConversationState
+from python_picnic_api.python_picnic_api.cache import Cache, TTLCache
+from python_picnic_api.python_picnic_api.snapshot import load_snapshot, save_snapshot
+from reconnect import Backoff, ReconnectStats, connection_errors
+from structured_logging import configure_logging, log_event, log_stats
+from tools.picnic_tools import current_session, drain_cart_failures, get_picnic, handle_picnic_tool_operations, \
+    persistent_caches, prefetcher, registry, reorder_stats, shared_cache_store
+from tools.response_shaping import payload_stats
 from tools.tool_descriptions import tools
 
 load_dotenv()
 
-FORMAT = pyaudio.paInt16
-CHANNELS = 1
+logger = logging.getLogger("picnic_agent")
+
 SEND_SAMPLE_RATE = 16000
 RECEIVE_SAMPLE_RATE = 24000
 CHUNK_SIZE = 1024
 MODEL = "models/gemini-2.0-flash-exp"
-pya = pyaudio.PyAudio()
 RESPONSE_MODEL = "TEXT"  # or "AUDIO" <- AUDIO is not well-supported yet...
+TTS_VOICE_NAME = "en-US-Journey-D"
+TTS_LANGUAGE_CODE = "en-US"
+# Mic audio captured while the Live session reconnects is sent once it is back, up to this many seconds of it.
+MAX_BUFFERED_AUDIO_SECONDS = 10
+
+# Caches are written to this file on exit and restored from it on startup.
+CACHE_SNAPSHOT_PATH = os.environ.get("PICNIC_CACHE_SNAPSHOT", ".cache/picnic_agent.snapshot")
+
+TTS_PHRASE_TTL = 30 * 24 * 3600
+
+
+def _tts_phrase_cache() -> Cache:
+    # Speech depends on nothing but the text, so it is shared by all users of the shared cache store.
+    if (store := shared_cache_store()) is not None:
+        return store.cache("tts_phrases", maxsize=512, ttl=TTS_PHRASE_TTL)
+    return TTLCache(maxsize=512, ttl=TTS_PHRASE_TTL)
 
-client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"), http_options={"api_version": "v1alpha"})
-text_to_speach_client = texttospeech.TextToSpeechClient()
+
+# Synthesized speech of recently spoken text fragments.
+tts_phrase_cache = _tts_phrase_cache()
 
 CONFIG = {"generation_config": {"response_modalities": [RESPONSE_MODEL], "temperature": 0},
           "system_instruction": "You are a shopping assistant called Picnic Pal 3000 for the online grocery store "
                                 "Picnic.",
           "tools": [tools]}
-streaming_config = texttospeech.StreamingSynthesizeConfig(
-    voice=texttospeech.VoiceSelectionParams(name="en-US-Journey-D", language_code="en-US"))
-config_request = texttospeech.StreamingSynthesizeRequest(streaming_config=streaming_config)
+
+
+# The Google clients are expensive to import and construct, so they are only created when they are first needed.
+# AudioLoop.run() creates them in background threads while the Live session connects.
+@functools.cache
+def gemini_client() -> Any:
+    from google import genai
+    return genai.Client(api_key=os.environ.get("GEMINI_API_KEY"), http_options={"api_version": "v1alpha"})
+
+
+@functools.cache
+def text_to_speech() -> tuple[Any, Any, Any]:
+    """Return the texttospeech module, its client and the streaming config request."""
+    from google.cloud import texttospeech
+    streaming_config = texttospeech.StreamingSynthesizeConfig(
+        voice=texttospeech.VoiceSelectionParams(name=TTS_VOICE_NAME, language_code=TTS_LANGUAGE_CODE))
+    config_request = texttospeech.StreamingSynthesizeRequest(streaming_config=streaming_config)
+    return texttospeech, texttospeech.TextToSpeechClient(), config_request
+
+
+def snapshot_caches() -> dict[str, Cache]:
+    return {**persistent_caches(), "tts_phrases": tts_phrase_cache}
+
+
+def restore_caches() -> int:
+    """Log into Picnic and restore the caches from the last snapshot. Returns the number of restored entries."""
+    return load_snapshot(CACHE_SNAPSHOT_PATH, snapshot_caches())
+
+
+def store_caches() -> int:
+    return save_snapshot(CACHE_SNAPSHOT_PATH, snapshot_caches())
+
+
+@asynccontextmanager
+async def connect_live_session() -> AsyncIterator[Any]:
+    client = await asyncio.to_thread(gemini_client)
+    async with client.aio.live.connect(model=MODEL, config=CONFIG) as session:
+        yield session
 
 
 class AudioLoop:
-    def __init__(self) -> None:
-        self.audio_in_queue = None
-        self.out_queue = None
-        self.session = None
+    def __init__(
+            self, audio: AudioBackend | None = None,
+            connect: Callable[[], AsyncContextManager[Any]] = connect_live_session,
+            speak: Callable[[str], Awaitable[bytes]] | None = None,
+            conversation: ConversationState | None = None,
+            backoff: Backoff | None = None
+    ) -> None:
+        self.audio = audio or PyAudioBackend()
+        self.connect = connect
+        # Turns text responses into audio, by default with Google Text-to-Speech.
+        self.speak = speak or self.stream_text_to_speech
+        # Seconds since run() was called at which startup milestones were reached.
+        self.startup_timings: dict[str, float] = {}
+        self.ready = asyncio.Event()
+        self._started_at = 0.0
+        self.audio_in_queue: asyncio.Queue | Any = None
+        self.out_queue: asyncio.Queue | Any = None
+        self.session: Any = None
+        # Tracks the context of the Live session, which is replaced by a fresh, seeded one when it gets too large.
+        self.conversation = conversation or ConversationState()
+        self._session_stack: AsyncExitStack | None = None
+        self._session_lock = asyncio.Lock()
+        # Cleared while the Live session reconnects; prompts wait for it, mic audio is buffered meanwhile.
+        self.connected = asyncio.Event()
+        self.connected.set()
+        self._disconnected = asyncio.Event()
+        self.backoff = backoff or Backoff()
+        self.reconnect_stats = ReconnectStats()
+        self._audio_backlog: Deque[dict] = deque(maxlen=MAX_BUFFERED_AUDIO_SECONDS * SEND_SAMPLE_RATE // CHUNK_SIZE)
         self.send_text_task = None
         self.receive_audio_task = None
         self.play_audio_task = None
-        self.audio_stream = None
+        self.audio_stream: InputStream | None = None
 
     async def send_text(self) -> None:
+        self.startup_timings["first_prompt"] = time.perf_counter() - self._started_at
+        self.ready.set()
         while True:
             text = await asyncio.to_thread(
                 input,
@@ -54,24 +141,39 @@ class AudioLoop:
             )
             if text.lower() == "q":
                 break
-            await self.session.send(text or ".", end_of_turn=True)
+            await self.send_prompt(text or ".")
+
+    async def send_prompt(self, text: str) -> None:
+        await self.connected.wait()
+        self.conversation.prompt(text)
+        session = self.session
+        try:
+            await session.send(text, end_of_turn=True)
+        except connection_errors() as e:
+            # Not sent again: the fresh session is seeded with the prompt as the request to answer.
+            self.connection_lost(session, e)
 
     async def send_realtime(self) -> None:
+        backlog = self._audio_backlog
         while True:
             msg = await self.out_queue.get()
-            await self.session.send(msg)
+            if len(backlog) == backlog.maxlen:
+                self.reconnect_stats.dropped_audio_chunks += 1
+            backlog.append(msg)
+            if not self.connected.is_set():
+                self.reconnect_stats.buffered_audio_chunks += 1
+                continue
+            session = self.session
+            try:
+                while backlog:
+                    await session.send(backlog[0])
+                    data = backlog.popleft()["data"]
+                    self.conversation.microphone_audio(len(data) / (2 * SEND_SAMPLE_RATE), is_speech(data))
+            except connection_errors() as e:
+                self.connection_lost(session, e)
 
     async def listen_audio(self) -> None:
-        mic_info = pya.get_default_input_device_info()
-        self.audio_stream = await asyncio.to_thread(
-            pya.open,
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=SEND_SAMPLE_RATE,
-            input=True,
-            input_device_index=mic_info["index"],
-            frames_per_buffer=CHUNK_SIZE,
-        )
+        self.audio_stream = await asyncio.to_thread(self.audio.open_input, SEND_SAMPLE_RATE, CHUNK_SIZE)
         if __debug__:
             kwargs = {"exception_on_overflow": False}
         else:
@@ -83,60 +185,176 @@ class AudioLoop:
     async def receive_audio(self) -> None:
         """Background task to reads from the websocket and write pcm chunks to the output queue"""
         while True:
-            function_responses = []
-            turn = self.session.receive()
-            async for response in turn:
-                if data := response.data:
+            await self.connected.wait()
+            session = self.session
+            try:
+                await self.receive_turn(session)
+            except connection_errors() as e:
+                self.connection_lost(session, e)
+
+    async def receive_turn(self, session: Any) -> None:
+        """Receive a turn of the model: play its responses, call the tools it asks for and send their results."""
+        function_responses = []
+        reply = []
+        turn = session.receive()
+        async for response in turn:
+            if data := response.data:
+                self.audio_in_queue.put_nowait(data)
+                self.conversation.audio(len(data) / (2 * RECEIVE_SAMPLE_RATE))
+                continue
+            if text := response.text:
+                print(text, end="", flush=True)
+                reply.append(text)
+                self.conversation.reply(text)
+                if RESPONSE_MODEL == "TEXT":
+                    data = await self.speak(text)
                     self.audio_in_queue.put_nowait(data)
-                    continue
-                if text := response.text:
-                    print(text, end="")
-                    if RESPONSE_MODEL == "TEXT":
-                        data = await self.stream_text_to_speech(text)
-                        self.audio_in_queue.put_nowait(data)
-                    continue
-                if _ := response.tool_call:
-                    function_calls = response.tool_call.function_calls
-                    for function_call in function_calls:
-                        name = function_call.name
-                        args = function_call.args
-                        call_id = function_call.id
-                        try:
-                            response = handle_picnic_tool_operations(name, args, call_id)
-                            function_responses.append(response)
-                        except Exception as e:
-                            print(f"Error executing {name} function with error: {e}")
-                    pprint(function_responses, width=180, indent=2, compact=False)
-                    # Send function result back to Gemini
-                    await self.session.send(function_responses)
-                    continue
-            if RESPONSE_MODEL == "AUDIO":
-                # If you interrupt the model, it sends a turn_complete.
-                # For interruptions to work, we need to stop playback.
-                # So empty out the audio queue because it may have loaded
-                # much more audio than has played yet.
-                while not self.audio_in_queue.empty():
-                    self.audio_in_queue.get_nowait()
+                continue
+            if _ := response.tool_call:
+                function_calls = response.tool_call.function_calls
+                for function_call in function_calls:
+                    name = function_call.name
+                    args = function_call.args
+                    call_id = function_call.id
+                    try:
+                        # In a thread, so that slow requests and parsing do not stall the audio.
+                        response = await asyncio.to_thread(handle_picnic_tool_operations, name, args, call_id)
+                        function_responses.append(self.conversation.tool_response(name, args, response))
+                    except Exception as e:
+                        log_event(logger, logging.ERROR, "tool_error", name=name, error=repr(e))
+                log_event(logger, logging.DEBUG, "tool_responses", responses=function_responses)
+                # Send function result back to Gemini
+                await session.send(function_responses)
+                continue
+        if reply:
+            print()
+            log_event(logger, logging.INFO, "reply", text="".join(reply))
+        if session is not self.session:
+            # The session was replaced after a disconnect; the fresh session answers whatever is left of the turn.
+            return
+        if RESPONSE_MODEL == "AUDIO":
+            # If you interrupt the model, it sends a turn_complete.
+            # For interruptions to work, we need to stop playback.
+            # So empty out the audio queue because it may have loaded
+            # much more audio than has played yet.
+            while not self.audio_in_queue.empty():
+                self.audio_in_queue.get_nowait()
+        self.conversation.end_turn()
+        if self.conversation.needs_rotation:
+            try:
+                await self.rotate_session()
+            except Exception as e:
+                # The current session still works, only with a larger context.
+                log_event(logger, logging.WARNING, "rotation_failed", error=repr(e))
+        if failures := drain_cart_failures():
+            # Cart updates that failed in the background are announced in the next turn.
+            await self.send_prompt("The following shopping cart updates failed, please tell me about it: "
+                                   + "; ".join(failures))
+
+    async def connect_session(self) -> None:
+        self._session_stack = AsyncExitStack()
+        self.session = await self._session_stack.enter_async_context(self.connect())
+
+    async def rotate_session(self) -> None:
+        """Replace the Live session by a fresh one, seeded with a summary of the conversation so far.
+
+        The fresh session is connected before the current one is closed, so that prompts and audio are never sent
+        to a closed session.
+        """
+        await self._replace_session(self.conversation.rotate, end_of_turn=False)
+
+    async def _replace_session(self, summary: Callable[[], str], end_of_turn: bool) -> None:
+        async with self._session_lock:
+            stack = AsyncExitStack()
+            session = await stack.enter_async_context(self.connect())
+            try:
+                await session.send(summary(), end_of_turn=end_of_turn)
+            except BaseException:
+                await stack.aclose()
+                raise
+            previous_stack, self._session_stack = self._session_stack, stack
+            self.session = session
+        if previous_stack is not None:
+            try:
+                await previous_stack.aclose()
+            except Exception as e:
+                # A dropped session may fail to close; it is gone either way.
+                log_event(logger, logging.WARNING, "close_failed", error=repr(e))
+
+    def connection_lost(self, session: Any, error: BaseException) -> None:
+        """Let the supervisor reconnect, unless the session was already replaced."""
+        if session is not self.session or not self.connected.is_set():
+            return
+        log_event(logger, logging.WARNING, "disconnected", error=repr(error))
+        self.connected.clear()
+        self.reconnect_stats.disconnects += 1
+        self._disconnected.set()
+
+    async def supervise(self) -> None:
+        """Background task that reconnects whenever the Live session was disconnected.
+
+        The mic, playback and prompt tasks keep running meanwhile. Raises ConnectionError if all reconnect attempts
+        failed, which ends the conversation.
+        """
+        while True:
+            await self._disconnected.wait()
+            await self.reconnect()
+
+    async def reconnect(self) -> None:
+        """Connect a fresh session with backoff and seed it with a summary of the conversation.
+
+        A request of the user that the dropped session did not answer is answered by the fresh one.
+        """
+        started_at = time.perf_counter()
+        error: BaseException | None = None
+        for delay in self.backoff.delays():
+            await asyncio.sleep(delay)
+            try:
+                await self._replace_session(
+                    self.conversation.resume, end_of_turn=self.conversation.pending_prompt is not None)
+            except connection_errors() as e:
+                error = e
+                self.reconnect_stats.failed_attempts += 1
+                log_event(logger, logging.WARNING, "reconnect_failed", error=repr(e))
+                continue
+            self.reconnect_stats.record(time.perf_counter() - started_at)
+            log_event(logger, logging.INFO, "reconnected", seconds=round(time.perf_counter() - started_at, 3))
+            self._disconnected.clear()
+            self.connected.set()
+            return
+        raise ConnectionError(f"Could not reconnect to the Live session after {self.backoff.attempts} attempts") \
+            from error
 
     async def play_audio(self) -> None:
-        stream = await asyncio.to_thread(
-            pya.open,
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=RECEIVE_SAMPLE_RATE,
-            output=True,
-        )
+        stream = await asyncio.to_thread(self.audio.open_output, RECEIVE_SAMPLE_RATE)
         while True:
             bytestream = await self.audio_in_queue.get()
             await asyncio.to_thread(stream.write, bytestream)
 
+    def _warm_up_steps(self) -> list[Callable[[], Any]]:
+        """Expensive initializations that can run in the background while the Live session connects."""
+        steps: list[Callable[[], Any]] = [restore_caches]
+        if RESPONSE_MODEL == "TEXT" and self.speak == self.stream_text_to_speech:
+            steps.append(text_to_speech)
+        if isinstance(self.audio, PyAudioBackend):
+            steps.append(self.audio.warm_up)
+        return steps
+
+    async def _warm_up(self, step: Callable[[], Any]) -> None:
+        try:
+            await asyncio.to_thread(step)
+        except Exception as e:
+            # Not fatal here, the same error comes up again when the client is used.
+            log_event(logger, logging.WARNING, "warm_up_failed", step=getattr(step, "__name__", str(step)),
+                      error=repr(e))
+
     async def run(self) -> None:
+        self._started_at = time.perf_counter()
+        warm_up_tasks = [asyncio.create_task(self._warm_up(step)) for step in self._warm_up_steps()]
         try:
-            async with (
-                client.aio.live.connect(model=MODEL, config=CONFIG) as session,  # noqa
-                asyncio.TaskGroup() as tg,
-            ):
-                self.session = session
+            async with asyncio.TaskGroup() as tg:
+                await self.connect_session()
+                self.startup_timings["connected"] = time.perf_counter() - self._started_at
                 self.audio_in_queue = asyncio.Queue()
                 self.out_queue = asyncio.Queue(maxsize=5)
                 send_text_task = tg.create_task(self.send_text())
@@ -144,6 +362,7 @@ class AudioLoop:
                 tg.create_task(self.listen_audio())
                 tg.create_task(self.receive_audio())
                 tg.create_task(self.play_audio())
+                tg.create_task(self.supervise())
 
                 await send_text_task
                 raise asyncio.CancelledError("User requested exit")
@@ -151,22 +370,69 @@ class AudioLoop:
         except asyncio.CancelledError:
             pass
         except ExceptionGroup as EG:
-            self.audio_stream.close()
+            if self.audio_stream is not None:
+                self.audio_stream.close()
             traceback.print_exception(EG)
+        finally:
+            for task in warm_up_tasks:
+                task.cancel()
+            if self._session_stack is not None:
+                await self._session_stack.aclose()
+                self._session_stack = None
 
     async def stream_text_to_speech(self, text: str) -> bytes:
+        if (cached_audio := tts_phrase_cache.get(text)) is not None:
+            return cached_audio
+        texttospeech, text_to_speech_client, config_request = text_to_speech()
+
         def request_generator() -> Generator:
             yield texttospeech.StreamingSynthesizeRequest(
                 input=texttospeech.StreamingSynthesisInput(text=f" {text}"))  # noqa
 
-        streaming_responses = text_to_speach_client.streaming_synthesize(
+        streaming_responses = text_to_speech_client.streaming_synthesize(
             itertools.chain([config_request], request_generator()))
         audio_content = bytearray()
         for response in streaming_responses:
             audio_content.extend(response.audio_content)
+        tts_phrase_cache.set(text, bytes(audio_content))
         return bytes(audio_content)
 
 
 if __name__ == "__main__":
-    main = AudioLoop()
+    log_writer = configure_logging()
+    if record_path := os.environ.get("PICNIC_RECORD_SESSION"):
+        from recording import RecordingHTTPAdapter, SessionRecorder, install_http_adapter, recording_connect
+        recorder = SessionRecorder(record_path)
+        install_http_adapter(get_picnic().session, RecordingHTTPAdapter(recorder))
+        main = AudioLoop(connect=recording_connect(connect_live_session, recorder))
+    else:
+        main = AudioLoop()
     asyncio.run(main.run())
+    if record_path:
+        recorder.close()
+    store_caches()
+    current_session().close()
+    # The summary below goes straight to stdout, after the events that are still queued.
+    log_writer.stop()
+    for tool_name, stats in payload_stats().items():
+        print(f"{tool_name}: {stats.calls} calls, {stats.raw_bytes} -> {stats.shaped_bytes} response bytes "
+              f"({stats.saved_ratio:.0%} saved)")
+    for tool_name, tool_stats in registry.stats().items():
+        print(f"{tool_name}: {tool_stats.calls} calls, {tool_stats.errors} errors, "
+              f"{tool_stats.mean_seconds * 1000:.0f} ms mean, {tool_stats.max_seconds * 1000:.0f} ms max")
+    print(f"context: {main.conversation.rotations} fresh sessions, "
+          f"{main.conversation.saved_tokens} tokens saved by compacted tool responses")
+    reconnect_stats = main.reconnect_stats
+    print(f"reconnects: {reconnect_stats.reconnects}/{reconnect_stats.disconnects} after disconnects, "
+          f"{reconnect_stats.mean_seconds * 1000:.0f} ms mean, {reconnect_stats.max_seconds * 1000:.0f} ms max, "
+          f"{reconnect_stats.buffered_audio_chunks} mic chunks buffered, "
+          f"{reconnect_stats.dropped_audio_chunks} dropped")
+    prefetch_stats = prefetcher.stats
+    print(f"prefetch: {prefetch_stats.completed}/{prefetch_stats.scheduled} completed, "
+          f"{prefetch_stats.cancelled} cancelled, {prefetch_stats.hit_rate:.0%} hit rate")
+    reordered = reorder_stats()
+    print(f"reorders: {reordered.reorders} lists, {reordered.items} products, {reordered.failed_items} failed, "
+          f"{reordered.seconds_saved * 1000:.0f} ms and {reordered.tool_calls_saved} tool calls saved")
+    logged = log_stats()
+    print(f"logging: {logged.written} events written, {logged.sampled_out} sampled out, {logged.dropped} dropped, "
+          f"{logged.truncated_fields} fields truncated")
@@ -1,6 +1,7 @@
+from .cart import Cart, CartDiff, CartLine
 from .client import PicnicAPI
 
-__all__ = ["PicnicAPI"]
+__all__ = ["Cart", "CartDiff", "CartLine", "PicnicAPI"]
 __title__ = "python-picnic-api"
 __version__ = "1.1.0"
 __author__ = "Mike Brink"
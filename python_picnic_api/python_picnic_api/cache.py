@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterator, Protocol, Tuple
+
+
+class Cache(Protocol):
+    """Interface of the caches of the client: TTLCache in the process, or SharedTTLCache shared between processes."""
+    maxsize: int
+    ttl: float
+    hits: int
+    misses: int
+
+    def get(self, key: Hashable, default: Any = None) -> Any: ...
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None, expires_at: float | None = None) -> None: ...
+
+    def __contains__(self, key: Hashable) -> bool: ...
+
+    def __len__(self) -> int: ...
+
+    def items(self) -> Iterator[Tuple[Hashable, Any, float]]: ...
+
+    def pop(self, key: Hashable, default: Any = None) -> Any: ...
+
+    def clear(self) -> None: ...
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after a time to live.
+
+    Args:
+        maxsize: Maximum number of entries; the least recently used entry is evicted first.
+        ttl: Seconds an entry stays valid, unless another ttl is given when it is set.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 3600.0, clock: Callable[[], float] = time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, Tuple[Any, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self._clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None, expires_at: float | None = None) -> None:
+        """Store a value; expires_at (a timestamp of the cache clock) takes precedence over ttl."""
+        if expires_at is None:
+            expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > self._clock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def items(self) -> Iterator[Tuple[Hashable, Any, float]]:
+        """Iterate over a snapshot of the valid entries as (key, value, expires_at)."""
+        now = self._clock()
+        with self._lock:
+            entries = [(key, value, expires_at) for key, (value, expires_at) in self._entries.items()
+                       if expires_at > now]
+        return iter(entries)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+__all__ = ["Cache", "TTLCache"]
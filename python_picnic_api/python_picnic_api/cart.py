@@ -0,0 +1,155 @@
+from dataclasses import dataclass, replace
+from typing import Iterable, Iterator, List, Dict
+
+
+@dataclass(frozen=True, slots=True)
+class CartLine:
+    """A single product line of the shopping cart."""
+    product_id: str
+    name: str
+    count: int
+    price: int
+    display_price: int
+    unit_quantity: str | None = None
+
+    @classmethod
+    def from_order_line(cls, order_line: dict) -> "CartLine | None":
+        """Build a cart line from an ORDER_LINE entry of the cart payload."""
+        articles = order_line.get("items") or []
+        if not articles:
+            return None
+        article = articles[0]
+        count = next(
+            (decorator.get("quantity", 1) for decorator in article.get("decorators", [])
+             if decorator.get("type") == "QUANTITY"), 1
+        )
+        display_price = order_line.get("display_price", article.get("price", 0))
+        return cls(
+            product_id=article["id"],
+            name=article.get("name", ""),
+            count=int(count),
+            price=int(article.get("price", display_price)),
+            display_price=int(display_price),
+            unit_quantity=article.get("unit_quantity"),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class CartDiff:
+    """Difference between two versions of the shopping cart."""
+    added: tuple[CartLine, ...] = ()
+    removed: tuple[CartLine, ...] = ()
+    changed: tuple[tuple[CartLine, CartLine], ...] = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+class Cart:
+    """Shopping cart indexed by product id.
+
+    Carts are immutable snapshots. A new snapshot is built from every cart payload that Picnic returns (the cart
+    endpoints as well as add/remove/clear all return the full cart), reusing unchanged lines of the previous
+    snapshot so that diffing two versions only has to compare the lines that actually changed.
+    """
+    __slots__ = ("_lines", "total_count", "total_price", "version")
+
+    def __init__(
+            self, lines: Iterable[CartLine] = (), total_count: int | None = None, total_price: int | None = None,
+            version: int = 0
+    ):
+        self._lines: Dict[str, CartLine] = {}
+        for line in lines:
+            existing = self._lines.get(line.product_id)
+            if existing:
+                line = CartLine(line.product_id, line.name, existing.count + line.count, line.price,
+                                existing.display_price + line.display_price, line.unit_quantity)
+            self._lines[line.product_id] = line
+        self.total_count = total_count if total_count is not None else sum(x.count for x in self._lines.values())
+        self.total_price = total_price if total_price is not None else sum(
+            x.display_price for x in self._lines.values())
+        self.version = version
+
+    @classmethod
+    def from_payload(cls, payload: dict, previous: "Cart | None" = None) -> "Cart":
+        """Build a cart from a Picnic cart payload, reusing identical lines of the previous version."""
+        lines = []
+        for order_line in payload.get("items", []):
+            line = CartLine.from_order_line(order_line)
+            if line is None:
+                continue
+            if previous is not None:
+                previous_line = previous._lines.get(line.product_id)
+                if previous_line == line:
+                    line = previous_line
+            lines.append(line)
+        version = previous.version + 1 if previous is not None else 0
+        return cls(lines, payload.get("total_count"), payload.get("total_price"), version)
+
+    def __contains__(self, product_id: object) -> bool:
+        return product_id in self._lines
+
+    def __iter__(self) -> Iterator[CartLine]:
+        return iter(self._lines.values())
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def get(self, product_id: str) -> CartLine | None:
+        return self._lines.get(product_id)
+
+    def name_of(self, product_id: str) -> str | None:
+        line = self._lines.get(product_id)
+        return line.name if line else None
+
+    def with_change(
+            self, product_id: str, count_delta: int, name: str | None = None, price: int | None = None
+    ) -> "Cart":
+        """Return a predicted cart in which the count of a product changed by count_delta.
+
+        The name and unit price are only used if the product is not in the cart yet.
+        """
+        lines = dict(self._lines)
+        old_line = lines.get(product_id)
+        if old_line is None:
+            if count_delta <= 0:
+                return self
+            unit_price = price or 0
+            new_line: CartLine | None = CartLine(product_id, name or "", count_delta, unit_price,
+                                                 unit_price * count_delta)
+        elif old_line.count + count_delta > 0:
+            count = old_line.count + count_delta
+            new_line = replace(old_line, count=count, display_price=old_line.price * count)
+        else:
+            new_line = None
+
+        if new_line is None:
+            del lines[product_id]
+        else:
+            lines[product_id] = new_line
+        old_count, old_price = (old_line.count, old_line.display_price) if old_line else (0, 0)
+        new_count, new_price = (new_line.count, new_line.display_price) if new_line else (0, 0)
+        return Cart(lines.values(), self.total_count + new_count - old_count,
+                    self.total_price + new_price - old_price, self.version)
+
+    def diff(self, other: "Cart") -> CartDiff:
+        """Return what changed when going from this cart to the other cart."""
+        if other is self:
+            return CartDiff()
+        added, changed = [], []
+        for product_id, line in other._lines.items():
+            old_line = self._lines.get(product_id)
+            if old_line is None:
+                added.append(line)
+            elif old_line is not line and old_line != line:
+                changed.append((old_line, line))
+        removed = [line for product_id, line in self._lines.items() if product_id not in other._lines]
+        return CartDiff(tuple(added), tuple(removed), tuple(changed))
+
+    def to_products(self) -> List[dict]:
+        """Return the cart lines in the flat format that is handed to the language model."""
+        return [{"price": line.display_price, "product_name": line.name, "product_id": line.product_id}
+                for line in self._lines.values()]
+
+
+__all__ = ["Cart", "CartDiff", "CartLine"]
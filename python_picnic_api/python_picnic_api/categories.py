@@ -0,0 +1,196 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, List, Set, TextIO
+
+from .client import PicnicAPI
+from .helper import _tree_label, _tree_generator
+
+# Levels of the Picnic catalog: top-level categories, their subcategories, and the products of a subcategory.
+TOP_LEVEL = 1
+SUBCATEGORY_LEVEL = 2
+PRODUCT_LEVEL = 3
+# Maximum number of categories that a search loads, if the categories that were already loaded do not match.
+MAX_FIND_LOADS = 8
+
+
+@dataclass(eq=False)
+class CategoryNode:
+    """A category or product of the catalog, whose children are loaded when they are first browsed."""
+    item: dict
+    level: int
+    parent: "CategoryNode | None" = None
+    # None until the children were loaded.
+    children: "List[CategoryNode] | None" = field(default=None, repr=False)
+
+    @property
+    def id(self) -> str:
+        return str(self.item.get("id", ""))
+
+    @property
+    def name(self) -> str:
+        return str(self.item.get("name", ""))
+
+    @property
+    def path(self) -> str:
+        """Names of the node and its ancestors, e.g. "Dairy & eggs / Milk"."""
+        return self.name if self.parent is None else f"{self.parent.path} / {self.name}"
+
+    @property
+    def is_category(self) -> bool:
+        return self.level < PRODUCT_LEVEL
+
+
+class LazyCategoryTree:
+    """The category tree of Picnic, loaded one category at a time while it is browsed.
+
+    Only the top-level categories are fetched up front. The children of a category are fetched when they are first
+    asked for and kept on its node, and the next siblings of the category are loaded in the background, as they are
+    likely browsed next. Responses are also cached by the client, so a new tree of the same client does not fetch
+    them again.
+
+    Args:
+        api: Picnic client used to fetch the categories.
+        prefetch_siblings: Number of following siblings whose children are loaded in the background when a category
+            is browsed, 0 to disable prefetching.
+        max_workers: Maximum number of categories that are loaded at the same time.
+    """
+
+    def __init__(self, api: PicnicAPI, prefetch_siblings: int = 4, max_workers: int = 4):
+        self._api = api
+        self.prefetch_siblings = prefetch_siblings
+        self._max_workers = max_workers
+        self._roots: List[CategoryNode] | None = None
+        self._lock = threading.Lock()
+        # Categories whose children are being loaded in the background.
+        self._prefetching: Set[CategoryNode] = set()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def roots(self) -> List[CategoryNode]:
+        """Return the top-level categories."""
+        if self._roots is None:
+            items = self._api.get_categories(depth=0)
+            with self._lock:
+                if self._roots is None:
+                    self._roots = [CategoryNode(item, TOP_LEVEL) for item in items]
+        return self._roots
+
+    def children(self, node: CategoryNode) -> List[CategoryNode]:
+        """Return the subcategories or products of a category, loading them on first use."""
+        if not node.is_category:
+            return []
+        children = self._load(node)
+        if self.prefetch_siblings:
+            self._prefetch(node)
+        return children
+
+    def find(self, query: str, max_loads: int = MAX_FIND_LOADS) -> CategoryNode | None:
+        """Return the category whose name or id is the query or contains it, ignoring case.
+
+        The categories that were already loaded, e.g. browsed or prefetched, are searched first, top-level
+        categories before subcategories. Without a match, the subcategories of the other top-level categories are
+        loaded in order, as many at the same time as there are workers, until one matches or max_loads categories
+        were loaded. Exact matches win over partial ones among the categories that are searched together.
+        """
+        query = " ".join(query.lower().split())
+        roots = self.roots()
+        loaded = [child for node in roots if node.children is not None for child in node.children]
+        for nodes in (roots, loaded):
+            if match := _match(nodes, query):
+                return match
+
+        unloaded = [node for node in roots if node.children is None]
+        while unloaded and max_loads > 0:
+            size = min(self._max_workers, max_loads)
+            batch, unloaded = unloaded[:size], unloaded[size:]
+            max_loads -= len(batch)
+            if match := _match([child for children in self._load_all(batch) for child in children], query):
+                return match
+        return None
+
+    def lines(self, node: CategoryNode | None = None, depth: int = 1) -> Iterator[str]:
+        """Yield the tree below a node, or below the top level, line by line down to the given depth.
+
+        Categories are loaded while the lines are generated, so the first lines are available before the whole
+        subtree was fetched.
+        """
+        nodes = self.roots() if node is None else self.children(node)
+        last_level = (node.level if node is not None else 0) + depth
+        return _tree_generator(nodes, children=lambda child: self.children(child) if child.level < last_level else None,
+                               label=lambda child: _tree_label(child.item))
+
+    def write(self, node: CategoryNode | None = None, depth: int = 1, file: TextIO | None = None) -> None:
+        """Print the tree below a node line by line, as it is loaded."""
+        for line in self.lines(node, depth):
+            print(line, file=file)
+
+    def close(self) -> None:
+        """Stop loading categories in the background."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self, node: CategoryNode) -> List[CategoryNode]:
+        if node.children is not None:
+            return node.children
+        if node.level == TOP_LEVEL:
+            items = self._api.get_category_children(node.id)
+        else:
+            items = self._api.get_category_children(node.id, parent_id=node.parent.id if node.parent else None)
+        with self._lock:
+            if node.children is None:
+                node.children = [self._node(item, node) for item in items]
+        return node.children
+
+    @staticmethod
+    def _node(item: dict, parent: CategoryNode) -> CategoryNode:
+        node = CategoryNode(item, parent.level + 1, parent)
+        # Products that are embedded in a subcategory do not have to be fetched again.
+        if node.is_category and isinstance(item.get("items"), list):
+            node.children = [CategoryNode(child, node.level + 1, node) for child in item["items"]]
+        return node
+
+    def _prefetch(self, node: CategoryNode) -> None:
+        siblings = self.roots() if node.parent is None else node.parent.children or []
+        index = next((index for index, sibling in enumerate(siblings) if sibling is node), len(siblings))
+        with self._lock:
+            following = [sibling for sibling in siblings[index + 1:index + 1 + self.prefetch_siblings]
+                         if sibling.children is None and sibling not in self._prefetching]
+            self._prefetching.update(following)
+        for sibling in following:
+            self._get_executor().submit(self._prefetch_load, sibling)
+
+    def _prefetch_load(self, node: CategoryNode) -> None:
+        try:
+            self._load(node)
+        except Exception:
+            # Browsing the category will fetch it again and report the error.
+            pass
+        finally:
+            with self._lock:
+                self._prefetching.discard(node)
+
+    def _load_all(self, nodes: List[CategoryNode]) -> List[List[CategoryNode]]:
+        """Load the children of several categories at the same time."""
+        if len(nodes) <= 1:
+            return [self._load(node) for node in nodes]
+        return list(self._get_executor().map(self._load, nodes))
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix="picnic-categories")
+            return self._executor
+
+
+def _match(nodes: List[CategoryNode], query: str) -> CategoryNode | None:
+    """Return the first category whose name or id is the query, or else the first whose name contains it."""
+    categories = [node for node in nodes if node.is_category]
+    for matches in (lambda node: query in (node.name.lower(), node.id.lower()),
+                    lambda node: query in node.name.lower()):
+        if match := next((node for node in categories if matches(node)), None):
+            return match
+    return None
+
+
+__all__ = ["CategoryNode", "LazyCategoryTree"]
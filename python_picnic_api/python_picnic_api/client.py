@@ -1,63 +1,162 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from hashlib import md5
-from typing import List, Dict
-
-from .helper import _tree_generator, _url_generator, _get_category_name, _extract_search_results, \
-    _extract_recipe_search_results, _extract_recipe_ingredients
+from typing import List, Dict, TextIO, Tuple
+
+from .helper import _tree_generator, _url_generator, _get_category_name, _paginate, _merge_ingredients, \
+    _normalize_search_terms, _list_articles
+from . import codec
+from .cache import Cache, TTLCache
+from .parsing import Parser, ParsingExecutor, parse_search_results, parse_recipe_search_results, \
+    parse_recipe_ingredients
 from .session import PicnicAPISession, PicnicAuthError
+from .shared_cache import SharedCacheStore, user_namespace
+from .singleflight import SingleFlight, SingleFlightStats
 from requests import Response
 
 DEFAULT_URL = "https://storefront-prod.{}.picnicinternational.com/api/{}"
 DEFAULT_COUNTRY_CODE = "DE"
 DEFAULT_API_VERSION = "15"
+# Recipe pages and articles rarely change, so they are cached for an hour.
+DETAILS_CACHE_TTL = 3600
+SEARCH_CACHE_TTL = 900
+CATEGORIES_CACHE_TTL = 24 * 3600
+# Recipe searches are cached with this many results, pages are cut from the cached results.
+MAX_RECIPE_SEARCH_RESULTS = 50
+MAX_PARALLEL_RECIPE_REQUESTS = 4
+MAX_PARALLEL_SEARCH_REQUESTS = 4
+MAX_PARALLEL_CART_REQUESTS = 4
+
+logger = logging.getLogger(__name__)
+
+_PARSE_RECIPE_SEARCH = partial(parse_recipe_search_results, max_items=MAX_RECIPE_SEARCH_RESULTS)
+
+# Shared by all clients, so that identical GET requests of concurrent conversations of the same user are sent once.
+_GET_FLIGHTS = SingleFlight()
 
 
 class PicnicAPI:
     def __init__(
             self, username: str | None = None, password: str | None = None,
-            country_code: str | None = DEFAULT_COUNTRY_CODE, auth_token: str | None = None
+            country_code: str | None = DEFAULT_COUNTRY_CODE, auth_token: str | None = None,
+            single_flight: SingleFlight | None = None, parsing_executor: ParsingExecutor | None = None,
+            cache_store: SharedCacheStore | None = None, base_url: str | None = None
     ):
         self._country_code = country_code
-        self._base_url = _url_generator(
+        # The Picnic API of the country, unless another URL is given, e.g. of a stub server.
+        self._base_url = base_url or _url_generator(
             DEFAULT_URL, self._country_code, DEFAULT_API_VERSION
         )
 
         self.session = PicnicAPISession(auth_token=auth_token)
+        self._single_flight = single_flight or _GET_FLIGHTS
+        # Parses search and recipe pages; without one they are parsed in the calling thread.
+        self.parsing_executor = parsing_executor
+        # Holds the caches if they are shared with other processes; without one they are kept in this process.
+        self.cache_store = cache_store
 
         # Login if not authenticated
         if not self.session.authenticated and username and password:
             self.login(username, password)
 
         self.high_level_categories: List[dict] | None = None
+        self.recipe_ingredients_cache = self._cache("recipe_ingredients", maxsize=128, ttl=DETAILS_CACHE_TTL)
+        self.article_cache = self._cache("articles", maxsize=256, ttl=DETAILS_CACHE_TTL)
+        self.search_cache = self._cache("search", maxsize=256, ttl=SEARCH_CACHE_TTL)
+        self.categories_cache = self._cache("categories", maxsize=8, ttl=CATEGORIES_CACHE_TTL)
+        # Subcategories and products of single categories, which are browsed one at a time.
+        self.category_lists_cache = self._cache("category_lists", maxsize=512, ttl=CATEGORIES_CACHE_TTL)
+        # Runs the searches of search_many, created on first use.
+        self._search_executor: ThreadPoolExecutor | None = None
+        self._search_executor_lock = threading.Lock()
+
+    def _cache(self, name: str, maxsize: int, ttl: float) -> Cache:
+        """Return a cache of this process, or a namespace of the shared cache store.
+
+        Shared namespaces belong to the user of the current auth token, so responses are never shared between users.
+        """
+        if self.cache_store is None:
+            return TTLCache(maxsize=maxsize, ttl=ttl)
+        return self.cache_store.cache(lambda: f"{user_namespace(self.session.auth_token)}/{name}", maxsize, ttl)
 
     def initialize_high_level_categories(self) -> None:
         """Initialize high-level categories once to avoid multiple requests."""
         if not self.high_level_categories:
             self.high_level_categories = self.get_categories(depth=1)
 
+    @property
+    def single_flight_stats(self) -> SingleFlightStats:
+        """Counters of GET requests that were deduplicated with identical requests already in flight."""
+        return self._single_flight.stats
+
     def _get(self, path: str, add_picnic_headers: bool = False) -> dict:
+        """Do a GET request, sharing the parsed response with identical requests that are already in flight.
+
+        Requests are only shared between callers with the same auth token, so one user never gets another user's
+        response. The shared response must not be mutated.
+        """
         url = self._base_url + path
+        key = (url, add_picnic_headers, self.session.auth_token)
+        return self._single_flight.do(key, lambda: self._fetch(url, add_picnic_headers))
 
-        # Make the request, add special picnic headers if needed
-        headers = {
-            "x-picnic-agent": "30100;1.15.269-#15289;",
-            "x-picnic-did": "543809EC162F0B0B"
-        } if add_picnic_headers else None
-        response = self.session.get(url, headers=headers).json()
+    def _fetch(self, url: str, add_picnic_headers: bool = False) -> dict:
+        started_at = time.perf_counter()
+        content = self.session.get(url, headers=_picnic_headers(add_picnic_headers)).content
+        _log_request("GET", url, started_at, content)
+        response = codec.loads(content)
 
         if self._contains_auth_error(response):
             raise PicnicAuthError("Picnic authentication error")
 
         return response
 
-    def _post(self, path: str, data: dict | None = None, add_picnic_headers: bool = False) -> Response:
+    def _get_parsed(self, path: str, parser: Parser, add_picnic_headers: bool = False) -> dict:
+        """Do a GET request and parse the raw response with the parsing executor, sharing the result like _get."""
         url = self._base_url + path
+        key = (url, add_picnic_headers, self.session.auth_token, parser)
+        return self._single_flight.do(key, lambda: self._fetch_parsed(url, parser, add_picnic_headers))
+
+    def _fetch_parsed(self, url: str, parser: Parser, add_picnic_headers: bool = False) -> dict:
+        started_at = time.perf_counter()
+        content = self.session.get(url, headers=_picnic_headers(add_picnic_headers)).content
+        _log_request("GET", url, started_at, content)
+        if self.parsing_executor is None:
+            response = parser(content)
+        else:
+            response = self.parsing_executor.parse(parser, content)
+
+        if self._contains_auth_error(response):
+            raise PicnicAuthError("Picnic authentication error")
+
+        return response
+
+    def _get_cached(
+            self, cache: Cache, key: str, path: str, add_picnic_headers: bool = False, parser: Parser | None = None
+    ) -> dict:
+        """Do a GET request through a cache, which only stores responses without error.
 
-        # Make the request, add special picnic headers if needed
-        headers = {
-            "x-picnic-agent": "30100;1.15.269-#15289;",
-            "x-picnic-did": "543809EC162F0B0B"
-        } if add_picnic_headers else None
-        response = self.session.post(url, json=data, headers=headers).json()
+        With a parser, the parsed response is cached instead of the response.
+        """
+        response = cache.get(key)
+        if response is None:
+            if parser is None:
+                response = self._get(path, add_picnic_headers=add_picnic_headers)
+            else:
+                response = self._get_parsed(path, parser, add_picnic_headers=add_picnic_headers)
+            if not (isinstance(response, dict) and response.get("error")):
+                cache.set(key, response)
+        return response
+
+    def _post(self, path: str, data: dict | None = None, add_picnic_headers: bool = False) -> Response:
+        url = self._base_url + path
+        headers = _picnic_headers(add_picnic_headers)
+        started_at = time.perf_counter()
+        content = self.session.post(url, json=data, headers=headers).content
+        _log_request("POST", url, started_at, content)
+        response = codec.loads(content)
 
         if self._contains_auth_error(response):
             raise PicnicAuthError(f"Picnic authentication error: {response['error'].get('message')}")
@@ -87,30 +186,112 @@ class PicnicAPI:
 
     def search(self, term: str) -> List[Dict]:
         path = f"/pages/search-page-results?search_term={term}"
-        raw_results = self._get(path, add_picnic_headers=True)
-        search_results = _extract_search_results(raw_results)
-        return [search_results]
+        return [self._get_cached(self.search_cache, f"products:{term}", path, True, parse_search_results)]
+
+    def search_many(self, terms: List[str]) -> Dict[str, Dict]:
+        """Search several terms at once, e.g. the items of a shopping list.
 
-    def search_recipe(self, term: str) -> List[Dict]:
+        Terms are lower-cased and their whitespace is collapsed; empty and duplicate terms are dropped. The searches
+        run on a thread pool of this client that all calls share, so that at most MAX_PARALLEL_SEARCH_REQUESTS
+        searches are in flight, however many lists are searched at the same time.
+
+        Returns:
+            dict: The search result of every normalized term, in the order of the terms, like search returns it.
+        """
+        terms = _normalize_search_terms(terms)
+        if len(terms) <= 1:
+            return {term: self.search(term)[0] for term in terms}
+        with self._search_executor_lock:
+            if self._search_executor is None:
+                self._search_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_SEARCH_REQUESTS,
+                                                           thread_name_prefix="picnic-search")
+        results = self._search_executor.map(self.search, terms)
+        return {term: result[0] for term, result in zip(terms, results)}
+
+    def search_recipe(self, term: str, max_items: int = 10, offset: int = 0) -> List[Dict]:
+        """Search recipes. Returns a page of results with id, name, image id, preparation time and servings,
+        and the offset of the next page (None on the last page)."""
         path = f"/pages/search-page-results?search_term={term}&is_recipe=true&selected_sorting=RELEVANCE"
-        raw_results = self._get(path, add_picnic_headers=True)
-        search_results = _extract_recipe_search_results(raw_results)
-        return [search_results]
+        search_results = self._get_cached(self.search_cache, f"recipes:{term}", path, True, _PARSE_RECIPE_SEARCH)
+        return [_paginate(search_results["items"], max_items, offset)]
 
-    def add_recipe_to_cart(self, recipe_id: str = "665d879b27b9fb2099389e95") -> Response:
+    def get_recipe_ingredients(self, recipe_id: str) -> dict:
+        """Get the default portions and core ingredients of a recipe, which are cached.
+
+        Returns:
+            dict: "portions", "core_ingredients" and "error", which is empty if the recipe was found.
+        """
         path = f"/pages/recipe-details-page?recipe_id={recipe_id}"
-        raw_results = self._get(path, add_picnic_headers=True)
-        body = raw_results.get("body", {})
-        child = body.get("child", {})
-        state = child.get("state", {})
-        portions = state.get("servingsState", 1)
+        return self._get_cached(self.recipe_ingredients_cache, recipe_id, path, True, parse_recipe_ingredients)
+
+    def add_recipe_to_cart(self, recipe_id: str = "665d879b27b9fb2099389e95") -> Response:
+        recipe = self.get_recipe_ingredients(recipe_id)
+        if recipe["error"]:
+            return recipe
+        return self._assign_recipe(recipe_id, recipe["portions"], None, recipe["core_ingredients"])
 
-        core_ingredients = _extract_recipe_ingredients(raw_results)
+    def _assign_recipe(self, recipe_id: str, portions: int, day_offset: int | None, core_ingredients: list) -> Response:
         path = "/pages/task/assign-recipe-to-day"
-        payload = {"payload": {"recipe_id": recipe_id, "portions": portions, "day_offset": None,
+        payload = {"payload": {"recipe_id": recipe_id, "portions": portions, "day_offset": day_offset,
                                "core_ingredients": core_ingredients}}
         return self._post(path, payload, True)
 
+    def plan_meals(
+            self, recipe_ids: List[str], portions: int | None = None, first_day_offset: int = 0,
+            max_parallel: int = MAX_PARALLEL_RECIPE_REQUESTS
+    ) -> dict:
+        """Add several recipes to the cart, one per day starting at first_day_offset.
+
+        The recipe details are fetched concurrently, and core ingredients that several recipes share are added with
+        the first recipe that needs them, in the quantities of all of them added up. Recipes are assigned with at
+        most max_parallel requests in flight; a recipe whose assignment fails does not stop the others.
+
+        Args:
+            recipe_ids: Recipes in the order of the days they are planned for; duplicates are planned once.
+            portions: Portions of every recipe, or None for the default servings of each recipe.
+            first_day_offset: Day offset of the first recipe.
+            max_parallel: Maximum number of concurrent requests.
+
+        Returns:
+            dict: "recipes" with recipe_id, day_offset, portions, ingredient_count and error (a Picnic error code or
+            None) per recipe, "shared_ingredient_count" with the number of ingredients that were merged into the
+            recipe that needs them first, and "cart" with the cart after all assignments.
+        """
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(recipe_ids))),
+                                thread_name_prefix="picnic-plan-meals") as executor:
+            details = list(executor.map(self._planned_recipe, recipe_ids))
+
+            planned = [entry for entry in details if entry["error"] is None]
+            ingredient_lists, shared_ingredient_count = _merge_ingredients(
+                [entry.pop("core_ingredients") for entry in planned])
+            assignments = []
+            for day, (entry, core_ingredients) in enumerate(zip(planned, ingredient_lists)):
+                entry.update(day_offset=first_day_offset + day, ingredient_count=len(core_ingredients),
+                             portions=portions or entry["portions"])
+                assignments.append(executor.submit(self._assign_recipe, entry["recipe_id"], entry["portions"],
+                                                   entry["day_offset"], core_ingredients))
+            for entry, assignment in zip(planned, assignments):
+                try:
+                    entry["error"] = assignment.result().get("error", {}).get("code")
+                except Exception as e:
+                    entry["error"] = type(e).__name__
+
+        for entry in details:
+            entry.pop("core_ingredients", None)
+        return {"recipes": details, "shared_ingredient_count": shared_ingredient_count, "cart": self.get_cart()}
+
+    def _planned_recipe(self, recipe_id: str) -> dict:
+        """Get the ingredients of a recipe to plan, with the error code if they are not available."""
+        recipe = self.get_recipe_ingredients(recipe_id)
+        entry: dict = {"recipe_id": recipe_id, "day_offset": None, "portions": recipe.get("portions"),
+                       "ingredient_count": 0, "error": None}
+        if recipe["error"]:
+            entry["error"] = recipe["error"].get("code") or "UNKNOWN_ERROR"
+        else:
+            entry["core_ingredients"] = recipe["core_ingredients"]
+        return entry
+
     def get_lists(self, list_id: str | None = None) -> dict:
         if list_id:
             path = "/lists/" + list_id
@@ -135,8 +316,9 @@ class PicnicAPI:
 
     def get_article(self, article_id: str, add_category_name: bool = False) -> dict:
         path = "/articles/" + article_id
-        article = self._get(path)
+        article = self._get_cached(self.article_cache, article_id, path)
         if add_category_name and "category_link" in article:
+            article = dict(article)
             self.initialize_high_level_categories()
             article.update(
                 category_name=_get_category_name(article['category_link'], self.high_level_categories)
@@ -158,12 +340,138 @@ class PicnicAPI:
     def clear_cart(self) -> Response:
         return self._post("/cart/clear")
 
+    def update_cart(self, changes: Dict[str, int], max_parallel: int = MAX_PARALLEL_CART_REQUESTS) -> dict:
+        """Change the counts of several products at once: positive counts are added, negative counts removed.
+
+        Picnic has no endpoint that changes several products, so the changes are sent concurrently with at most
+        max_parallel requests in flight, and the cart is fetched once after all of them were answered.
+
+        Returns:
+            dict: "errors" with the Picnic error code of every change that failed, by product id, and "cart" with the
+            cart after all changes.
+        """
+        changes = {product_id: count for product_id, count in changes.items() if count}
+        errors = {}
+        request_seconds = 0.0
+        if changes:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(changes))),
+                                    thread_name_prefix="picnic-cart-update") as executor:
+                responses = executor.map(self._change_product, changes, changes.values())
+                for product_id, (response, seconds) in zip(changes, responses):
+                    request_seconds += seconds
+                    if response.get("error"):
+                        errors[product_id] = response["error"].get("code", "UNKNOWN_ERROR")
+        return {"errors": errors, "cart": self.get_cart(), "request_seconds": request_seconds}
+
+    def _change_product(self, product_id: str, count: int) -> Tuple[Response, float]:
+        started_at = time.perf_counter()
+        if count > 0:
+            response = self.add_product(product_id, count)
+        else:
+            response = self.remove_product(product_id, -count)
+        return response, time.perf_counter() - started_at
+
+    def reorder_list(
+            self, list_id: str, sublist_id: str | None = None, max_parallel: int = MAX_PARALLEL_CART_REQUESTS
+    ) -> dict:
+        """Add all products of a list or sublist to the cart at once, e.g. the products bought last week.
+
+        Sublists that the list returns without their products are fetched concurrently. Products that the list
+        names by id only are resolved to their articles, which are cached. All products are then added with one
+        update_cart, instead of one tool call, search and add per product.
+
+        Args:
+            list_id: ID of the list.
+            sublist_id: ID of the sublist, or None for all sublists of the list.
+            max_parallel: Maximum number of concurrent requests.
+
+        Returns:
+            dict: "items" with product_id, name, count and error (a Picnic error code or None) per product,
+            "failed_sublists" with sublist_id and error per sublist whose products could not be read, "cart" with the
+            cart after all additions, "seconds" with the time the additions took and "sequential_seconds" with the
+            time their requests would have taken one after another. If the list could not be read, "error" with its
+            Picnic error code and no items instead.
+        """
+        started_at = time.perf_counter()
+        failed_sublists: List[dict] = []
+        with ThreadPoolExecutor(max_workers=max(1, max_parallel), thread_name_prefix="picnic-reorder") as executor:
+            if sublist_id:
+                entries = self.get_sublist(list_id, sublist_id)
+            else:
+                entries = self.get_lists(list_id)
+                if isinstance(entries, list):
+                    missing = [entry["id"] for entry in entries
+                               if entry.get("type") == "CATEGORY" and "items" not in entry]
+                    sublists = dict(zip(missing, executor.map(partial(self.get_sublist, list_id), missing)))
+                    for missing_id, sublist in sublists.items():
+                        if isinstance(sublist, dict) and sublist.get("error"):
+                            failed_sublists.append({"sublist_id": missing_id,
+                                                    "error": sublist["error"].get("code", "UNKNOWN_ERROR")})
+                    entries = [{**entry, "items": sublists[entry["id"]]} if entry.get("id") in sublists else entry
+                               for entry in entries]
+            if isinstance(entries, dict):
+                if entries.get("error"):
+                    return {"error": entries["error"].get("code", "UNKNOWN_ERROR"), "items": []}
+                entries = entries.get("items", [])
+
+            items: List[dict] = [{"product_id": product_id, "name": name, "count": count, "error": None}
+                                 for product_id, (count, name) in _list_articles(entries).items()]
+            unnamed = [item for item in items if not item["name"]]
+            for item, article in zip(unnamed, executor.map(self.get_article, [item["product_id"] for item in unnamed])):
+                if article.get("error"):
+                    item["error"] = article["error"].get("code", "UNKNOWN_ERROR")
+                else:
+                    item["name"] = article.get("name")
+
+        update_started_at = time.perf_counter()
+        result = self.update_cart({item["product_id"]: item["count"] for item in items if item["error"] is None},
+                                  max_parallel=max_parallel)
+        for item in items:
+            item["error"] = item["error"] or result["errors"].get(item["product_id"])
+        # One after another, every addition would wait for the previous one, after the list was read.
+        return {"items": items, "failed_sublists": failed_sublists, "cart": result["cart"],
+                "seconds": time.perf_counter() - started_at,
+                "sequential_seconds": update_started_at - started_at + result["request_seconds"]}
+
     def get_categories(self, depth: int = 0) -> List[Dict]:
-        return self._get(f"/my_store?depth={depth}")["catalog"]
+        return self._get_cached(self.categories_cache, str(depth), f"/my_store?depth={depth}")["catalog"]
+
+    def get_category_children(self, category_id: str, parent_id: str | None = None) -> List[Dict]:
+        """Get the children of one category, without loading the rest of the catalog.
+
+        Args:
+            category_id (str): ID of the category.
+            parent_id (str): ID of the top-level category that the category belongs to, if it is a subcategory.
+
+        Returns:
+            list: Subcategories of a top-level category, or products of a subcategory.
+        """
+        path = f"/lists/{parent_id}?sublist={category_id}" if parent_id else f"/lists/{category_id}"
+        response = self._get_cached(self.category_lists_cache, path, path)
+        if isinstance(response, dict):
+            return [] if response.get("error") else response.get("items", [])
+        return response
+
+    def print_categories(self, depth: int = 0, file: TextIO | None = None) -> None:
+        """Print the category tree line by line, without building the whole tree as one string first."""
+        for line in _tree_generator(self.get_categories(depth=depth)):
+            print(line, file=file)
+
+
+def _log_request(method: str, url: str, started_at: float, content: bytes) -> None:
+    # Checked first, so that disabled request logging costs no formatting.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("picnic_request", extra={"fields": {
+            "method": method, "url": url, "ms": round((time.perf_counter() - started_at) * 1000, 1),
+            "bytes": len(content)}})
+
 
-    def print_categories(self, depth: int = 0) -> None:
-        tree = "\n".join(_tree_generator(self.get_categories(depth=depth)))
-        print(tree)
+def _picnic_headers(add_picnic_headers: bool) -> dict | None:
+    # Special picnic headers that some endpoints need
+    return {
+        "x-picnic-agent": "30100;1.15.269-#15289;",
+        "x-picnic-did": "543809EC162F0B0B"
+    } if add_picnic_headers else None
 
 
 __all__ = ["PicnicAPI"]
@@ -0,0 +1,87 @@
+"""JSON encoding and decoding of request and response bodies.
+
+The fastest installed backend is used by default: orjson, then msgspec, then the standard library. The environment
+variable PICNIC_JSON_CODEC selects a backend by name.
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+CODEC_ENVIRONMENT_VARIABLE = "PICNIC_JSON_CODEC"
+# Backends in the order of preference.
+PREFERRED_BACKENDS = ("orjson", "msgspec", "json")
+
+
+@dataclass(frozen=True)
+class JsonCodec:
+    """A JSON backend. loads accepts bytes or str, dumps returns compact UTF-8 encoded bytes."""
+    name: str
+    loads: Callable[[bytes | str], Any]
+    dumps: Callable[[Any], bytes]
+
+
+def _orjson() -> JsonCodec:
+    import orjson
+    return JsonCodec("orjson", orjson.loads, orjson.dumps)
+
+
+def _msgspec() -> JsonCodec:
+    import msgspec
+    return JsonCodec("msgspec", msgspec.json.Decoder().decode, msgspec.json.Encoder().encode)
+
+
+def _stdlib() -> JsonCodec:
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    return JsonCodec("json", json.loads, dumps)
+
+
+_BACKENDS: Dict[str, Callable[[], JsonCodec]] = {"orjson": _orjson, "msgspec": _msgspec, "json": _stdlib}
+
+_default: JsonCodec | None = None
+
+
+def get_codec(name: str) -> JsonCodec:
+    """Return the codec of a backend. Raises ImportError if the backend is not installed."""
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown JSON codec {name!r}, must be one of: {', '.join(_BACKENDS)}")
+    return _BACKENDS[name]()
+
+
+def available_codecs() -> list[JsonCodec]:
+    """Return the codecs of all installed backends, in the order of preference."""
+    codecs = []
+    for name in PREFERRED_BACKENDS:
+        try:
+            codecs.append(get_codec(name))
+        except ImportError:
+            pass
+    return codecs
+
+
+def default_codec() -> JsonCodec:
+    """Return the codec that is used for Picnic requests and responses."""
+    global _default
+    if _default is None:
+        name = os.environ.get(CODEC_ENVIRONMENT_VARIABLE)
+        _default = get_codec(name) if name else available_codecs()[0]
+    return _default
+
+
+def set_default_codec(codec: JsonCodec | None) -> None:
+    """Use another codec for Picnic requests and responses; None selects it again on next use."""
+    global _default
+    _default = codec
+
+
+def loads(content: bytes | str) -> Any:
+    return default_codec().loads(content)
+
+
+def dumps(value: Any) -> bytes:
+    return default_codec().dumps(value)
+
+
+__all__ = ["JsonCodec", "available_codecs", "default_codec", "dumps", "get_codec", "loads", "set_default_codec"]
@@ -1,6 +1,6 @@
 import json
 import re
-from typing import List, Generator
+from typing import Any, Callable, Dict, Iterable, List, Generator, Sequence, Tuple
 
 # prefix components:
 space = "    "
@@ -13,29 +13,51 @@ IMAGE_SIZES = ["small", "medium", "regular", "large", "extra-large"]
 IMAGE_BASE_URL = "https://storefront-prod.nl.picnicinternational.com/static/images"
 
 SOLE_ARTICLE_ID_PATTERN = re.compile(r'"sole_article_id":"(\w+)"')
+RECIPE_TILE_PREFIX = "recipe-tile__"
+# Recipe ids are 24 hexadecimal characters, e.g. 665d879b27b9fb2099389e95.
+RECIPE_ID_PATTERN = re.compile(r"[0-9a-f]{24}")
+PREPARATION_TIME_PATTERN = re.compile(r"(\d+)\s*min", re.IGNORECASE)
+SERVINGS_PATTERN = re.compile(r"(\d+)\s*(?:pers|portion|serving)", re.IGNORECASE)
 
 
-def _tree_generator(response: list, prefix: str = "") -> Generator:
+def _tree_label(item: dict) -> str | None:
+    """Return the line of a category or product in the tree, or None for items without a name."""
+    if "name" not in item:
+        return None
+    pre = ""
+    if "unit_quantity" in item.keys():
+        pre = f"{item['unit_quantity']} "
+    after = ""
+    if "display_price" in item.keys():
+        after = f" €{int(item['display_price']) / 100.0:.2f}"
+    return pre + item["name"] + after
+
+
+def _tree_items(item: dict) -> Sequence | None:
+    return item.get("items")
+
+
+def _tree_generator(
+        response: Sequence, prefix: str = "", children: Callable[[Any], Sequence | None] = _tree_items,
+        label: Callable[[Any], str | None] = _tree_label
+) -> Generator:
     """A recursive tree generator,
     will yield a visual tree structure line by line
-    with each line prefixed by the same characters
+    with each line prefixed by the same characters.
+    The children of an item are only asked for once its line was yielded,
+    so a lazy children function loads subtrees while the tree is written.
     """
     # response each get pointers that are ├── with a final └── :
     pointers = [tee] * (len(response) - 1) + [last]
     for pointer, item in zip(pointers, response):
-        if "name" in item:  # print the item
-            pre = ""
-            if "unit_quantity" in item.keys():
-                pre = f"{item['unit_quantity']} "
-            after = ""
-            if "display_price" in item.keys():
-                after = f" €{int(item['display_price']) / 100.0:.2f}"
-
-            yield prefix + pointer + pre + item["name"] + after
-        if "items" in item:  # extend the prefix and recurse:
+        line = label(item)
+        if line is not None:  # print the item
+            yield prefix + pointer + line
+        items = children(item)
+        if items:  # extend the prefix and recurse:
             extension = branch if pointer == tee else space
             # i.e. space because last, └── , above so no more |
-            yield from _tree_generator(item["items"], prefix=prefix + extension)
+            yield from _tree_generator(items, prefix=prefix + extension, children=children, label=label)
 
 
 def _url_generator(url: str, country_code: str, api_version: str) -> str:
@@ -111,38 +133,82 @@ def _extract_search_results(raw_results: dict, max_items: int = 10) -> dict:
     return {"items": search_results}
 
 
-def _extract_recipe_search_results(raw_results: dict, max_items: int = 10) -> dict:
-    """Extract recipe search results from the nested dictionary structure returned by Picnic recipe search.
-    Number of max items can be defined to reduce excessive nested search"""
-    search_results = []
+def _normalize_search_terms(terms: Iterable[str]) -> list[str]:
+    """Lower-case the terms and collapse their whitespace, dropping empty and duplicate terms but keeping the order."""
+    return list(dict.fromkeys(term for term in (" ".join(str(term).lower().split()) for term in terms) if term))
+
+
+def _paginate(items: list, max_items: int | None, offset: int = 0) -> dict:
+    """Return a page of items, with the offset of the next page or None if this is the last page."""
+    end = len(items) if max_items is None else offset + max_items
+    return {"items": items[offset:end], "next_offset": end if end < len(items) else None}
+
+
+def _recipe_tile_details(tile: dict) -> dict:
+    """Collect the image id, preparation time and servings from the components of a recipe tile."""
+    details: dict = {"image_id": None, "preparation_time": None, "servings": None}
+    stack: list = [tile.get("pml", {})]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, list):
+            stack.extend(reversed(value))
+            continue
+        if not isinstance(value, dict):
+            continue
+        source = value.get("source")
+        if details["image_id"] is None and isinstance(source, dict) and source.get("id"):
+            details["image_id"] = source["id"]
+        text = value.get("markdown") or value.get("text")
+        if isinstance(text, str):
+            if details["preparation_time"] is None and (match := PREPARATION_TIME_PATTERN.search(text)):
+                details["preparation_time"] = int(match.group(1))
+            if details["servings"] is None and (match := SERVINGS_PATTERN.search(text)):
+                details["servings"] = int(match.group(1))
+        stack.extend(child for key, child in value.items() if isinstance(child, (dict, list)) and key != "source")
+    return details
+
+
+def _extract_recipe_search_results(raw_results: dict, max_items: int | None = 10, offset: int = 0) -> dict:
+    """Extract recipe search results from the recipe tiles of the nested dictionary structure returned by Picnic.
+
+    Every result has the id, name, image id, preparation time in minutes and servings of the recipe, as far as the
+    tile shows them; the name is also kept under its former key "recipe_name". Ids are taken from the tile ids; the
+    recipe ids of the analytics context, which are in tile order, fill in tiles without one. The tree is walked once
+    and only until the requested page is complete.
+    """
+    search_results: list[dict] = []
+    # One tile more than the page, to know whether there is a next page.
+    limit = None if max_items is None else offset + max_items + 1
 
-    def find_articles(node: dict) -> None:
-        if len(search_results) >= max_items:
+    def find_recipes(node: dict) -> None:
+        if limit is not None and len(search_results) >= limit:
+            return
+        node_id = node.get("id", "")
+        if RECIPE_TILE_PREFIX in node_id:
+            component = node.get("pml", {}).get("component", {})
+            recipe_id = RECIPE_ID_PATTERN.search(node_id)
+            name = component.get("accessibilityLabel")
+            search_results.append({
+                "id": recipe_id.group(0) if recipe_id else None,
+                "name": name,
+                "recipe_name": name,
+                **_recipe_tile_details(node),
+            })
             return
-        if "recipe-tile__" in node.get("id", ""):
-            content = node.get("pml", {})
-            component = content.get("component", {})
-            recipe_name = component.get("accessibilityLabel", None)
-
-            search_results.append({"recipe_name": recipe_name})
 
         for child in node.get("children", []):
-            find_articles(child)
+            find_recipes(child)
 
-    body = raw_results.get("body", {})
-    child = body.get("child", {})
-    find_articles(child)
-    analytics = child.get("analytics", {})
-    contexts = analytics.get("contexts", [])
-    if len(contexts) > 0:
-        contexts = contexts[-1]
-        data = contexts.get("data", {})
-        recipe_ids = data.get("recipe_ids", [])
-        if len(recipe_ids) >= max_items:
-            for idx, search_result in enumerate(search_results):
-                search_result["id"] = recipe_ids[idx]
+    child = raw_results.get("body", {}).get("child", {})
+    find_recipes(child)
 
-    return {"items": search_results}
+    contexts = child.get("analytics", {}).get("contexts", [])
+    recipe_ids = contexts[-1].get("data", {}).get("recipe_ids", []) if contexts else []
+    for search_result, recipe_id in zip(search_results, recipe_ids):
+        if search_result["id"] is None:
+            search_result["id"] = recipe_id
+
+    return _paginate(search_results, max_items, offset)
 
 
 def _extract_recipe_ingredients(raw_results: dict) -> list[dict]:
@@ -163,3 +229,72 @@ def _extract_recipe_ingredients(raw_results: dict) -> list[dict]:
     child = child.get("child", {})
     find_articles(child)
     return ingredients[0]
+
+
+def _recipe_portions(raw_results: dict) -> int:
+    """Return the default servings of a recipe details page."""
+    return raw_results.get("body", {}).get("child", {}).get("state", {}).get("servingsState", 1)
+
+
+def _ingredient_key(ingredient: object) -> str:
+    """Identify a core ingredient, to find the same ingredient in several recipes."""
+    if isinstance(ingredient, dict):
+        for key in ("id", "ingredient_id", "selling_unit_id", "sellingUnitId"):
+            if ingredient.get(key):
+                return str(ingredient[key])
+    return json.dumps(ingredient, sort_keys=True)
+
+
+def _merge_ingredients(ingredient_lists: list[list]) -> tuple[list[list], int]:
+    """Merge the ingredients that several lists contain into the first list that contains them.
+
+    The merged ingredient is bought with the first list, with the quantities of all lists added up, and removed from
+    the later lists. Ingredients that are not dicts have no quantity and are kept in every list.
+
+    Returns the merged lists, in the same order, and the number of ingredients that were merged into an earlier list.
+    """
+    first: dict[str, dict] = {}
+    merged_lists = []
+    merged = 0
+    for ingredients in ingredient_lists:
+        kept = []
+        for ingredient in ingredients:
+            if not isinstance(ingredient, dict):
+                kept.append(ingredient)
+                continue
+            key = _ingredient_key(ingredient)
+            if key in first:
+                first[key]["quantity"] = first[key].get("quantity", 1) + ingredient.get("quantity", 1)
+                merged += 1
+                continue
+            # A copy, so that the cached ingredients of the recipe keep their own quantity.
+            first[key] = dict(ingredient)
+            kept.append(first[key])
+        merged_lists.append(kept)
+    return merged_lists, merged
+
+
+def _list_articles(entries: Sequence) -> Dict[str, Tuple[int, str | None]]:
+    """Collect the articles of list entries and their sublists as product id -> (count, name), summing duplicates.
+
+    The count of an article is its QUANTITY decorator, e.g. the number bought in a past order, or 1.
+    """
+    articles: Dict[str, Tuple[int, str | None]] = {}
+
+    def add(product_id: str, count: int, name: str | None) -> None:
+        previous_count, previous_name = articles.get(product_id, (0, None))
+        articles[product_id] = (previous_count + count, previous_name or name)
+
+    for entry in entries:
+        items = entry.get("items")
+        if isinstance(items, dict):
+            # A sublist that was fetched on its own, or its error.
+            items = items.get("items")
+        if items is not None:
+            for product_id, (count, name) in _list_articles(items).items():
+                add(product_id, count, name)
+        elif entry.get("type") in ("SINGLE_ARTICLE", "ORDER_ARTICLE") and entry.get("id"):
+            count = next((decorator.get("quantity", 1) for decorator in entry.get("decorators", [])
+                          if decorator.get("type") == "QUANTITY"), 1)
+            add(entry["id"], int(count), entry.get("name"))
+    return articles
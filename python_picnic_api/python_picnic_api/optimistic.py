@@ -0,0 +1,157 @@
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List
+
+from .cart import Cart
+from .client import PicnicAPI
+
+
+@dataclass(frozen=True)
+class MutationFailure:
+    """A background cart mutation that Picnic rejected or that could not be sent."""
+    product_id: str
+    action: str
+    count: int
+    code: str
+    name: str | None = None
+
+
+@dataclass
+class _Mutation:
+    sequence: int
+    product_id: str
+    action: str
+    count: int
+    name: str | None
+    price: int | None
+    future: Future
+
+
+class OptimisticCart:
+    """Runs cart mutations in the background while predicting their outcome locally.
+
+    Mutations of the same product are sent strictly in the order they were submitted, each one only after the
+    previous one was answered. Mutations of different products run concurrently. A successful mutation hands the
+    cart payload returned by Picnic to ``on_confirmed``; a failed one is recorded and can be collected with
+    ``drain_failures`` to tell the user about it.
+
+    Args:
+        api: Picnic client used to send the mutations.
+        on_confirmed: Called with the cart payload of every successful mutation, from a worker thread. It must not
+            call back into this object.
+        max_workers: Maximum number of mutations that are in flight at the same time.
+    """
+
+    def __init__(
+            self, api: PicnicAPI, on_confirmed: Callable[[dict], object] | None = None, max_workers: int = 4
+    ):
+        self._api = api
+        self._on_confirmed = on_confirmed
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="picnic-cart")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._sequence = itertools.count()
+        self._queues: Dict[str, Deque[_Mutation]] = {}
+        self._pending: Dict[int, _Mutation] = {}
+        self._failures: List[MutationFailure] = []
+
+    @property
+    def pending(self) -> int:
+        """Number of mutations that were submitted but not answered yet."""
+        with self._lock:
+            return len(self._pending)
+
+    def add_product(self, product_id: str, count: int = 1, name: str | None = None, price: int | None = None
+                    ) -> Future:
+        """Submit adding a product; name and unit price are used to predict a line that is not in the cart yet."""
+        return self._submit(product_id, "add", count, name, price)
+
+    def remove_product(self, product_id: str, count: int = 1) -> Future:
+        return self._submit(product_id, "remove", count, None, None)
+
+    def predict(self, cart: Cart) -> Cart:
+        """Return the cart as it will look once all pending mutations went through."""
+        with self._lock:
+            mutations = sorted(self._pending.values(), key=lambda mutation: mutation.sequence)
+        for mutation in mutations:
+            delta = mutation.count if mutation.action == "add" else -mutation.count
+            cart = cart.with_change(mutation.product_id, delta, mutation.name, mutation.price)
+        return cart
+
+    def drain_failures(self) -> List[MutationFailure]:
+        """Return and forget the failures that happened since the last call."""
+        with self._lock:
+            failures, self._failures = self._failures, []
+        return failures
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until all pending mutations were answered. Returns False if the timeout expired."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending, timeout=timeout)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _submit(self, product_id: str, action: str, count: int, name: str | None, price: int | None) -> Future:
+        future: Future = Future()
+        with self._lock:
+            mutation = _Mutation(next(self._sequence), product_id, action, count, name, price, future)
+            self._pending[mutation.sequence] = mutation
+            queue = self._queues.setdefault(product_id, deque())
+            queue.append(mutation)
+            start_worker = len(queue) == 1
+        if start_worker:
+            self._executor.submit(self._drain, product_id)
+        return future
+
+    def _drain(self, product_id: str) -> None:
+        """Send the queued mutations of one product one after another."""
+        while True:
+            with self._lock:
+                queue = self._queues[product_id]
+                mutation = queue[0]
+            response: dict | None = None
+            error: Exception | None = None
+            try:
+                response = self._send(mutation)
+            except Exception as e:
+                error = e
+                self._fail(mutation, type(e).__name__)
+            else:
+                if response.get("error"):
+                    self._fail(mutation, response["error"].get("code", "UNKNOWN_ERROR"))
+
+            with self._lock:
+                # Confirming and dropping the pending mutation happen atomically, so that predict() never counts
+                # a mutation twice.
+                if response is not None and not response.get("error") and self._on_confirmed is not None:
+                    self._on_confirmed(response)
+                queue.popleft()
+                del self._pending[mutation.sequence]
+                done = not queue
+                if done:
+                    del self._queues[product_id]
+                self._idle.notify_all()
+
+            if error is not None:
+                mutation.future.set_exception(error)
+            else:
+                mutation.future.set_result(response)
+            if done:
+                return
+
+    def _send(self, mutation: _Mutation) -> dict:
+        if mutation.action == "add":
+            return self._api.add_product(mutation.product_id, count=mutation.count)
+        return self._api.remove_product(mutation.product_id, count=mutation.count)
+
+    def _fail(self, mutation: _Mutation, code: str) -> None:
+        with self._lock:
+            self._failures.append(
+                MutationFailure(mutation.product_id, mutation.action, mutation.count, code, mutation.name))
+
+
+__all__ = ["MutationFailure", "OptimisticCart"]
@@ -0,0 +1,68 @@
+"""Parsing of large Picnic responses, optionally in worker processes.
+
+Search and recipe pages are large, deeply nested documents. Decoding and walking them holds the GIL for long enough
+to delay every other thread of the process, e.g. the audio loops of other conversations. A ParsingExecutor moves
+that work into worker processes: the workers get the raw response bytes and send back only the small extract.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+from . import codec
+from .helper import _extract_search_results, _extract_recipe_search_results, _extract_recipe_ingredients, \
+    _recipe_portions
+
+# Payloads smaller than this are parsed in the calling thread, where they are done before a worker would be.
+INLINE_PARSE_LIMIT = 64 * 1024
+
+Parser = Callable[[bytes], dict]
+
+
+def parse_search_results(content: bytes, max_items: int = 10) -> dict:
+    raw_results = codec.loads(content)
+    return {**_extract_search_results(raw_results, max_items=max_items), "error": raw_results.get("error") or {}}
+
+
+def parse_recipe_search_results(content: bytes, max_items: int | None = 10) -> dict:
+    raw_results = codec.loads(content)
+    return {**_extract_recipe_search_results(raw_results, max_items=max_items),
+            "error": raw_results.get("error") or {}}
+
+
+def parse_recipe_ingredients(content: bytes) -> dict:
+    """Extract the default portions and the core ingredients of a recipe details page."""
+    raw_results = codec.loads(content)
+    if raw_results.get("error"):
+        return {"error": raw_results["error"]}
+    try:
+        core_ingredients = _extract_recipe_ingredients(raw_results)
+    except IndexError:
+        return {"error": {"code": "RECIPE_INGREDIENTS_NOT_FOUND", "message": "The recipe has no ingredients"}}
+    return {"portions": _recipe_portions(raw_results), "core_ingredients": core_ingredients, "error": {}}
+
+
+class ParsingExecutor:
+    """Parses responses in a pool of worker processes.
+
+    Parsers must be picklable, i.e. module level functions or partials of them.
+
+    Args:
+        max_workers: Number of worker processes, by default the number of CPUs.
+        inline_limit: Payloads smaller than this number of bytes are parsed in the calling thread.
+    """
+
+    def __init__(self, max_workers: int | None = None, inline_limit: int = INLINE_PARSE_LIMIT):
+        self.inline_limit = inline_limit
+        # Workers are spawned instead of forked, as forking a process with running threads is unsafe.
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def parse(self, parser: Parser, content: bytes) -> dict:
+        if len(content) < self.inline_limit:
+            return parser(content)
+        return self._executor.submit(parser, content).result()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+__all__ = ["ParsingExecutor", "parse_recipe_ingredients", "parse_recipe_search_results", "parse_search_results"]
@@ -2,6 +2,9 @@ from typing import Any
 
 from requests import Response, Session
 
+from . import codec
+from .throttle import RequestThrottle
+
 
 class PicnicAuthError(Exception):
     """Indicates an error when authenticating to the Picnic API."""
@@ -10,9 +13,10 @@ class PicnicAuthError(Exception):
 class PicnicAPISession(Session):
     AUTH_HEADER = "x-picnic-auth"
 
-    def __init__(self, auth_token: str | None = None):
+    def __init__(self, auth_token: str | None = None, throttle: RequestThrottle | None = None):
         super().__init__()
         self._auth_token = auth_token
+        self.throttle = throttle or RequestThrottle()
 
         self.headers.update(
             {
@@ -38,6 +42,11 @@ class PicnicAPISession(Session):
             self._auth_token = auth_token
             self.headers.update({self.AUTH_HEADER: self._auth_token})
 
+    def request(self, method: str | bytes, url: str | bytes, *args: Any, **kwargs: Any) -> Response:
+        """Send a request once the throttle allows it."""
+        return self.throttle.call(
+            str(url), lambda: super(PicnicAPISession, self).request(method, url, *args, **kwargs))
+
     def get(self, url: str, **kwargs: Any) -> Response:
         """Do a GET request and update the auth token if set."""
         response = super(PicnicAPISession, self).get(url, **kwargs)
@@ -45,8 +54,10 @@ class PicnicAPISession(Session):
 
         return response
 
-    def post(self, url: str, data: dict | None = None, json: dict | None = None, **kwargs: Any) -> Response:
-        """Do a POST request and update the auth token if set."""
+    def post(self, url: str, data: dict | bytes | None = None, json: dict | None = None, **kwargs: Any) -> Response:
+        """Do a POST request and update the auth token if set. A JSON body is encoded with the default codec."""
+        if json is not None and data is None:
+            data, json = codec.dumps(json), None
         response = super(PicnicAPISession, self).post(url, data, json, **kwargs)
         self._update_auth_token(response.headers.get(self.AUTH_HEADER))
 
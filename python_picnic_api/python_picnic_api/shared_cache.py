@@ -0,0 +1,245 @@
+"""A cache that is shared by the worker processes of one host, stored in a SQLite file.
+
+Every process and thread uses its own connection to the file, which is in WAL mode, so readers never wait for
+writers and writers wait for each other only for the few microseconds of an insert. Entries are grouped by
+namespace: every namespace has its own size limit and time to live, and is presented as a SharedTTLCache, which
+can be used wherever a TTLCache is.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Hashable, Iterator, Tuple
+
+from . import codec
+
+# The time an entry was last read is only updated if it is older than this, so that reads rarely write.
+ACCESS_RESOLUTION_SECONDS = 1.0
+# Expired entries and entries above max_bytes are removed every this many writes of a process.
+MAINTENANCE_INTERVAL = 256
+_KIND_JSON = 0
+_KIND_BYTES = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_by_access ON entries (namespace, accessed_at);
+"""
+
+
+def user_namespace(auth_token: str | None) -> str:
+    """Return the namespace prefix of a user, a digest of the auth token, so that the token is not stored."""
+    if not auth_token:
+        return "anonymous"
+    return hashlib.blake2b(auth_token.encode(), digest_size=8).hexdigest()
+
+
+def _encode_key(key: Hashable) -> str:
+    # Keys other than strings are stored as JSON, after a character that no string key of the caches starts with.
+    return key if isinstance(key, str) else "\x00" + codec.dumps(key).decode("utf-8")
+
+
+def _decode_key(key: str) -> Hashable:
+    if not key.startswith("\x00"):
+        return key
+    value = codec.loads(key[1:])
+    return tuple(value) if isinstance(value, list) else value
+
+
+class SharedCacheStore:
+    """A SQLite file with cache entries, safe to use from any number of threads and processes.
+
+    Args:
+        path: File of the store; it is created if missing.
+        max_bytes: Size of all values above which the least recently used entries are evicted.
+        timeout: Seconds a write waits for the writes of other processes.
+    """
+
+    def __init__(
+            self, path: str | Path, max_bytes: int = 256 * 1024 * 1024, timeout: float = 5.0,
+            clock: Callable[[], float] = time.time
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._clock = clock
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as connection:
+            connection.executescript(_SCHEMA)
+
+    def cache(self, namespace: str | Callable[[], str], maxsize: int = 128, ttl: float = 3600.0) -> "SharedTTLCache":
+        """Return the entries of a namespace as a cache. A callable namespace is resolved on every access."""
+        return SharedTTLCache(self, namespace, maxsize=maxsize, ttl=ttl)
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections must neither be shared between threads nor be used by a child process after a fork.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def get(self, namespace: str, key: Hashable) -> Tuple[Any, float] | None:
+        """Return the value of an entry and the time it expires at, or None if it is missing or expired."""
+        now = self._clock()
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT kind, value, expires_at, accessed_at FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, _encode_key(key))).fetchone()
+        if row is None or row[2] <= now:
+            return None
+        kind, value, expires_at, accessed_at = row
+        if now - accessed_at > ACCESS_RESOLUTION_SECONDS:
+            connection.execute("UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                               (now, namespace, _encode_key(key)))
+        return (bytes(value) if kind == _KIND_BYTES else codec.loads(value)), expires_at
+
+    def set(self, namespace: str, key: Hashable, value: Any, expires_at: float, maxsize: int) -> None:
+        """Store an entry, evicting the least recently used entries of the namespace above maxsize."""
+        if isinstance(value, (bytes, bytearray)):
+            kind, data = _KIND_BYTES, bytes(value)
+        else:
+            kind, data = _KIND_JSON, codec.dumps(value)
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                               (namespace, _encode_key(key), kind, data, expires_at, self._clock()))
+            connection.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key IN (SELECT key FROM entries WHERE namespace = ? "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (namespace, namespace, maxsize))
+        with self._writes_lock:
+            self._writes += 1
+            maintain = self._writes % MAINTENANCE_INTERVAL == 0
+        if maintain:
+            self.maintain()
+
+    def contains(self, namespace: str, key: Hashable) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, _encode_key(key), self._clock())).fetchone()
+        return row is not None
+
+    def count(self, namespace: str) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ? AND expires_at > ?",
+            (namespace, self._clock())).fetchone()[0]
+
+    def items(self, namespace: str) -> Iterator[Tuple[Hashable, Any, float]]:
+        """Iterate over the valid entries of a namespace as (key, value, expires_at)."""
+        rows = self._connection().execute(
+            "SELECT key, kind, value, expires_at FROM entries WHERE namespace = ? AND expires_at > ?",
+            (namespace, self._clock())).fetchall()
+        return iter([(_decode_key(key), bytes(value) if kind == _KIND_BYTES else codec.loads(value), expires_at)
+                     for key, kind, value, expires_at in rows])
+
+    def delete(self, namespace: str, key: Hashable) -> None:
+        self._connection().execute("DELETE FROM entries WHERE namespace = ? AND key = ?",
+                                   (namespace, _encode_key(key)))
+
+    def clear(self, namespace: str | None = None) -> None:
+        """Delete the entries of a namespace, or all entries."""
+        if namespace is None:
+            self._connection().execute("DELETE FROM entries")
+        else:
+            self._connection().execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+    def maintain(self) -> None:
+        """Delete expired entries, then the least recently used ones while the values take more than max_bytes."""
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM entries WHERE expires_at <= ?", (self._clock(),))
+            size = connection.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries").fetchone()[0]
+            if size > self.max_bytes:
+                rows = connection.execute(
+                    "SELECT namespace, key, LENGTH(value) FROM entries ORDER BY accessed_at").fetchall()
+                evicted = []
+                for namespace, key, length in rows:
+                    if size <= self.max_bytes:
+                        break
+                    evicted.append((namespace, key))
+                    size -= length
+                connection.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", evicted)
+
+    def close(self) -> None:
+        """Close the connection of the calling thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            connection.close()
+        self._local.connection = None
+
+
+class SharedTTLCache:
+    """The entries of one namespace of a SharedCacheStore, with the interface of TTLCache.
+
+    Values are stored as JSON, or as they are if they are bytes, so a value that is read is always a fresh copy.
+
+    Args:
+        store: Store that holds the entries.
+        namespace: Namespace of the entries, or a function returning it, e.g. one that includes the current user.
+        maxsize: Maximum number of entries; the least recently used entry is evicted first.
+        ttl: Seconds an entry stays valid, unless another ttl is given when it is set.
+    """
+
+    def __init__(
+            self, store: SharedCacheStore, namespace: str | Callable[[], str], maxsize: int = 128, ttl: float = 3600.0
+    ):
+        self.store = store
+        self._namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def namespace(self) -> str:
+        return self._namespace() if callable(self._namespace) else self._namespace
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.store.get(self.namespace, key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None, expires_at: float | None = None) -> None:
+        """Store a value; expires_at (a timestamp of the store clock) takes precedence over ttl."""
+        if expires_at is None:
+            expires_at = self.store._clock() + (self.ttl if ttl is None else ttl)
+        self.store.set(self.namespace, key, value, expires_at, self.maxsize)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.store.contains(self.namespace, key)
+
+    def __len__(self) -> int:
+        return self.store.count(self.namespace)
+
+    def items(self) -> Iterator[Tuple[Hashable, Any, float]]:
+        return self.store.items(self.namespace)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.store.get(self.namespace, key)
+        self.store.delete(self.namespace, key)
+        return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        self.store.clear(self.namespace)
+
+
+__all__ = ["SharedCacheStore", "SharedTTLCache", "user_namespace"]
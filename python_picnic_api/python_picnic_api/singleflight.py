@@ -0,0 +1,76 @@
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable
+
+
+@dataclass(frozen=True)
+class SingleFlightStats:
+    """Counters of a SingleFlight group.
+
+    calls: Number of calls that were made.
+    executions: Number of calls that actually executed the function.
+    shared: Number of calls that waited for and shared the result of an execution that was already in flight.
+    """
+    calls: int = 0
+    executions: int = 0
+    shared: int = 0
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share a single execution of a function.
+
+    The first caller of a key executes the function, callers that arrive while it is running wait for it and get
+    the same result or exception. Nothing is cached: as soon as the execution finished, the next caller of the key
+    executes the function again. Shared results are the same object for all callers and must not be mutated.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._executions = 0
+        self._shared = 0
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self._executions += 1
+                leader = True
+            else:
+                self._shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    @property
+    def stats(self) -> SingleFlightStats:
+        with self._lock:
+            return SingleFlightStats(self._executions + self._shared, self._executions, self._shared)
+
+
+__all__ = ["SingleFlight", "SingleFlightStats"]
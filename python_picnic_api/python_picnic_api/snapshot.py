@@ -0,0 +1,134 @@
+"""Binary snapshots of TTL caches, to start warm after a restart.
+
+Layout (little endian)::
+
+    header   magic "PCNS" | version u16 | reserved u16 | entry count u32 | crc32 of the entries u32
+    entry    expires_at f64 | value kind u8 | namespace length u8 | key length u16 | value length u32
+             | namespace | key | value
+
+Keys and namespaces are UTF-8 strings. Values are stored as raw bytes or as UTF-8 JSON. Snapshots are read through
+a memory map, and snapshots with another version or a wrong checksum are ignored as a whole. The entry count is not
+covered by the checksum, so reading stops at the first entry that does not fit the file.
+"""
+import mmap
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Mapping
+
+from . import codec
+from .cache import Cache
+
+MAGIC = b"PCNS"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHII")
+_ENTRY = struct.Struct("<dBBHI")
+_KIND_JSON = 0
+_KIND_BYTES = 1
+# Largest namespace, key and value that the length fields of an entry can hold.
+_MAX_NAMESPACE_LENGTH = 0xFF
+_MAX_KEY_LENGTH = 0xFFFF
+_MAX_VALUE_LENGTH = 0xFFFFFFFF
+
+
+def save_snapshot(path: str | Path, caches: Mapping[str, Cache]) -> int:
+    """Write the valid entries with string keys of the caches to a snapshot file. Returns the number of entries.
+
+    Entries that do not fit the length fields of the layout, e.g. keys longer than 65535 bytes, are left out.
+    """
+    chunks = []
+    count = 0
+    for namespace, cache in caches.items():
+        namespace_bytes = namespace.encode("utf-8")
+        if len(namespace_bytes) > _MAX_NAMESPACE_LENGTH:
+            continue
+        for key, value, expires_at in cache.items():
+            if not isinstance(key, str):
+                continue
+            key_bytes = key.encode("utf-8")
+            if len(key_bytes) > _MAX_KEY_LENGTH:
+                continue
+            if isinstance(value, (bytes, bytearray)):
+                kind, value_bytes = _KIND_BYTES, bytes(value)
+            else:
+                try:
+                    kind, value_bytes = _KIND_JSON, codec.dumps(value)
+                except (TypeError, ValueError):
+                    continue
+            if len(value_bytes) > _MAX_VALUE_LENGTH:
+                continue
+            chunks += [_ENTRY.pack(expires_at, kind, len(namespace_bytes), len(key_bytes), len(value_bytes)),
+                       namespace_bytes, key_bytes, value_bytes]
+            count += 1
+
+    payload = b"".join(chunks)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(path.name + ".tmp")
+    with open(temporary_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, count, zlib.crc32(payload)))
+        f.write(payload)
+    os.replace(temporary_path, path)
+    return count
+
+
+def load_snapshot(path: str | Path, caches: Mapping[str, Cache], now: float | None = None) -> int:
+    """Load the entries of a snapshot file into the caches of the same namespace.
+
+    Entries that expired in the meantime and entries of unknown namespaces are skipped. Returns the number of
+    loaded entries, which is 0 if the file is missing, of another version or corrupt. Of a snapshot whose entry count
+    is wrong, the entries up to the first one that does not fit the file are loaded.
+    """
+    now = time.time() if now is None else now
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return 0
+    with f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = memoryview(mapped)
+            try:
+                return _load_entries(data, caches, now)
+            finally:
+                data.release()
+
+
+def _load_entries(data: memoryview, caches: Mapping[str, Cache], now: float) -> int:
+    magic, version, _, count, checksum = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or zlib.crc32(data[_HEADER.size:]) != checksum:
+        return 0
+
+    loaded = 0
+    offset = _HEADER.size
+    for _ in range(count):
+        if offset + _ENTRY.size > len(data):
+            break
+        expires_at, kind, namespace_length, key_length, value_length = _ENTRY.unpack_from(data, offset)
+        namespace_start = offset + _ENTRY.size
+        key_start = namespace_start + namespace_length
+        value_start = key_start + key_length
+        offset = value_start + value_length
+        if offset > len(data):
+            break
+
+        try:
+            namespace = str(data[namespace_start:key_start], "utf-8")
+            cache = caches.get(namespace)
+            if cache is None or expires_at <= now:
+                continue
+            key = str(data[key_start:value_start], "utf-8")
+            value_bytes = data[value_start:offset]
+            value = bytes(value_bytes) if kind == _KIND_BYTES else codec.loads(value_bytes.tobytes())
+        except ValueError:
+            # Not UTF-8 or not JSON, so the lengths were wrong, and so are the offsets of all later entries.
+            break
+        cache.set(key, value, expires_at=expires_at)
+        loaded += 1
+    return loaded
+
+
+__all__ = ["load_snapshot", "save_snapshot"]
@@ -0,0 +1,435 @@
+"""Local stand-in for the Picnic storefront API.
+
+The stub serves the subset of endpoints used by the agent from an in-memory catalog and one cart per auth token, so
+that tests and benchmarks can run without a Picnic account. Latency and errors can be injected per request.
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .client import PicnicAPI, DEFAULT_API_VERSION
+
+DEFAULT_PRODUCTS = {
+    "s1001": {"name": "Milk", "price": 119, "unit_quantity": "1 liter"},
+    "s1002": {"name": "Organic milk", "price": 149, "unit_quantity": "1 liter"},
+    "s1003": {"name": "Butter", "price": 249, "unit_quantity": "250 gram"},
+    "s1004": {"name": "Eggs", "price": 299, "unit_quantity": "10 stuks"},
+    "s1005": {"name": "Coffee beans", "price": 599, "unit_quantity": "500 gram"},
+    "s1006": {"name": "Bananas", "price": 189, "unit_quantity": "1 kg"},
+}
+
+DEFAULT_RECIPES = {
+    "665d879b27b9fb2099389e95": {"name": "Pancakes", "servings": 2, "preparation_time": 20,
+                                 "ingredients": ["s1001", "s1003", "s1004"]},
+    "665d879b27b9fb2099389e96": {"name": "Banana bread", "servings": 4, "preparation_time": 75,
+                                 "ingredients": ["s1003", "s1004", "s1006"]},
+    "665d879b27b9fb2099389e97": {"name": "Iced coffee", "servings": 1, "preparation_time": 5,
+                                 "ingredients": ["s1001", "s1005"]},
+}
+
+# Top-level categories with their subcategories, whose products are the ids of the catalog.
+DEFAULT_CATEGORIES = [
+    {"id": "dairy", "name": "Dairy & eggs", "items": [
+        {"id": "milk", "name": "Milk", "products": ["s1001", "s1002"]},
+        {"id": "butter", "name": "Butter", "products": ["s1003"]},
+        {"id": "eggs", "name": "Eggs", "products": ["s1004"]},
+    ]},
+    {"id": "breakfast", "name": "Coffee & breakfast", "items": [
+        {"id": "coffee", "name": "Coffee", "products": ["s1005"]},
+    ]},
+    {"id": "fresh", "name": "Fruit & vegetables", "items": [
+        {"id": "fruit", "name": "Fruit", "products": ["s1006"]},
+        {"id": "vegetables", "name": "Vegetables", "products": []},
+    ]},
+]
+
+# Lists of the shopper, like the previously bought products, whose sublists name their products by id and count only.
+DEFAULT_LISTS = [
+    {"id": "purchases", "name": "Previously bought", "items": [
+        {"id": "last-week", "name": "Last week", "products": {"s1001": 2, "s1003": 1, "s1006": 1}},
+        {"id": "two-weeks-ago", "name": "Two weeks ago", "products": {"s1001": 1, "s1005": 1}},
+    ]},
+]
+
+DEFAULT_AUTH_TOKEN = "stub-auth-token"
+
+Handler = Callable[[Dict[str, str], dict | None], Tuple[int, Any]]
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Connections of many concurrent clients, e.g. of a load test, would otherwise be refused and retried.
+    request_queue_size = 128
+
+
+class PicnicStubServer:
+    """Serves a fake Picnic storefront API on localhost.
+
+    Args:
+        products: Catalog that is served, mapping product ids to name, price and unit quantity.
+        recipes: Recipes that are served, mapping recipe ids to name, servings, preparation time and the product ids
+            of the ingredients, which are added to the cart when the recipe is assigned to a day.
+        latency: Seconds every request is delayed before it is answered.
+        jitter: Maximum number of seconds that is randomly added to the latency.
+        rate_limit: Maximum number of requests per number of seconds, as (requests, seconds). Requests above the
+            limit are answered with 429, like Picnic does.
+        max_concurrency: Maximum number of requests that are handled at the same time. Requests above the limit are
+            answered with 503.
+        categories: Category tree that is served, as top-level categories whose items are subcategories with the
+            product ids in them.
+        lists: Lists of the shopper that are served next to the categories, whose items are sublists with product
+            ids and counts.
+    """
+
+    def __init__(
+            self, products: Dict[str, dict] | None = None, recipes: Dict[str, dict] | None = None,
+            latency: float = 0.0, jitter: float = 0.0, rate_limit: Tuple[int, float] | None = None,
+            max_concurrency: int | None = None, categories: List[dict] | None = None, lists: List[dict] | None = None
+    ):
+        self.products = dict(products or DEFAULT_PRODUCTS)
+        self.recipes = dict(DEFAULT_RECIPES if recipes is None else recipes)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.max_concurrency = max_concurrency
+        self.categories = list(DEFAULT_CATEGORIES if categories is None else categories)
+        self.lists = list(DEFAULT_LISTS if lists is None else lists)
+        # Number of requests that were rejected because of the rate limit or the concurrency limit.
+        self.rejected = 0
+        # Product id -> Picnic error code that cart mutations of this product fail with.
+        self.failures: Dict[str, str] = {}
+        # (method, path, query, body) of every request that was handled, in the order they were processed.
+        self.requests: List[Tuple[str, str, Dict[str, str], dict | None]] = []
+
+        # Auth token -> cart, so that every client of the stub shops on its own cart.
+        self._carts: Dict[str, Dict[str, int]] = {}
+        # Auth token of the request whose route is running, set while the lock is held.
+        self._auth_token = DEFAULT_AUTH_TOKEN
+        self._lock = threading.Lock()
+        self._arrivals: deque = deque()
+        self._in_flight = 0
+        self._routes: Dict[Tuple[str, str], Handler] = {
+            ("GET", "/user"): self._get_user,
+            ("POST", "/user/login"): self._login,
+            ("GET", "/cart"): lambda query, body: (200, self._cart_payload()),
+            ("POST", "/cart/add_product"): self._add_product,
+            ("POST", "/cart/remove_product"): self._remove_product,
+            ("POST", "/cart/clear"): self._clear_cart,
+            ("GET", "/pages/search-page-results"): self._search,
+            ("GET", "/pages/recipe-details-page"): self._recipe_details,
+            ("POST", "/pages/task/assign-recipe-to-day"): self._assign_recipe,
+            ("GET", "/my_store"): self._my_store,
+        }
+        # Routes of paths that end with an id, which is passed to the handler as the "path_id" query parameter.
+        self._prefix_routes: Dict[Tuple[str, str], Handler] = {
+            ("GET", "/lists/"): self._list,
+            ("GET", "/articles/"): self._article,
+        }
+        self._server = _StubHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        port = self._server.server_address[1]
+        return f"http://127.0.0.1:{port}/api/{DEFAULT_API_VERSION}"
+
+    def client(self, auth_token: str = DEFAULT_AUTH_TOKEN, **kwargs: Any) -> PicnicAPI:
+        """Return a PicnicAPI client that talks to this stub, created with the given keyword arguments."""
+        return PicnicAPI(auth_token=auth_token, base_url=self.url, **kwargs)
+
+    def start(self) -> "PicnicStubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="picnic-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "PicnicStubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def cart_counts(self, auth_token: str = DEFAULT_AUTH_TOKEN) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._carts.get(auth_token, {}))
+
+    @property
+    def _cart(self) -> Dict[str, int]:
+        return self._carts.setdefault(self._auth_token, {})
+
+    def _handler_class(self) -> type:
+        stub = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                self._dispatch("GET")
+
+            def do_POST(self) -> None:
+                self._dispatch("POST")
+
+            def _dispatch(self, method: str) -> None:
+                url = urlsplit(self.path)
+                path = url.path.removeprefix(f"/api/{DEFAULT_API_VERSION}")
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                auth_token = self.headers.get("x-picnic-auth") or DEFAULT_AUTH_TOKEN
+                status, payload, headers = stub._handle(method, path, query, body, auth_token)
+                content = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return RequestHandler
+
+    def _handle(
+            self, method: str, path: str, query: Dict[str, str], body: dict | None,
+            auth_token: str = DEFAULT_AUTH_TOKEN
+    ) -> Tuple[int, Any, Dict[str, str]]:
+        if rejection := self._admit():
+            return rejection
+        try:
+            return self._respond(method, path, query, body, auth_token)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _admit(self) -> Tuple[int, Any, Dict[str, str]] | None:
+        """Enforce the rate and concurrency limits, returning the rejection if the request exceeds them."""
+        with self._lock:
+            if self.rate_limit:
+                max_requests, window = self.rate_limit
+                now = time.monotonic()
+                while self._arrivals and self._arrivals[0] <= now - window:
+                    self._arrivals.popleft()
+                if len(self._arrivals) >= max_requests:
+                    self.rejected += 1
+                    retry_after = self._arrivals[0] + window - now
+                    return 429, {"error": {"code": "TOO_MANY_REQUESTS"}}, {"Retry-After": f"{retry_after:.3f}"}
+                self._arrivals.append(now)
+            if self.max_concurrency is not None and self._in_flight >= self.max_concurrency:
+                self.rejected += 1
+                return 503, {"error": {"code": "SERVICE_UNAVAILABLE"}}, {}
+            self._in_flight += 1
+        return None
+
+    def _respond(
+            self, method: str, path: str, query: Dict[str, str], body: dict | None,
+            auth_token: str = DEFAULT_AUTH_TOKEN
+    ) -> Tuple[int, Any, Dict[str, str]]:
+        delay = self.latency + random.uniform(0, self.jitter) if self.jitter else self.latency
+        if delay:
+            time.sleep(delay)
+        route = self._routes.get((method, path))
+        if route is None:
+            for (route_method, prefix), handler in self._prefix_routes.items():
+                if method == route_method and path.startswith(prefix):
+                    route = partial(_with_path_id, handler, path.removeprefix(prefix))
+        if route is None:
+            return 404, {"error": {"code": "NOT_FOUND"}}, {}
+        with self._lock:
+            self.requests.append((method, path, query, body))
+            self._auth_token = auth_token
+            status, payload = route(query, body)
+        headers = {"x-picnic-auth": DEFAULT_AUTH_TOKEN} if path == "/user/login" else {}
+        return status, payload, headers
+
+    def _get_user(self, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+        return 200, {"user_id": "stub-user", "firstname": "Stub", "lastname": "User"}
+
+    def _login(self, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+        return 200, {"user_id": "stub-user", "second_factor_authentication_required": False}
+
+    def _mutate_cart(self, body: dict | None, sign: int) -> Tuple[int, Any]:
+        body = body or {}
+        product_id = body.get("product_id", "")
+        if product_id in self.failures:
+            return 200, {"error": {"code": self.failures[product_id], "message": "Injected failure"}}
+        if product_id not in self.products:
+            return 200, {"error": {"code": "PRODUCT_NOT_FOUND", "message": "Unknown product"}}
+        count = self._cart.get(product_id, 0) + sign * int(body.get("count", 1))
+        if count > 0:
+            self._cart[product_id] = count
+        else:
+            self._cart.pop(product_id, None)
+        return 200, self._cart_payload()
+
+    def _add_product(self, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+        return self._mutate_cart(body, 1)
+
+    def _remove_product(self, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+        return self._mutate_cart(body, -1)
+
+    def _clear_cart(self, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+        self._cart.clear()
+        return 200, self._cart_payload()
+
+    def _cart_payload(self) -> dict:
+        order_lines = []
+        for product_id, count in self._cart.items():
+            product = self.products[product_id]
+            order_lines.append({
+                "type": "ORDER_LINE",
+                "id": f"line-{product_id}",
+                "items": [{
+                    "type": "ORDER_ARTICLE",
+                    "id": product_id,
+                    "name": product["name"],
+                    "price": product["price"],
+                    "unit_quantity": product.get("unit_quantity"),
+                    "decorators": [{"type": "QUANTITY", "quantity": count}],
+                }],
+                "display_price": product["price"] * count,
+                "price": product["price"] * count,
+            })
+        return {
+            "type": "ORDER",
+            "id": "shopping_cart",
+            "items": order_lines,
+            "total_count": sum(self._cart.values()),
+            "total_price": sum(self.products[product_id]["price"] * count for product_id, count in self._cart.items()),
+        }
+
+    def _my_store(self, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+        depth = int(query.get("depth", 0))
+        catalog = []
+        for category in self.categories:
+            entry: dict = {"type": "CATEGORY", "id": category["id"], "name": category["name"]}
+            if depth >= 1:
+                entry["items"] = [self._subcategory(subcategory, with_products=depth >= 2)
+                                  for subcategory in category["items"]]
+            catalog.append(entry)
+        return 200, {"type": "MY_STORE", "catalog": catalog}
+
+    def _list(self, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+        category = next((category for category in self.categories + self.lists
+                         if category["id"] == query["path_id"]), None)
+        if category is None:
+            return 404, {"error": {"code": "NOT_FOUND"}}
+        if "sublist" not in query:
+            return 200, [self._subcategory(subcategory, with_products=False) for subcategory in category["items"]]
+        subcategory = next((item for item in category["items"] if item["id"] == query["sublist"]), None)
+        if subcategory is None:
+            return 404, {"error": {"code": "NOT_FOUND"}}
+        return 200, self._subcategory(subcategory, with_products=True)["items"]
+
+    def _subcategory(self, subcategory: dict, with_products: bool) -> dict:
+        entry: dict = {"type": "CATEGORY", "id": subcategory["id"], "name": subcategory["name"]}
+        if with_products and isinstance(subcategory["products"], dict):
+            # A sublist of the shopper, e.g. a past order: the articles with their counts, but without details.
+            entry["items"] = [{"type": "SINGLE_ARTICLE", "id": product_id,
+                               "decorators": [{"type": "QUANTITY", "quantity": count}]}
+                              for product_id, count in subcategory["products"].items()]
+        elif with_products:
+            entry["items"] = [{
+                "type": "SINGLE_ARTICLE",
+                "id": product_id,
+                "name": self.products[product_id]["name"],
+                "display_price": self.products[product_id]["price"],
+                "unit_quantity": self.products[product_id].get("unit_quantity"),
+            } for product_id in subcategory["products"] if product_id in self.products]
+        return entry
+
+    def _article(self, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+        product = self.products.get(query["path_id"])
+        if product is None:
+            return 404, {"error": {"code": "NOT_FOUND"}}
+        return 200, {"type": "SINGLE_ARTICLE", "id": query["path_id"], "name": product["name"],
+                     "display_price": product["price"], "unit_quantity": product.get("unit_quantity")}
+
+    def _search(self, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+        term = query.get("search_term", "").lower()
+        if query.get("is_recipe") == "true":
+            return 200, self._recipe_search_page(term)
+        tiles = [
+            {
+                "id": f"selling-unit-{product_id}-tile",
+                "content": {
+                    "type": "SELLING_UNIT_TILE",
+                    "sellingUnit": {
+                        "id": product_id,
+                        "name": product["name"],
+                        "display_price": product["price"],
+                        "unit_quantity": product.get("unit_quantity"),
+                    },
+                },
+                "children": [],
+                "analytics": {"contexts": [{"data": {"sole_article_id": product_id}}]},
+            }
+            for product_id, product in self.products.items() if term in product["name"].lower()
+        ]
+        return 200, {"body": {"child": {"id": "search-results", "children": tiles}}}
+
+    def _recipe_search_page(self, term: str) -> dict:
+        recipe_ids = [recipe_id for recipe_id, recipe in self.recipes.items() if term in recipe["name"].lower()]
+        tiles = [
+            {
+                "id": f"recipe-tile__{recipe_id}",
+                "pml": {"component": {
+                    "type": "CONTAINER",
+                    "accessibilityLabel": self.recipes[recipe_id]["name"],
+                    "children": [
+                        {"type": "IMAGE", "source": {"id": f"image-{recipe_id}"}},
+                        {"type": "RICH_TEXT", "markdown": f"{self.recipes[recipe_id]['preparation_time']} min"},
+                    ],
+                }},
+                "children": [],
+            }
+            for recipe_id in recipe_ids
+        ]
+        return {"body": {"child": {
+            "id": "recipe-search-results",
+            "children": tiles,
+            "analytics": {"contexts": [{"data": {"recipe_ids": recipe_ids}}]},
+        }}}
+
+    def _recipe_details(self, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+        recipe = self.recipes.get(query.get("recipe_id", ""))
+        if recipe is None:
+            return 200, {"error": {"code": "RECIPE_NOT_FOUND", "message": "Unknown recipe"}}
+        core_ingredients = [{"id": product_id, "quantity": 1} for product_id in recipe["ingredients"]]
+        return 200, {"body": {"child": {
+            "id": "recipe-details-page",
+            "state": {"servingsState": recipe["servings"]},
+            "child": {"id": "recipe-details", "children": [{
+                "id": "recipe-portioning-content-wrapper",
+                "child": {"state": {"coreIngredientsState": core_ingredients}},
+                "children": [],
+            }]},
+        }}}
+
+    def _assign_recipe(self, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+        payload = (body or {}).get("payload", {})
+        if payload.get("recipe_id") not in self.recipes:
+            return 200, {"error": {"code": "RECIPE_NOT_FOUND", "message": "Unknown recipe"}}
+        for ingredient in payload.get("core_ingredients", []):
+            product_id = ingredient["id"]
+            if product_id in self.failures:
+                return 200, {"error": {"code": self.failures[product_id], "message": "Injected failure"}}
+            self._cart[product_id] = self._cart.get(product_id, 0) + int(ingredient.get("quantity", 1))
+        return 200, {"body": {"child": {"id": "assign-recipe-to-day-result"}}}
+
+
+def _with_path_id(handler: Handler, path_id: str, query: Dict[str, str], body: dict | None) -> Tuple[int, Any]:
+    return handler({**query, "path_id": path_id}, body)
+
+
+__all__ = ["PicnicStubServer", "DEFAULT_PRODUCTS", "DEFAULT_RECIPES", "DEFAULT_CATEGORIES", "DEFAULT_LISTS"]
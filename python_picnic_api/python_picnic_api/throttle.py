@@ -0,0 +1,224 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Tuple
+from urllib.parse import urlsplit
+
+from requests import Response
+
+# Requests per second and burst size per endpoint class.
+DEFAULT_BUDGETS: Dict[str, Tuple[float, int]] = {
+    "search": (4.0, 8),
+    "cart": (8.0, 16),
+    "pages": (4.0, 8),
+    "default": (8.0, 16),
+}
+
+
+def endpoint_class(url: str) -> str:
+    """Classify a Picnic API url into the endpoint class its rate budget is taken from."""
+    path = urlsplit(url).path
+    if "/pages/search-page-results" in path or path.endswith("/search"):
+        return "search"
+    if "/cart" in path:
+        return "cart"
+    if "/pages/" in path:
+        return "pages"
+    return "default"
+
+
+class TokenBucket:
+    """Thread-safe token bucket that lets callers wait for their turn instead of failing."""
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return the number of seconds the caller has to wait before using it."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for the given number of seconds, e.g. after the server asked to retry later."""
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class AdaptiveConcurrencyLimit:
+    """Limits the number of requests in flight with additive-increase/multiplicative-decrease (AIMD).
+
+    The limit grows by one per limit successful requests and is multiplied by ``backoff`` if the server signals
+    overload (429 or 5xx), a request fails, or its latency rises above ``latency_tolerance`` times the usual latency.
+    It is decreased at most once per usual latency, so a burst of errors from one overload only counts once.
+    """
+
+    def __init__(
+            self, initial: int = 4, min_limit: int = 1, max_limit: int = 32, backoff: float = 0.5,
+            latency_tolerance: float = 3.0, clock: Callable[[], float] = time.monotonic
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self._clock = clock
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._waiting = 0
+        self._usual_latency: float | None = None
+        self._last_decrease = float("-inf")
+        self._decreases = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def decreases(self) -> int:
+        return self._decreases
+
+    def acquire(self) -> None:
+        with self._condition:
+            self._waiting += 1
+            try:
+                self._condition.wait_for(lambda: self._in_flight < int(self._limit))
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+
+    def release(self, status_code: int | None, latency: float) -> None:
+        """Release a slot and adapt the limit. A status code of None means the request failed without response."""
+        with self._condition:
+            self._in_flight -= 1
+            overloaded = status_code is None or status_code == 429 or status_code >= 500
+            slow = self._usual_latency is not None and latency > self._usual_latency * self.latency_tolerance
+            if overloaded or slow:
+                now = self._clock()
+                if now - self._last_decrease >= (self._usual_latency or 0.0):
+                    self._limit = max(self.min_limit, self._limit * self.backoff)
+                    self._last_decrease = now
+                    self._decreases += 1
+            else:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            if not overloaded:
+                self._usual_latency = latency if self._usual_latency is None else \
+                    0.9 * self._usual_latency + 0.1 * latency
+            self._condition.notify_all()
+
+
+@dataclass(frozen=True)
+class ThrottleStats:
+    """Snapshot of the throttle metrics.
+
+    requests: Number of requests that passed the throttle.
+    throttled: Number of requests that had to wait for their rate budget.
+    throttle_wait: Total seconds requests waited for their rate budget.
+    queue_depth: Number of requests currently waiting for a rate budget or concurrency slot.
+    max_queue_depth: Highest queue depth seen so far.
+    in_flight: Number of requests currently in flight.
+    concurrency_limit: Current adaptive concurrency limit.
+    overload_responses: Number of 429 and 5xx responses.
+    limit_decreases: Number of times the concurrency limit was decreased.
+    """
+    requests: int
+    throttled: int
+    throttle_wait: float
+    queue_depth: int
+    max_queue_depth: int
+    in_flight: int
+    concurrency_limit: int
+    overload_responses: int
+    limit_decreases: int
+
+
+class RequestThrottle:
+    """Client-side back-pressure for the Picnic API: a rate budget per endpoint class plus an adaptive
+    concurrency limit shared by all endpoints."""
+
+    def __init__(
+            self, budgets: Dict[str, Tuple[float, int]] | None = None,
+            concurrency: AdaptiveConcurrencyLimit | None = None
+    ):
+        budgets = budgets or DEFAULT_BUDGETS
+        self.buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in budgets.items()}
+        self.buckets.setdefault("default", TokenBucket(*DEFAULT_BUDGETS["default"]))
+        self.concurrency = concurrency or AdaptiveConcurrencyLimit()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._throttled = 0
+        self._throttle_wait = 0.0
+        self._queue_depth = 0
+        self._max_queue_depth = 0
+        self._overload_responses = 0
+
+    def call(self, url: str, send: Callable[[], Response]) -> Response:
+        """Send a request once its rate budget and a concurrency slot are available."""
+        bucket = self.buckets.get(endpoint_class(url), self.buckets["default"])
+        with self._lock:
+            self._queue_depth += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue_depth)
+        wait = 0.0
+        try:
+            wait = bucket.reserve()
+            if wait > 0:
+                time.sleep(wait)
+            self.concurrency.acquire()
+        finally:
+            with self._lock:
+                self._queue_depth -= 1
+                self._requests += 1
+                if wait > 0:
+                    self._throttled += 1
+                    self._throttle_wait += wait
+
+        start = time.monotonic()
+        status_code: int | None = None
+        try:
+            response = send()
+            status_code = response.status_code
+        finally:
+            self.concurrency.release(status_code, time.monotonic() - start)
+
+        if response.status_code == 429 or response.status_code >= 500:
+            with self._lock:
+                self._overload_responses += 1
+            retry_after = response.headers.get("Retry-After")
+            if response.status_code == 429 and retry_after and retry_after.replace(".", "", 1).isdigit():
+                bucket.pause(float(retry_after))
+        return response
+
+    @property
+    def stats(self) -> ThrottleStats:
+        with self._lock:
+            return ThrottleStats(
+                requests=self._requests,
+                throttled=self._throttled,
+                throttle_wait=self._throttle_wait,
+                queue_depth=self._queue_depth,
+                max_queue_depth=self._max_queue_depth,
+                in_flight=self.concurrency.in_flight,
+                concurrency_limit=self.concurrency.limit,
+                overload_responses=self._overload_responses,
+                limit_decreases=self.concurrency.decreases,
+            )
+
+
+__all__ = ["AdaptiveConcurrencyLimit", "DEFAULT_BUDGETS", "RequestThrottle", "ThrottleStats", "TokenBucket",
+           "endpoint_class"]
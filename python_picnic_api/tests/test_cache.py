@@ -0,0 +1,40 @@
+import unittest
+
+from python_picnic_api.python_picnic_api.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=2, ttl=10, clock=self.clock)
+
+    def test_get_and_set(self) -> None:
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.set("a", {"name": "Milk"})
+        self.assertEqual(self.cache.get("a"), {"name": "Milk"})
+        self.assertIn("a", self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_entries_expire(self) -> None:
+        self.cache.set("a", 1)
+        self.cache.set("b", 2, ttl=100)
+        self.clock.now += 10
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("b"), 2)
+        self.assertEqual([key for key, value, expires_at in self.cache.items()], ["b"])
+
+    def test_least_recently_used_entry_is_evicted(self) -> None:
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        self.assertNotIn("b", self.cache)
+        self.assertEqual(len(self.cache), 2)
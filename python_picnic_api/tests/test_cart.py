@@ -0,0 +1,84 @@
+import unittest
+
+from python_picnic_api.python_picnic_api import Cart, CartLine
+
+
+def order_line(product_id: str, name: str, price: int, count: int = 1) -> dict:
+    return {
+        "type": "ORDER_LINE",
+        "id": f"line-{product_id}",
+        "items": [{
+            "type": "ORDER_ARTICLE",
+            "id": product_id,
+            "name": name,
+            "price": price,
+            "unit_quantity": "1 liter",
+            "decorators": [{"type": "QUANTITY", "quantity": count}],
+        }],
+        "display_price": price * count,
+        "price": price * count,
+    }
+
+
+class TestCart(unittest.TestCase):
+    def setUp(self) -> None:
+        self.payload = {
+            "type": "ORDER",
+            "id": "shopping_cart",
+            "items": [order_line("s100", "Milk", 119, count=2), order_line("s200", "Butter", 249)],
+            "total_count": 3,
+            "total_price": 487,
+        }
+
+    def test_from_payload(self) -> None:
+        cart = Cart.from_payload(self.payload)
+        self.assertEqual(len(cart), 2)
+        self.assertIn("s100", cart)
+        self.assertEqual(cart.get("s100"), CartLine("s100", "Milk", 2, 119, 238, "1 liter"))
+        self.assertEqual(cart.name_of("s200"), "Butter")
+        self.assertIsNone(cart.name_of("s300"))
+        self.assertEqual(cart.total_count, 3)
+        self.assertEqual(cart.total_price, 487)
+
+    def test_to_products(self) -> None:
+        cart = Cart.from_payload(self.payload)
+        self.assertListEqual(cart.to_products(), [
+            {"price": 238, "product_name": "Milk", "product_id": "s100"},
+            {"price": 249, "product_name": "Butter", "product_id": "s200"},
+        ])
+
+    def test_empty_payload(self) -> None:
+        cart = Cart.from_payload({"items": []})
+        self.assertEqual(len(cart), 0)
+        self.assertEqual(cart.total_price, 0)
+
+    def test_from_payload_reuses_unchanged_lines(self) -> None:
+        old_cart = Cart.from_payload(self.payload)
+        self.payload["items"].append(order_line("s300", "Coffee", 599))
+        new_cart = Cart.from_payload(self.payload, previous=old_cart)
+        self.assertEqual(new_cart.version, old_cart.version + 1)
+        self.assertIs(new_cart.get("s100"), old_cart.get("s100"))
+
+    def test_diff(self) -> None:
+        old_cart = Cart.from_payload(self.payload)
+        self.payload["items"] = [order_line("s100", "Milk", 119, count=3), order_line("s300", "Coffee", 599)]
+        new_cart = Cart.from_payload(self.payload, previous=old_cart)
+
+        diff = old_cart.diff(new_cart)
+        self.assertEqual([line.product_id for line in diff.added], ["s300"])
+        self.assertEqual([line.product_id for line in diff.removed], ["s200"])
+        self.assertEqual([(old.count, new.count) for old, new in diff.changed], [(2, 3)])
+        self.assertFalse(new_cart.diff(new_cart))
+
+    def test_with_change(self) -> None:
+        cart = Cart.from_payload(self.payload)
+        predicted = cart.with_change("s100", 1).with_change("s300", 2, name="Coffee", price=599)
+        self.assertEqual(predicted.get("s300"), CartLine("s300", "Coffee", 2, 599, 1198))
+        self.assertEqual(predicted.get("s100"), CartLine("s100", "Milk", 3, 119, 357, "1 liter"))
+        self.assertEqual(predicted.total_count, 6)
+        self.assertEqual(predicted.total_price, 487 + 119 + 1198)
+
+        predicted = predicted.with_change("s200", -1)
+        self.assertNotIn("s200", predicted)
+        self.assertIs(predicted.with_change("s400", -1), predicted)
+        self.assertEqual(len(cart), 2)
@@ -0,0 +1,101 @@
+import io
+import time
+import unittest
+
+from python_picnic_api.python_picnic_api.categories import LazyCategoryTree
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+
+
+class TestLazyCategoryTree(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stub = self.enterContext(PicnicStubServer())
+
+    def tree(self, prefetch_siblings: int = 0, max_workers: int = 4) -> LazyCategoryTree:
+        tree = LazyCategoryTree(self.stub.client(), prefetch_siblings=prefetch_siblings, max_workers=max_workers)
+        self.addCleanup(tree.close)
+        return tree
+
+    def found(self, tree: LazyCategoryTree, query: str) -> str | None:
+        node = tree.find(query)
+        return node.path if node else None
+
+    def paths(self) -> list[str]:
+        return [path + (f"?sublist={query['sublist']}" if "sublist" in query else "")
+                for _, path, query, _ in self.stub.requests]
+
+    def test_only_browsed_categories_are_fetched_once(self) -> None:
+        tree = self.tree()
+        self.assertEqual([node.name for node in tree.roots()], ["Dairy & eggs", "Coffee & breakfast",
+                                                                "Fruit & vegetables"])
+        self.assertEqual(self.paths(), ["/my_store"])
+
+        dairy = tree.roots()[0]
+        self.assertEqual([node.name for node in tree.children(dairy)], ["Milk", "Butter", "Eggs"])
+        milk = tree.children(dairy)[0]
+        self.assertEqual([node.id for node in tree.children(milk)], ["s1001", "s1002"])
+        self.assertEqual(tree.children(milk)[0].path, "Dairy & eggs / Milk / Milk")
+        self.assertEqual(self.paths(), ["/my_store", "/lists/dairy", "/lists/dairy?sublist=milk"])
+
+        # A new tree of the same client is served from the cache of the client.
+        again = LazyCategoryTree(tree._api, prefetch_siblings=0)
+        again.children(again.children(again.roots()[0])[0])
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_following_siblings_are_prefetched(self) -> None:
+        tree = self.tree(prefetch_siblings=1)
+        dairy, breakfast, fresh = tree.roots()
+        tree.children(dairy)
+        deadline = time.monotonic() + 5
+        while breakfast.children is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual([node.name for node in breakfast.children or []], ["Coffee"])
+        self.assertIsNone(fresh.children)
+        tree.children(breakfast)
+        self.assertEqual(self.paths().count("/lists/breakfast"), 1)
+
+    def test_find_loads_subcategories_only_without_top_level_match(self) -> None:
+        tree = self.tree()
+        self.assertEqual(self.found(tree, " DAIRY "), "Dairy & eggs")
+        self.assertEqual(self.paths(), ["/my_store"])
+
+        self.assertEqual(self.found(tree, "vegetables"), "Fruit & vegetables")
+        self.assertEqual(self.found(tree, "butter"), "Dairy & eggs / Butter")
+        self.assertIsNone(tree.find("caviar"))
+        self.assertEqual(sorted(self.paths()), ["/lists/breakfast", "/lists/dairy", "/lists/fresh", "/my_store"])
+
+    def test_find_searches_loaded_categories_before_loading_others(self) -> None:
+        tree = self.tree(max_workers=1)
+        tree.children(tree.roots()[0])
+        self.assertEqual(self.found(tree, "milk"), "Dairy & eggs / Milk")
+        self.assertEqual(self.paths(), ["/my_store", "/lists/dairy"])
+
+        # The other categories are loaded one at a time until one matches, or the budget is used up.
+        self.assertIsNone(tree.find("caviar", max_loads=1))
+        self.assertEqual(self.paths(), ["/my_store", "/lists/dairy", "/lists/breakfast"])
+        self.assertIsNone(tree.find("caviar"))
+        self.assertEqual(self.paths(), ["/my_store", "/lists/dairy", "/lists/breakfast", "/lists/fresh"])
+        self.assertEqual(self.found(tree, "coffee"), "Coffee & breakfast")
+
+    def test_tree_is_written_while_it_is_loaded(self) -> None:
+        tree = self.tree()
+        lines = tree.lines(depth=3)
+        self.assertEqual(next(lines), "├── Dairy & eggs")
+        self.assertEqual(self.paths(), ["/my_store"])
+
+        output = io.StringIO()
+        tree.write(tree.find("coffee"), depth=2, file=output)
+        self.assertEqual(output.getvalue(), "└── Coffee\n    └── 500 gram Coffee beans €5.99\n")
+        self.assertEqual(list(lines)[:3], ["│   ├── Milk", "│   │   ├── 1 liter Milk €1.19",
+                                           "│   │   └── 1 liter Organic milk €1.49"])
+
+    def test_print_categories_streams_the_full_tree(self) -> None:
+        output = io.StringIO()
+        self.stub.client().print_categories(depth=2, file=output)
+        self.assertEqual(output.getvalue().splitlines()[:3], ["├── Dairy & eggs", "│   ├── Milk",
+                                                              "│   │   ├── 1 liter Milk €1.19"])
+        self.assertEqual(output.getvalue().splitlines()[-1], "    └── Vegetables")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import unittest
+from unittest.mock import patch
+
+from python_picnic_api.python_picnic_api import codec
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+
+PAYLOAD = {"items": [{"id": "s1001", "name": "Müsli", "price": 299, "decorators": []}], "total_price": 299.5,
+           "error": None, "flags": [True, False]}
+
+
+class TestCodec(unittest.TestCase):
+    def tearDown(self) -> None:
+        codec.set_default_codec(None)
+
+    def test_codecs_agree(self) -> None:
+        codecs = codec.available_codecs()
+        self.assertEqual(codecs[-1].name, "json")
+        for json_codec in codecs:
+            with self.subTest(json_codec.name):
+                encoded = json_codec.dumps(PAYLOAD)
+                self.assertIsInstance(encoded, bytes)
+                self.assertEqual(json_codec.loads(encoded), PAYLOAD)
+                self.assertEqual(codecs[-1].loads(encoded), PAYLOAD)
+
+    def test_selection_by_environment(self) -> None:
+        with patch.dict(os.environ, {codec.CODEC_ENVIRONMENT_VARIABLE: "json"}):
+            codec.set_default_codec(None)
+            self.assertEqual(codec.default_codec().name, "json")
+        with self.assertRaises(ValueError):
+            codec.get_codec("yaml")
+
+    def test_requests_and_responses_use_the_codec(self) -> None:
+        calls = []
+        json_codec = codec.get_codec("json")
+
+        def dumps(value: object) -> bytes:
+            calls.append("dumps")
+            return json_codec.dumps(value)
+
+        def loads(content: bytes | str) -> object:
+            calls.append("loads")
+            return json_codec.loads(content)
+
+        codec.set_default_codec(codec.JsonCodec("counting", loads, dumps))
+        with PicnicStubServer() as stub:
+            response = stub.client().add_product("s1001", 2)
+        self.assertEqual(response["total_count"], 2)
+        self.assertEqual(calls, ["dumps", "loads"])
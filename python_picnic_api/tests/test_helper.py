@@ -0,0 +1,66 @@
+import unittest
+
+from python_picnic_api.python_picnic_api.helper import _extract_recipe_search_results, _paginate
+
+RECIPE_IDS = ["665d879b27b9fb2099389e95", "665d879b27b9fb2099389e96", "665d879b27b9fb2099389e97"]
+
+
+def recipe_tile(tile_id: str, name: str, image_id: str, details: str) -> dict:
+    return {
+        "id": tile_id,
+        "pml": {"component": {
+            "type": "CONTAINER",
+            "accessibilityLabel": name,
+            "children": [
+                {"type": "IMAGE", "source": {"id": image_id}},
+                {"type": "RICH_TEXT", "markdown": name},
+                {"type": "STACK", "children": [{"type": "RICH_TEXT", "markdown": details}]},
+            ],
+        }},
+    }
+
+
+def search_page(tiles: list[dict], recipe_ids: list[str]) -> dict:
+    return {"body": {"child": {
+        "id": "search-page",
+        "children": [{"id": "recipes-section", "children": tiles}],
+        "analytics": {"contexts": [{"data": {"recipe_ids": recipe_ids}}]},
+    }}}
+
+
+class TestExtractRecipeSearchResults(unittest.TestCase):
+    def setUp(self) -> None:
+        self.page = search_page([
+            recipe_tile(f"recipe-tile__{RECIPE_IDS[0]}", "Pasta pesto", "img-1", "25 min • 2 pers."),
+            recipe_tile(f"recipe-tile__{RECIPE_IDS[1]}", "Lasagne", "img-2", "60 Min."),
+            recipe_tile("recipe-tile__2", "Curry", "img-3", "4 portions"),
+        ], RECIPE_IDS)
+
+    def test_extracts_tile_details_and_ids_below_max_items(self) -> None:
+        result = _extract_recipe_search_results(self.page, max_items=10)
+        self.assertEqual(result["items"], [
+            {"id": RECIPE_IDS[0], "name": "Pasta pesto", "recipe_name": "Pasta pesto",
+             "image_id": "img-1", "preparation_time": 25, "servings": 2},
+            {"id": RECIPE_IDS[1], "name": "Lasagne", "recipe_name": "Lasagne",
+             "image_id": "img-2", "preparation_time": 60, "servings": None},
+            {"id": RECIPE_IDS[2], "name": "Curry", "recipe_name": "Curry",
+             "image_id": "img-3", "preparation_time": None, "servings": 4},
+        ])
+        self.assertIsNone(result["next_offset"])
+
+    def test_pagination(self) -> None:
+        first = _extract_recipe_search_results(self.page, max_items=2)
+        second = _extract_recipe_search_results(self.page, max_items=2, offset=first["next_offset"])
+        self.assertEqual([recipe["name"] for recipe in first["items"]], ["Pasta pesto", "Lasagne"])
+        self.assertEqual(first["next_offset"], 2)
+        self.assertEqual([recipe["name"] for recipe in second["items"]], ["Curry"])
+        self.assertIsNone(second["next_offset"])
+
+    def test_without_analytics(self) -> None:
+        page = search_page([recipe_tile(f"recipe-tile__{RECIPE_IDS[0]}", "Pasta pesto", "img-1", "")], [])
+        page["body"]["child"].pop("analytics")
+        self.assertEqual(_extract_recipe_search_results(page)["items"][0]["id"], RECIPE_IDS[0])
+
+    def test_paginate(self) -> None:
+        self.assertEqual(_paginate([1, 2, 3], None), {"items": [1, 2, 3], "next_offset": None})
+        self.assertEqual(_paginate([1, 2, 3], 1, 1), {"items": [2], "next_offset": 2})
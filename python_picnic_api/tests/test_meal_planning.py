@@ -0,0 +1,71 @@
+import unittest
+from typing import Any
+from unittest import mock
+
+from python_picnic_api.python_picnic_api.helper import _merge_ingredients
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+
+PANCAKES = "665d879b27b9fb2099389e95"
+BANANA_BREAD = "665d879b27b9fb2099389e96"
+ICED_COFFEE = "665d879b27b9fb2099389e97"
+
+
+class TestPlanMeals(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stub = PicnicStubServer().start()
+        self.client = self.stub.client()
+
+    def tearDown(self) -> None:
+        self.stub.stop()
+
+    def test_shared_ingredients_are_added_together(self) -> None:
+        result = self.client.plan_meals([PANCAKES, BANANA_BREAD, ICED_COFFEE])
+
+        # Pancakes, banana bread and iced coffee share butter, eggs and milk, which are bought with the pancakes.
+        self.assertEqual(self.stub.cart_counts(), {"s1001": 2, "s1003": 2, "s1004": 2, "s1005": 1, "s1006": 1})
+        self.assertEqual(result["shared_ingredient_count"], 3)
+        assignments = {body["payload"]["recipe_id"]: body["payload"]["core_ingredients"]
+                       for method, path, query, body in self.stub.requests
+                       if body and path == "/pages/task/assign-recipe-to-day"}
+        self.assertEqual(assignments[PANCAKES], [{"id": "s1001", "quantity": 2}, {"id": "s1003", "quantity": 2},
+                                                 {"id": "s1004", "quantity": 2}])
+        self.assertEqual(assignments[ICED_COFFEE], [{"id": "s1005", "quantity": 1}])
+        self.assertEqual([(recipe["recipe_id"], recipe["day_offset"], recipe["portions"], recipe["error"])
+                          for recipe in result["recipes"]],
+                         [(PANCAKES, 0, 2, None), (BANANA_BREAD, 1, 4, None), (ICED_COFFEE, 2, 1, None)])
+        self.assertEqual(result["cart"]["total_count"], 8)
+
+    def test_portions_and_unknown_recipes(self) -> None:
+        result = self.client.plan_meals([PANCAKES, "unknown", PANCAKES], portions=3, first_day_offset=2)
+
+        self.assertEqual([(recipe["recipe_id"], recipe["day_offset"], recipe["portions"], recipe["error"])
+                          for recipe in result["recipes"]],
+                         [(PANCAKES, 2, 3, None), ("unknown", None, None, "RECIPE_NOT_FOUND")])
+        assignments = [body["payload"] for method, path, query, body in self.stub.requests
+                       if body and path == "/pages/task/assign-recipe-to-day"]
+        self.assertEqual([(payload["recipe_id"], payload["portions"], payload["day_offset"])
+                          for payload in assignments], [(PANCAKES, 3, 2)])
+        cart_requests = [path for method, path, query, body in self.stub.requests if path == "/cart"]
+        self.assertEqual(len(cart_requests), 1)
+
+    def test_failed_assignment_is_reported_for_its_recipe(self) -> None:
+        assign_recipe = self.client._assign_recipe
+
+        def failing_assign_recipe(recipe_id: str, *args: Any) -> Any:
+            if recipe_id == BANANA_BREAD:
+                raise ConnectionError("Connection reset")
+            return assign_recipe(recipe_id, *args)
+
+        self.enterContext(mock.patch.object(self.client, "_assign_recipe", failing_assign_recipe))
+        result = self.client.plan_meals([PANCAKES, BANANA_BREAD, ICED_COFFEE])
+
+        self.assertEqual([(recipe["recipe_id"], recipe["error"]) for recipe in result["recipes"]],
+                         [(PANCAKES, None), (BANANA_BREAD, "ConnectionError"), (ICED_COFFEE, None)])
+        self.assertEqual(self.stub.cart_counts()["s1005"], 1)
+
+    def test_merge_ingredients(self) -> None:
+        cached = [{"id": "a"}, "b"]
+        lists, merged = _merge_ingredients([cached, ["b", {"id": "a", "quantity": 2}, {"id": "c"}]])
+        self.assertEqual(lists, [[{"id": "a", "quantity": 3}, "b"], ["b", {"id": "c"}]])
+        self.assertEqual(merged, 1)
+        self.assertEqual(cached, [{"id": "a"}, "b"])
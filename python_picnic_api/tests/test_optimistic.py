@@ -0,0 +1,71 @@
+import threading
+import time
+import unittest
+
+from python_picnic_api.python_picnic_api import Cart
+from python_picnic_api.python_picnic_api.optimistic import OptimisticCart
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+
+
+def counts(cart: Cart) -> dict:
+    return {line.product_id: line.count for line in cart}
+
+
+class TestOptimisticCart(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stub = PicnicStubServer(latency=0.05).start()
+        self.confirmed = Cart()
+        self.confirmed_lock = threading.Lock()
+        self.optimistic = OptimisticCart(self.stub.client(), on_confirmed=self.on_confirmed)
+
+    def tearDown(self) -> None:
+        self.optimistic.close()
+        self.stub.stop()
+
+    def on_confirmed(self, payload: dict) -> None:
+        with self.confirmed_lock:
+            self.confirmed = Cart.from_payload(payload, previous=self.confirmed)
+
+    def test_prediction_is_immediate(self) -> None:
+        start = time.monotonic()
+        self.optimistic.add_product("s1001", count=2, name="Milk", price=119)
+        predicted = self.optimistic.predict(self.confirmed)
+        self.assertLess(time.monotonic() - start, self.stub.latency)
+        self.assertEqual(counts(predicted), {"s1001": 2})
+        self.assertEqual(predicted.total_price, 238)
+        self.assertNotIn("s1001", self.confirmed)
+
+        self.assertTrue(self.optimistic.wait(timeout=5))
+        self.assertEqual(counts(self.confirmed), {"s1001": 2})
+        self.assertEqual(counts(self.optimistic.predict(self.confirmed)), {"s1001": 2})
+
+    def test_mutations_of_a_product_keep_their_order(self) -> None:
+        self.stub.jitter = 0.05
+        for action in ["add", "add", "remove", "add", "remove", "remove"]:
+            if action == "add":
+                self.optimistic.add_product("s1003")
+            else:
+                self.optimistic.remove_product("s1003")
+            self.optimistic.add_product("s1004")
+        self.assertTrue(self.optimistic.wait(timeout=10))
+
+        paths = [path for method, path, query, body in self.stub.requests if body and body["product_id"] == "s1003"]
+        self.assertEqual(paths, ["/cart/add_product", "/cart/add_product", "/cart/remove_product",
+                                 "/cart/add_product", "/cart/remove_product", "/cart/remove_product"])
+        self.assertNotIn("s1003", self.stub.cart_counts())
+        self.assertEqual(self.stub.cart_counts()["s1004"], 6)
+
+    def test_failures_are_reported_once(self) -> None:
+        self.stub.failures["s1005"] = "PRODUCT_UNAVAILABLE"
+        self.optimistic.add_product("s1005", name="Coffee beans", price=599)
+        self.optimistic.add_product("s1006")
+        self.assertEqual(self.optimistic.predict(self.confirmed).total_count, 2)
+        self.assertTrue(self.optimistic.wait(timeout=5))
+
+        failures = self.optimistic.drain_failures()
+        self.assertEqual([(f.product_id, f.code, f.name) for f in failures],
+                         [("s1005", "PRODUCT_UNAVAILABLE", "Coffee beans")])
+        self.assertEqual(self.optimistic.drain_failures(), [])
+        predicted = self.optimistic.predict(self.confirmed)
+        self.assertNotIn("s1005", predicted)
+        self.assertIn("s1006", predicted)
@@ -0,0 +1,40 @@
+import json
+import unittest
+
+from python_picnic_api.python_picnic_api.parsing import ParsingExecutor, parse_recipe_ingredients, \
+    parse_search_results
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+
+
+class TestParsingExecutor(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.executor = ParsingExecutor(max_workers=1, inline_limit=0)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.executor.shutdown()
+
+    def test_results_match_inline_parsing(self) -> None:
+        with PicnicStubServer() as stub:
+            inline_client = stub.client()
+            pooled_client = stub.client()
+            pooled_client.parsing_executor = self.executor
+            # Different terms, so that neither single-flight nor caches share the results.
+            self.assertEqual(pooled_client.search("milk"), inline_client.search("Milk"))
+            self.assertEqual(pooled_client.get_recipe_ingredients("665d879b27b9fb2099389e96"),
+                             inline_client.get_recipe_ingredients("665d879b27b9fb2099389e96"))
+
+    def test_small_payloads_are_parsed_inline(self) -> None:
+        executor = ParsingExecutor(max_workers=1)
+        try:
+            # A lambda cannot be sent to a worker process, so this only works inline.
+            self.assertEqual(executor.parse(lambda content: json.loads(content), b'{"a": 1}'), {"a": 1})
+        finally:
+            executor.shutdown()
+
+    def test_errors_are_kept(self) -> None:
+        content = json.dumps({"error": {"code": "AUTH_ERROR"}}).encode()
+        self.assertEqual(self.executor.parse(parse_search_results, content)["error"], {"code": "AUTH_ERROR"})
+        self.assertEqual(parse_recipe_ingredients(b'{"body": {"child": {}}}')["error"]["code"],
+                         "RECIPE_INGREDIENTS_NOT_FOUND")
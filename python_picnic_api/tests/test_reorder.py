@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+
+
+class TestReorderList(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stub = self.enterContext(PicnicStubServer())
+        self.client = self.stub.client()
+
+    def test_sublist_is_added_at_once_with_errors_per_product(self) -> None:
+        self.stub.failures["s1006"] = "PRODUCT_UNAVAILABLE"
+        result = self.client.reorder_list("purchases", "last-week")
+
+        self.assertEqual([(item["product_id"], item["name"], item["count"], item["error"]) for item in result["items"]],
+                         [("s1001", "Milk", 2, None), ("s1003", "Butter", 1, None),
+                          ("s1006", "Bananas", 1, "PRODUCT_UNAVAILABLE")])
+        self.assertEqual(self.stub.cart_counts(), {"s1001": 2, "s1003": 1})
+        self.assertEqual(result["cart"]["total_count"], 3)
+        self.assertGreaterEqual(result["sequential_seconds"], 0)
+        self.assertEqual(len([path for method, path, query, body in self.stub.requests if path == "/cart"]), 1)
+
+    def test_whole_list_sums_sublists_and_resolves_articles_from_the_cache(self) -> None:
+        self.client.get_article("s1001")
+        result = self.client.reorder_list("purchases")
+
+        self.assertEqual({item["product_id"]: item["count"] for item in result["items"]},
+                         {"s1001": 3, "s1003": 1, "s1006": 1, "s1005": 1})
+        self.assertEqual(self.stub.cart_counts(), {"s1001": 3, "s1003": 1, "s1006": 1, "s1005": 1})
+        article_requests = [path for method, path, query, body in self.stub.requests if path.startswith("/articles/")]
+        self.assertEqual(sorted(article_requests), ["/articles/s1001", "/articles/s1003", "/articles/s1005",
+                                                    "/articles/s1006"])
+
+    def test_sublist_that_could_not_be_read_is_reported(self) -> None:
+        get_sublist = self.client.get_sublist
+
+        def failing_get_sublist(list_id: str, sublist_id: str) -> dict:
+            if sublist_id == "two-weeks-ago":
+                return {"error": {"code": "SERVER_ERROR"}}
+            return get_sublist(list_id, sublist_id)
+
+        self.enterContext(mock.patch.object(self.client, "get_sublist", side_effect=failing_get_sublist))
+        result = self.client.reorder_list("purchases")
+
+        self.assertEqual(result["failed_sublists"], [{"sublist_id": "two-weeks-ago", "error": "SERVER_ERROR"}])
+        self.assertEqual(self.stub.cart_counts(), {"s1001": 2, "s1003": 1, "s1006": 1})
+
+    def test_unknown_list(self) -> None:
+        self.assertEqual(self.client.reorder_list("unknown"), {"error": "NOT_FOUND", "items": []})
+        self.assertEqual(self.client.reorder_list("purchases", "unknown"), {"error": "NOT_FOUND", "items": []})
+        self.assertEqual(self.stub.cart_counts(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import time
+import unittest
+
+from python_picnic_api.python_picnic_api.helper import _normalize_search_terms
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+
+
+class TestSearchMany(unittest.TestCase):
+    def test_terms_are_normalized_and_deduplicated(self) -> None:
+        self.assertEqual(_normalize_search_terms([" Milk", "eggs", "milk ", "", "  ", "Coffee   beans"]),
+                         ["milk", "eggs", "coffee beans"])
+
+    def test_terms_are_searched_once_and_concurrently(self) -> None:
+        with PicnicStubServer(latency=0.2) as stub:
+            client = stub.client()
+            start = time.perf_counter()
+            results = client.search_many(["Milk", "eggs", "MILK", "butter", "caviar"])
+            elapsed = time.perf_counter() - start
+
+            self.assertEqual({term: [item["id"] for item in result["items"]] for term, result in results.items()},
+                             {"milk": ["s1001", "s1002"], "eggs": ["s1004"], "butter": ["s1003"], "caviar": []})
+            self.assertEqual(len(stub.requests), 4)
+            # Four searches of 0.2 seconds each would take 0.8 seconds one after another.
+            self.assertLess(elapsed, 0.6)
+
+
+if __name__ == "__main__":
+    unittest.main()
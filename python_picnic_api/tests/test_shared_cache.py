@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from python_picnic_api.python_picnic_api.shared_cache import SharedCacheStore
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+
+from .test_cache import FakeClock
+
+ENTRIES_PER_WORKER = 200
+
+
+def write_and_read(path: str, worker: int) -> int:
+    store = SharedCacheStore(path)
+    cache = store.cache("shared", maxsize=10_000)
+    for index in range(ENTRIES_PER_WORKER):
+        cache.set(f"{worker}-{index}", {"worker": worker, "index": index})
+    return sum(cache.get(f"{worker}-{index}") == {"worker": worker, "index": index}
+               for index in range(ENTRIES_PER_WORKER))
+
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite")
+        self.clock = FakeClock()
+        self.store = SharedCacheStore(self.path, clock=self.clock)
+        self.addCleanup(self.store.close)
+
+    def test_entries_expire_and_values_round_trip(self) -> None:
+        cache = self.store.cache("search", maxsize=2, ttl=10)
+        cache.set("milk", {"items": [{"id": "s1001"}]})
+        cache.set(("cart", "milk"), b"\x00\x01", ttl=100)
+        self.assertEqual(cache.get("milk"), {"items": [{"id": "s1001"}]})
+        self.assertEqual(cache.get(("cart", "milk")), b"\x00\x01")
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+
+        self.clock.now += 10
+        self.assertIsNone(cache.get("milk"))
+        self.assertNotIn("milk", cache)
+        self.assertEqual([key for key, value, expires_at in cache.items()], [("cart", "milk")])
+
+    def test_least_recently_used_entry_of_the_namespace_is_evicted(self) -> None:
+        cache = self.store.cache("search", maxsize=2)
+        other = self.store.cache("articles", maxsize=2)
+        other.set("a", 0)
+        for key in ("a", "b"):
+            cache.set(key, 1)
+            self.clock.now += 2
+        cache.get("a")
+        self.clock.now += 2
+        cache.set("c", 3)
+
+        self.assertNotIn("b", cache)
+        self.assertEqual((len(cache), len(other)), (2, 1))
+        self.assertEqual(other.get("a"), 0)
+
+    def test_least_recently_used_entries_are_evicted_above_max_bytes(self) -> None:
+        store = SharedCacheStore(self.path, max_bytes=1000, clock=self.clock)
+        cache = store.cache("phrases", maxsize=100)
+        for index in range(10):
+            cache.set(str(index), bytes(300))
+            self.clock.now += 1
+        store.maintain()
+        self.assertEqual(sorted(key for key, value, expires_at in cache.items()), ["7", "8", "9"])
+
+    def test_concurrent_processes(self) -> None:
+        workers = 4
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            read_back = pool.starmap(write_and_read, [(self.path, worker) for worker in range(workers)])
+        self.assertEqual(read_back, [ENTRIES_PER_WORKER] * workers)
+        self.assertEqual(len(self.store.cache("shared")), workers * ENTRIES_PER_WORKER)
+
+    def test_clients_share_responses_of_the_same_user_only(self) -> None:
+        with PicnicStubServer() as stub:
+            # Separate stores, like in separate worker processes.
+            first, other_worker, other_user = (stub.client(auth_token, cache_store=SharedCacheStore(self.path))
+                                               for auth_token in ("alice", "alice", "bob"))
+            first.search("milk")
+            other_worker.search("milk")
+            self.assertEqual(len(stub.requests), 1)
+            other_user.search("milk")
+            self.assertEqual(len(stub.requests), 2)
+            self.assertEqual(other_worker.search_cache.hits, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from python_picnic_api.python_picnic_api.singleflight import SingleFlight, SingleFlightStats
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self) -> None:
+        single_flight = SingleFlight()
+        release = threading.Event()
+        executions = []
+
+        def function() -> dict:
+            executions.append(1)
+            release.wait()
+            return {"result": 42}
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(single_flight.do, "key", function) for _ in range(4)]
+            while single_flight.stats.calls < 4:
+                time.sleep(0.001)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(len(executions), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(single_flight.stats, SingleFlightStats(calls=4, executions=1, shared=3))
+
+    def test_errors_are_propagated_to_all_callers(self) -> None:
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def function() -> dict:
+            release.wait()
+            raise ValueError("failed")
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(single_flight.do, "key", function) for _ in range(3)]
+            while single_flight.stats.calls < 3:
+                time.sleep(0.001)
+            release.set()
+            for future in futures:
+                self.assertRaises(ValueError, future.result)
+
+        # Nothing is cached, the next call executes again.
+        self.assertEqual(single_flight.do("key", lambda: "ok"), "ok")
+
+    def test_identical_requests_are_sent_once_per_user(self) -> None:
+        single_flight = SingleFlight()
+        with PicnicStubServer(latency=0.2) as stub:
+            clients = [stub.client(auth_token="user-a"), stub.client(auth_token="user-a"),
+                       stub.client(auth_token="user-b")]
+            for client in clients:
+                client._single_flight = single_flight
+
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                futures = [executor.submit(client.search, "milk") for client in clients * 2]
+                results = [future.result() for future in futures]
+
+            searches = [request for request in stub.requests if request[1] == "/pages/search-page-results"]
+            self.assertEqual(len(searches), 2)
+            self.assertEqual(single_flight.stats.executions, 2)
+            self.assertEqual(single_flight.stats.shared, 4)
+            self.assertTrue(all(result == results[0] for result in results))
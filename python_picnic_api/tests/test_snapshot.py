@@ -0,0 +1,81 @@
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+
+from python_picnic_api.python_picnic_api.cache import TTLCache
+from python_picnic_api.python_picnic_api.snapshot import load_snapshot, save_snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "caches.snapshot")
+        self.search_cache = TTLCache()
+        self.phrase_cache = TTLCache()
+        self.search_cache.set("milk", {"items": [{"id": "s1001", "name": "Milch", "display_price": 119}]})
+        self.search_cache.set("eggs", {"items": []}, ttl=5)
+        self.phrase_cache.set("Hallo!", b"\x00\x01\x02")
+
+    def test_round_trip(self) -> None:
+        self.assertEqual(save_snapshot(self.path, {"search": self.search_cache, "phrases": self.phrase_cache}), 3)
+
+        search_cache, phrase_cache = TTLCache(), TTLCache()
+        loaded = load_snapshot(self.path, {"search": search_cache, "phrases": phrase_cache})
+        self.assertEqual(loaded, 3)
+        self.assertEqual(search_cache.get("milk"), self.search_cache.get("milk"))
+        self.assertEqual(phrase_cache.get("Hallo!"), b"\x00\x01\x02")
+        self.assertEqual(list(search_cache.items()), list(self.search_cache.items()))
+
+    def test_expired_entries_are_skipped(self) -> None:
+        save_snapshot(self.path, {"search": self.search_cache})
+        expires_at = {key: expires_at for key, value, expires_at in self.search_cache.items()}
+
+        search_cache = TTLCache()
+        self.assertEqual(load_snapshot(self.path, {"search": search_cache}, now=expires_at["eggs"]), 1)
+        self.assertIn("milk", search_cache)
+        self.assertNotIn("eggs", search_cache)
+
+    def test_unknown_namespaces_are_skipped(self) -> None:
+        save_snapshot(self.path, {"search": self.search_cache, "phrases": self.phrase_cache})
+        self.assertEqual(load_snapshot(self.path, {"phrases": TTLCache()}), 1)
+
+    def test_corrupt_or_missing_snapshot_is_ignored(self) -> None:
+        self.assertEqual(load_snapshot(self.path, {"search": TTLCache()}), 0)
+
+        save_snapshot(self.path, {"search": self.search_cache})
+        with open(self.path, "r+b") as f:
+            f.seek(-3, os.SEEK_END)
+            f.write(b"xyz")
+        search_cache = TTLCache()
+        self.assertEqual(load_snapshot(self.path, {"search": search_cache}), 0)
+        self.assertEqual(len(search_cache), 0)
+
+    def test_wrong_entry_count_loads_the_entries_that_fit(self) -> None:
+        save_snapshot(self.path, {"search": self.search_cache})
+        with open(self.path, "r+b") as f:
+            # The count is not covered by the checksum.
+            f.seek(8)
+            f.write(struct.pack("<I", 1000))
+        search_cache = TTLCache()
+        self.assertEqual(load_snapshot(self.path, {"search": search_cache}), 2)
+        self.assertIn("milk", search_cache)
+
+    def test_entries_with_wrong_lengths_are_not_loaded(self) -> None:
+        for entry in (struct.pack("<dBBHI", 1e12, 0, 6, 4, 1000) + b"searchmilk{}",
+                      struct.pack("<dBBHI", 1e12, 0, 6, 2, 2) + b"search\xff\xfe{}"):
+            with self.subTest(entry=entry):
+                with open(self.path, "wb") as f:
+                    f.write(struct.pack("<4sHHII", b"PCNS", 1, 0, 1, zlib.crc32(entry)) + entry)
+                self.assertEqual(load_snapshot(self.path, {"search": TTLCache()}), 0)
+
+    def test_entries_too_long_for_the_layout_are_not_saved(self) -> None:
+        self.search_cache.set("x" * 70000, {"items": []})
+        namespace = "n" * 300
+        self.assertEqual(save_snapshot(self.path, {"search": self.search_cache, namespace: self.phrase_cache}), 2)
+
+        search_cache = TTLCache()
+        self.assertEqual(load_snapshot(self.path, {"search": search_cache}), 2)
+        self.assertEqual({key for key, value, expires_at in search_cache.items()}, {"milk", "eggs"})
@@ -0,0 +1,83 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from python_picnic_api.python_picnic_api.session import PicnicAPISession
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from python_picnic_api.python_picnic_api.throttle import AdaptiveConcurrencyLimit, RequestThrottle, TokenBucket, \
+    endpoint_class
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestThrottle(unittest.TestCase):
+    def test_endpoint_class(self) -> None:
+        base_url = "https://storefront-prod.de.picnicinternational.com/api/15"
+        self.assertEqual(endpoint_class(base_url + "/pages/search-page-results?search_term=milk"), "search")
+        self.assertEqual(endpoint_class(base_url + "/cart/add_product"), "cart")
+        self.assertEqual(endpoint_class(base_url + "/pages/recipe-details-page?recipe_id=1"), "pages")
+        self.assertEqual(endpoint_class(base_url + "/user"), "default")
+
+    def test_token_bucket(self) -> None:
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2.0, burst=2, clock=clock)
+        self.assertEqual([bucket.reserve(), bucket.reserve()], [0.0, 0.0])
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+        self.assertAlmostEqual(bucket.reserve(), 1.0)
+        clock.now = 1.0
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+
+    def test_adaptive_concurrency_limit(self) -> None:
+        clock = FakeClock()
+        limit = AdaptiveConcurrencyLimit(initial=8, max_limit=10, clock=clock)
+        for _ in range(20):
+            limit.acquire()
+            limit.release(200, 0.1)
+        self.assertEqual(limit.limit, 10)
+
+        limit.acquire()
+        limit.release(429, 0.1)
+        self.assertEqual(limit.limit, 5)
+        # A second overload signal within the same round-trip does not decrease the limit again.
+        limit.acquire()
+        limit.release(503, 0.1)
+        self.assertEqual(limit.limit, 5)
+
+        clock.now = 1.0
+        limit.acquire()
+        limit.release(200, 1.0)
+        self.assertEqual(limit.limit, 2)
+        self.assertEqual(limit.decreases, 2)
+
+    def test_stays_within_server_rate_limit(self) -> None:
+        with PicnicStubServer(rate_limit=(5, 0.25)) as stub:
+            client = stub.client()
+            client.session = PicnicAPISession(auth_token="stub", throttle=RequestThrottle({"search": (10.0, 2)}))
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                list(executor.map(lambda i: client.search(f"milk{i}"), range(12)))
+
+            stats = client.session.throttle.stats
+            self.assertEqual(stub.rejected, 0)
+            self.assertEqual(stats.requests, 12)
+            self.assertGreater(stats.throttled, 0)
+            self.assertGreater(stats.max_queue_depth, 1)
+            self.assertEqual(stats.queue_depth, 0)
+
+    def test_backs_off_when_rate_limited(self) -> None:
+        with PicnicStubServer(latency=0.02, rate_limit=(3, 1.0)) as stub:
+            client = stub.client()
+            throttle = RequestThrottle({"search": (1000.0, 1000)}, AdaptiveConcurrencyLimit(initial=8))
+            client.session = PicnicAPISession(auth_token="stub", throttle=throttle)
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(lambda i: client.search(f"milk{i}"), range(16)))
+
+            stats = throttle.stats
+            self.assertGreater(stub.rejected, 0)
+            self.assertEqual(stats.overload_responses, stub.rejected)
+            self.assertLess(stats.concurrency_limit, 8)
+            self.assertGreater(stats.limit_decreases, 0)
@@ -0,0 +1,59 @@
+"""Backoff and metrics of reconnecting to the Gemini Live session after the connection dropped."""
+import random
+import sys
+from dataclasses import dataclass
+from typing import Iterator
+
+
+def connection_errors() -> tuple[type[BaseException], ...]:
+    """Return the exception types that mean that the Live connection is gone.
+
+    The Live client raises websockets' ConnectionClosed, which does not derive from ConnectionError. It is only
+    included once websockets was imported by the client, so that the agent does not import it at startup.
+    """
+    websockets_exceptions = sys.modules.get("websockets.exceptions")
+    closed = (websockets_exceptions.ConnectionClosed,) if websockets_exceptions is not None else ()
+    return (ConnectionError, OSError, EOFError, *closed)
+
+
+@dataclass
+class Backoff:
+    """Delays before reconnect attempts: the first attempt right away, then exponentially growing with full jitter.
+
+    Args:
+        initial: Upper bound of the delay before the second attempt, in seconds.
+        maximum: Upper bound of any delay, in seconds.
+        attempts: Attempts after which reconnecting is given up.
+    """
+    initial: float = 0.1
+    maximum: float = 5.0
+    attempts: int = 10
+
+    def delays(self) -> Iterator[float]:
+        for attempt in range(self.attempts):
+            yield 0.0 if attempt == 0 else random.uniform(0, min(self.maximum, self.initial * 2 ** (attempt - 1)))
+
+
+@dataclass
+class ReconnectStats:
+    """Accumulated disconnects of the Live session and the time it took to reconnect."""
+    disconnects: int = 0
+    reconnects: int = 0
+    failed_attempts: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    # Mic audio chunks captured while reconnecting, and those that did not fit into the buffer.
+    buffered_audio_chunks: int = 0
+    dropped_audio_chunks: int = 0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.reconnects if self.reconnects else 0.0
+
+    def record(self, seconds: float) -> None:
+        self.reconnects += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+
+__all__ = ["Backoff", "ReconnectStats", "connection_errors"]
@@ -0,0 +1,325 @@
+"""Recording and deterministic replay of agent sessions.
+
+A recording is a JSON lines file (gzip compressed if the name ends with .gz) with one event per line, in the order
+they happened and with their time in seconds since the recording started:
+
+- Live session events received from Gemini: text, tool calls, audio (only its length) and turn completions.
+- Live session inputs sent to Gemini: typed text and tool responses. Microphone audio is not recorded.
+- Picnic HTTP exchanges: method, path, request body, status, response body and duration. Headers are not recorded,
+  so recordings contain no auth tokens, and the login happens before the recorder is installed.
+
+On replay, ReplayLiveSession plays the Live events back to AudioLoop.receive_audio with the recorded gaps, divided by
+the speed. User prompts are replayed at their recorded time; events after a tool call wait until the agent actually
+sent its tool responses, so tool latency is measured for real. Picnic requests are answered from the recording by
+ReplayHTTPAdapter, after the recorded duration divided by the speed.
+"""
+import asyncio
+import gzip
+import io
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import IO, Any, AsyncContextManager, AsyncIterator, Callable, Deque, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from requests import PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from requests.structures import CaseInsensitiveDict
+
+
+def _open(path: str | Path, mode: str) -> IO[str]:
+    if str(path).endswith(".gz"):
+        return io.TextIOWrapper(gzip.GzipFile(path, mode), encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def load_recording(path: str | Path) -> List[dict]:
+    with _open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class SessionRecorder:
+    """Writes the events of a session to a recording file. Events can be recorded from any thread."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = _open(self.path, "w")
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+
+    def record(self, kind: str, **fields: Any) -> None:
+        event = {"t": round(time.perf_counter() - self._started_at, 6), "kind": kind, **fields}
+        line = json.dumps(event, separators=(",", ":"), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> "SessionRecorder":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def _path_of(url: str) -> str:
+    """Path and query of a URL, so that recordings do not depend on the host they were made with."""
+    parts = urlsplit(url)
+    return parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+def _body_of(request: PreparedRequest) -> str | None:
+    body = request.body
+    if isinstance(body, bytes):
+        return body.decode("utf-8")
+    return body
+
+
+# Live session
+
+
+def _function_call(function_call: Any) -> dict:
+    return {"name": function_call.name, "args": dict(function_call.args or {}), "id": function_call.id}
+
+
+def _input_kind(input: Any) -> str:
+    if isinstance(input, str):
+        return "text"
+    if isinstance(input, dict) and "data" in input:
+        return "audio"
+    return "tool_response"
+
+
+class RecordingLiveSession:
+    """Wraps a Live session and records what is received and sent."""
+
+    def __init__(self, session: Any, recorder: SessionRecorder):
+        self._session = session
+        self._recorder = recorder
+
+    async def send(self, input: Any, end_of_turn: bool = False) -> None:
+        kind = _input_kind(input)
+        if kind == "text":
+            self._recorder.record("sent", input="text", text=input, end_of_turn=end_of_turn)
+        elif kind == "tool_response":
+            self._recorder.record("sent", input="tool_response", responses=input)
+        await self._session.send(input, end_of_turn=end_of_turn)
+
+    async def receive(self) -> AsyncIterator[Any]:
+        async for response in self._session.receive():
+            if response.data:
+                self._recorder.record("received", event="audio", length=len(response.data))
+            elif response.text:
+                self._recorder.record("received", event="text", text=response.text)
+            elif response.tool_call:
+                function_calls = [_function_call(call) for call in response.tool_call.function_calls]
+                self._recorder.record("received", event="tool_call", function_calls=function_calls)
+            yield response
+        self._recorder.record("received", event="turn_complete")
+
+
+def recording_connect(
+        connect: Callable[[], AsyncContextManager[Any]], recorder: SessionRecorder
+) -> Callable[[], AsyncContextManager[Any]]:
+    """Wrap the connect function of AudioLoop, so that the Live session is recorded."""
+    @asynccontextmanager
+    async def connect_and_record() -> AsyncIterator[RecordingLiveSession]:
+        async with connect() as session:
+            yield RecordingLiveSession(session, recorder)
+
+    return connect_and_record
+
+
+def live_response(event: dict) -> SimpleNamespace:
+    """A response object with the attributes of a Live session response that AudioLoop uses."""
+    response = SimpleNamespace(data=None, text=None, tool_call=None)
+    if event["event"] == "audio":
+        response.data = bytes(event["length"])
+    elif event["event"] == "text":
+        response.text = event["text"]
+    elif event["event"] == "tool_call":
+        response.tool_call = SimpleNamespace(
+            function_calls=[SimpleNamespace(**function_call) for function_call in event["function_calls"]])
+    return response
+
+
+class ReplayLiveSession:
+    """Plays the Live session events of a recording back, at the recorded speed times speed.
+
+    Attributes:
+        turn_latencies: Seconds from each replayed user prompt (or the start) to the end of its turn.
+        sent: Everything the agent sent, as (input kind, input).
+        finished: Set once all turns were replayed.
+    """
+
+    def __init__(self, events: List[dict], speed: float = 1.0):
+        self.speed = speed
+        self.turn_latencies: List[float] = []
+        self.sent: List[Tuple[str, Any]] = []
+        self.finished = asyncio.Event()
+        self._events = deque(event for event in events if event["kind"] in ("sent", "received"))
+        self._tool_responses = asyncio.Condition()
+        self._tool_responses_sent = 0
+        self._tool_responses_expected = 0
+        # Wall clock and recorded time of the last point at which replay and recording were in sync, set when
+        # receiving starts.
+        self._anchor: Tuple[float, float] | None = None
+        self._turn_started_at = 0.0
+
+    async def send(self, input: Any, end_of_turn: bool = False) -> None:
+        kind = _input_kind(input)
+        self.sent.append((kind, input))
+        if kind == "tool_response":
+            async with self._tool_responses:
+                self._tool_responses_sent += 1
+                self._tool_responses.notify_all()
+
+    async def _wait_until(self, recorded_time: float) -> None:
+        assert self._anchor is not None
+        anchor_wall, anchor_recorded = self._anchor
+        delay = anchor_wall + (recorded_time - anchor_recorded) / self.speed - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _sync(self, recorded_time: float) -> None:
+        self._anchor = (time.perf_counter(), recorded_time)
+
+    async def receive(self) -> AsyncIterator[SimpleNamespace]:
+        if self._anchor is None:
+            self._sync(self._events[0]["t"] if self._events else 0.0)
+            self._turn_started_at = time.perf_counter()
+        while self._events:
+            event = self._events.popleft()
+            if event["kind"] == "sent":
+                if event["input"] == "tool_response":
+                    # The next events were caused by the tool responses, so wait for the agent to send them.
+                    self._tool_responses_expected += 1
+                    async with self._tool_responses:
+                        await self._tool_responses.wait_for(
+                            lambda: self._tool_responses_sent >= self._tool_responses_expected)
+                else:
+                    await self._wait_until(event["t"])
+                    if event.get("end_of_turn"):
+                        self._turn_started_at = time.perf_counter()
+                self._sync(event["t"])
+                continue
+
+            await self._wait_until(event["t"])
+            if event["event"] == "turn_complete":
+                self.turn_latencies.append(time.perf_counter() - self._turn_started_at)
+                return
+            yield live_response(event)
+
+        self.finished.set()
+        # Like a Live session without new input, there is nothing to receive anymore.
+        await asyncio.Event().wait()
+
+    def connect(self) -> AsyncContextManager["ReplayLiveSession"]:
+        """Connect function for AudioLoop, which returns this session."""
+        @asynccontextmanager
+        async def connect() -> AsyncIterator[ReplayLiveSession]:
+            yield self
+
+        return connect()
+
+
+async def replay_session(audio_loop: Any, session: ReplayLiveSession) -> None:
+    """Drive the receive and playback tasks of an AudioLoop with a replayed session until all turns were replayed."""
+    audio_loop.session = session
+    audio_loop.audio_in_queue = asyncio.Queue()
+    tasks = [asyncio.create_task(audio_loop.receive_audio()), asyncio.create_task(audio_loop.play_audio())]
+    finished = asyncio.create_task(session.finished.wait())
+    try:
+        done, _ = await asyncio.wait([finished, *tasks], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            # Surfaces errors of the AudioLoop tasks.
+            task.result()
+    finally:
+        for task in [finished, *tasks]:
+            task.cancel()
+        await asyncio.gather(finished, *tasks, return_exceptions=True)
+
+
+# Picnic HTTP
+
+
+class RecordingHTTPAdapter(HTTPAdapter):
+    """Transport adapter that records the exchanges of a requests session."""
+
+    def __init__(self, recorder: SessionRecorder):
+        super().__init__()
+        self._recorder = recorder
+
+    def send(self, request: PreparedRequest, *args: Any, **kwargs: Any) -> Response:
+        start = time.perf_counter()
+        response = super().send(request, *args, **kwargs)
+        self._recorder.record(
+            "http", method=request.method, path=_path_of(request.url or ""), body=_body_of(request),
+            status=response.status_code, response=response.content.decode("utf-8"),
+            elapsed=round(time.perf_counter() - start, 6))
+        return response
+
+
+class ReplayHTTPAdapter(HTTPAdapter):
+    """Transport adapter that answers requests with the exchanges of a recording.
+
+    Requests are matched by method, path and body, and then by method and path only; identical requests get the
+    recorded responses in their recorded order. Requests without a recorded response raise a ConnectionError.
+    """
+
+    def __init__(self, events: List[dict], speed: float = 1.0):
+        super().__init__()
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._exchanges: Dict[tuple, Deque[dict]] = defaultdict(deque)
+        for event in events:
+            if event["kind"] == "http":
+                self._exchanges[(event["method"], event["path"], event["body"])].append(event)
+                self._exchanges[(event["method"], event["path"])].append(event)
+
+    def _take(self, request: PreparedRequest) -> dict | None:
+        path = _path_of(request.url or "")
+        with self._lock:
+            for key in ((request.method, path, _body_of(request)), (request.method, path)):
+                exchanges = self._exchanges.get(key)
+                while exchanges:
+                    exchange = exchanges.popleft()
+                    if not exchange.get("used"):
+                        exchange["used"] = True
+                        return exchange
+        return None
+
+    def send(self, request: PreparedRequest, *args: Any, **kwargs: Any) -> Response:
+        exchange = self._take(request)
+        if exchange is None:
+            raise ConnectionError(f"No recorded response for {request.method} {request.url}", request=request)
+        if self.speed and exchange["elapsed"]:
+            time.sleep(exchange["elapsed"] / self.speed)
+
+        response = Response()
+        response.status_code = exchange["status"]
+        response._content = exchange["response"].encode("utf-8")
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+        response.encoding = "utf-8"
+        response.url = request.url or ""
+        response.request = request
+        return response
+
+
+def install_http_adapter(session: Any, adapter: HTTPAdapter) -> None:
+    """Route all requests of a requests session, e.g. PicnicAPI.session, through an adapter."""
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+__all__ = ["RecordingHTTPAdapter", "RecordingLiveSession", "ReplayHTTPAdapter", "ReplayLiveSession",
+           "SessionRecorder", "install_http_adapter", "live_response", "load_recording", "recording_connect",
+           "replay_session"]
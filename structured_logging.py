@@ -0,0 +1,183 @@
+"""Structured logging that keeps formatting and writing off the event loop.
+
+Events are logged with log_event as a name and fields, e.g. the payload of a tool call. The level is checked before
+anything else, so a disabled event costs a method call: its fields are neither formatted nor copied. Enabled events
+are put on a queue as they are, and a background thread formats and writes them. Large fields are cut to a maximum
+size, and high-volume events can be sampled. The Picnic client logs its requests with the standard logging module,
+which goes through the same writer once configure_logging was called.
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Any, TextIO
+
+from python_picnic_api.python_picnic_api import codec
+
+LOG_LEVEL = os.environ.get("PICNIC_LOG_LEVEL", "INFO").upper()
+# "text" for one "event key=value ..." line per event, "json" for JSON lines.
+LOG_FORMAT = os.environ.get("PICNIC_LOG_FORMAT", "text").lower()
+# Fields are cut to this many bytes once formatted, e.g. a large cart or recipe payload.
+MAX_FIELD_BYTES = int(os.environ.get("PICNIC_LOG_MAX_FIELD_BYTES", "2000"))
+# Events that are waiting to be written; further events are dropped instead of blocking the caller.
+MAX_QUEUED_EVENTS = 10000
+
+
+@dataclass
+class LogStats:
+    """Counters of the events that were logged, or left out on the way."""
+    written: int = 0
+    sampled_out: int = 0
+    dropped: int = 0
+    truncated_fields: int = 0
+
+
+_stats = LogStats()
+_stats_lock = threading.Lock()
+
+
+def log_stats() -> LogStats:
+    return _stats
+
+
+def _count(**increments: int) -> None:
+    with _stats_lock:
+        for name, increment in increments.items():
+            setattr(_stats, name, getattr(_stats, name) + increment)
+
+
+def log_event(logger: logging.Logger, level: int, event: str, sample: float = 1.0, **fields: Any) -> None:
+    """Log an event with fields, if the level of the logger is enabled.
+
+    The fields are formatted later by the writer, so they must not be mutated after the call.
+
+    Args:
+        logger: Logger of the module that logs the event.
+        level: Level of the event, e.g. logging.DEBUG.
+        event: Name of the event, e.g. "tool_call".
+        sample: Share of the events that is logged, for high-volume events.
+        **fields: Values that are logged with the event.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sample < 1.0 and random.random() >= sample:
+        _count(sampled_out=1)
+        return
+    logger.log(level, event, extra={"fields": fields}, stacklevel=2)
+
+
+def _cut(text: str, max_bytes: int) -> str:
+    data = text.encode("utf-8")
+    if len(data) <= max_bytes:
+        return text
+    _count(truncated_fields=1)
+    return data[:max_bytes].decode("utf-8", errors="ignore") + f"…(+{len(data) - max_bytes} bytes)"
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats events with their fields as a text line or as a JSON line, cutting large fields.
+
+    Args:
+        json_lines: Whether to format JSON lines instead of "time level logger event key=value ..." lines.
+        max_field_bytes: Maximum size of a formatted field.
+    """
+
+    def __init__(self, json_lines: bool = False, max_field_bytes: int = MAX_FIELD_BYTES):
+        super().__init__()
+        self.json_lines = json_lines
+        self.max_field_bytes = max_field_bytes
+
+    def _field(self, value: Any) -> str:
+        if isinstance(value, str):
+            text = value
+        else:
+            try:
+                text = codec.dumps(value).decode("utf-8")
+            except (TypeError, ValueError):
+                text = repr(value)
+        return _cut(text, self.max_field_bytes)
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {key: self._field(value) for key, value in getattr(record, "fields", {}).items()}
+        if record.exc_info:
+            fields["exception"] = self.formatException(record.exc_info)
+        timestamp = self.formatTime(record, "%Y-%m-%dT%H:%M:%S")
+        if self.json_lines:
+            line = {"time": timestamp, "level": record.levelname, "logger": record.name,
+                    "event": record.getMessage(), **fields}
+            return codec.dumps(line).decode("utf-8")
+        pairs = " ".join(f"{key}={value}" for key, value in fields.items())
+        return f"{timestamp} {record.levelname} {record.name} {record.getMessage()} {pairs}".rstrip()
+
+
+class _BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """Puts records on the queue unformatted, and drops them if the queue is full instead of blocking."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _count(dropped=1)
+
+
+class _BackgroundQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Waits for room, as the queue may be full of events when the writer is stopped.
+        self.queue.put(self._sentinel)
+
+
+class _CountingStreamHandler(logging.StreamHandler):
+    def emit(self, record: logging.LogRecord) -> None:
+        super().emit(record)
+        _count(written=1)
+
+
+class LogWriter:
+    """Writes the events of the root logger from a background thread; see configure_logging."""
+
+    def __init__(self, handler: logging.Handler, listener: _BackgroundQueueListener):
+        self.handler = handler
+        self._listener = listener
+        self._stopped = False
+
+    def stop(self) -> None:
+        """Write the queued events and stop the background thread."""
+        logging.getLogger().removeHandler(self.handler)
+        if not self._stopped:
+            self._stopped = True
+            self._listener.stop()
+
+
+def configure_logging(
+        level: int | str = LOG_LEVEL, stream: TextIO | None = None, json_lines: bool = LOG_FORMAT == "json",
+        max_field_bytes: int = MAX_FIELD_BYTES, max_queued_events: int = MAX_QUEUED_EVENTS
+) -> LogWriter:
+    """Send the events of all loggers at or above the level to a background thread, which writes them to a stream.
+
+    Args:
+        level: Minimum level of the events that are logged.
+        stream: Stream the events are written to, stderr by default.
+        json_lines: Whether to write JSON lines instead of text lines.
+        max_field_bytes: Maximum size of a formatted field.
+        max_queued_events: Events that may wait to be written before further events are dropped.
+    """
+    events: queue.Queue = queue.Queue(maxsize=max_queued_events)
+    stream_handler = _CountingStreamHandler(stream or sys.stderr)
+    stream_handler.setFormatter(StructuredFormatter(json_lines=json_lines, max_field_bytes=max_field_bytes))
+    listener = _BackgroundQueueListener(events, stream_handler)
+    handler = _BackgroundQueueHandler(events)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+    listener.start()
+    return LogWriter(handler, listener)
+
+
+__all__ = ["LogStats", "LogWriter", "StructuredFormatter", "configure_logging", "log_event", "log_stats"]
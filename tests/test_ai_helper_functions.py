@@ -0,0 +1,70 @@
+import asyncio
+import time
+import unittest
+
+import ai_helper_functions
+from ai_helper_functions import MatchBatcher, find_cheapest_alternative, find_product_in_cart, \
+    find_products_in_cart_async
+from fake_llm import FakeLLMClient
+
+CART = [
+    {"price": 119, "product_name": "Halfvolle melk 1 liter", "product_id": "s1001"},
+    {"price": 259, "product_name": "Roomboter ongezouten 250 gram", "product_id": "s1003"},
+    {"price": 349, "product_name": "Scharrel eieren 10 stuks", "product_id": "s1004"},
+]
+
+
+class TestAIHelperFunctions(unittest.TestCase):
+    def setUp(self) -> None:
+        for cache in (ai_helper_functions.product_matches, ai_helper_functions.alternative_matches):
+            cache.clear()
+            self.addCleanup(cache.clear)
+
+    def test_matches_are_memoized_per_cart(self) -> None:
+        client = FakeLLMClient()
+        self.assertEqual(find_product_in_cart(CART, "melk", client).product_id, "s1001")
+        self.assertEqual(find_product_in_cart(CART, " Melk ", client).product_id, "s1001")
+        self.assertEqual(client.requests, 1)
+
+        find_product_in_cart(CART[1:] + CART[:1], "melk", client)
+        self.assertEqual(client.requests, 2)
+        self.assertEqual(find_cheapest_alternative(CART, "eieren", client).product_id, "s1004")
+        self.assertEqual(client.requests, 3)
+
+    def test_cache_evicts_least_recently_used(self) -> None:
+        cache = ai_helper_functions.MatchCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+    def test_queries_against_the_same_cart_are_sent_as_one_request(self) -> None:
+        client = FakeLLMClient(latency=0.05, asynchronous=True)
+        products = asyncio.run(find_products_in_cart_async(CART, ["melk", "eieren", "roomboter", "melk"], client))
+        self.assertEqual([product.product_id for product in products], ["s1001", "s1004", "s1003", "s1001"])
+        self.assertEqual(client.requests, 1)
+        # The cart is sent once per request, however many search terms there are.
+        self.assertEqual(client.prompts[0].count("s1001"), 1)
+
+        asyncio.run(find_products_in_cart_async(CART, ["eieren", "roomboter"], client))
+        self.assertEqual(client.requests, 1)
+
+    def test_batcher_coalesces_concurrent_queries(self) -> None:
+        client = FakeLLMClient(latency=0.05, asynchronous=True)
+
+        async def match_concurrently() -> list:
+            batcher = MatchBatcher(client, window=0.01)
+            return await asyncio.gather(*(batcher.match(CART, name) for name in ["melk", "roomboter", "eieren"]))
+
+        start = time.perf_counter()
+        products = asyncio.run(match_concurrently())
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([product.product_id for product in products], ["s1001", "s1003", "s1004"])
+        self.assertEqual(client.requests, 1)
+        self.assertLess(elapsed, 0.05 * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from python_picnic_api.python_picnic_api import Cart
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from tools.basket_optimizer import PACK, Candidate, Need, apply_basket_plan, needs_from_cart, needs_from_list, \
+    parse_unit_quantity, plan_basket, select_candidates
+
+PRODUCTS = {
+    "s1": {"name": "Milk", "price": 119, "unit_quantity": "1 liter"},
+    "s2": {"name": "Milk value pack", "price": 199, "unit_quantity": "2 liter"},
+    "s3": {"name": "Milk crate", "price": 390, "unit_quantity": "6 x 1 l"},
+    "s4": {"name": "Butter", "price": 249, "unit_quantity": "250 gram"},
+    "s5": {"name": "Butter block", "price": 799, "unit_quantity": "1 kg"},
+    "s6": {"name": "Bread", "price": 279, "unit_quantity": None},
+}
+
+
+class TestBasketOptimizer(unittest.TestCase):
+    def test_parse_unit_quantity(self) -> None:
+        cases = {"1 liter": (1000, "ml"), "6 x 330 ml": (1980, "ml"), "ca. 1,5 kg": (1500, "g"),
+                 "10 stuks": (10, "piece"), "per stuk": (1, "piece"), "a loaf": None, None: None}
+        for unit_quantity, expected in cases.items():
+            with self.subTest(unit_quantity=unit_quantity):
+                self.assertEqual(parse_unit_quantity(unit_quantity), expected)
+
+    def test_selection_is_cheapest_without_too_much_overbuy(self) -> None:
+        needs = [Need("milk", 3000, "ml"), Need("butter", 250, "g"), Need("eggs", 1, PACK), Need("tea", 100, "g")]
+        candidates = [
+            [Candidate("s1", "Milk", 119, 1000, "ml"), Candidate("s2", "Milk value pack", 199, 2000, "ml"),
+             Candidate("s3", "Milk crate", 390, 6000, "ml")],
+            [Candidate("s5", "Butter block", 199, 1000, "g"), Candidate("s4", "Butter", 249, 250, "g")],
+            [Candidate("e1", "Eggs", 299, 10, "piece"), Candidate("e2", "Eggs", 189, 6, "piece")],
+            [Candidate("t1", "Tea", 150, 20, "piece")],
+        ]
+        # 3 x 1 liter is cheaper than 2 x 2 liter; the cheap 1 kg of butter is four times the need.
+        self.assertEqual(select_candidates(needs, candidates), [(0, 3), (1, 1), (1, 1), None])
+
+    def test_cart_is_replaced_with_cheapest_basket(self) -> None:
+        with PicnicStubServer(products=PRODUCTS) as stub:
+            client = stub.client()
+            client.add_product("s1", 2)
+            client.add_product("s4", 1)
+            client.add_product("s6", 1)
+
+            plan = plan_basket(client, needs_from_cart(Cart.from_payload(client.get_cart())))
+            self.assertEqual([(replacement.old_product_id, replacement.product_id, replacement.count)
+                              for replacement in plan.replacements], [("s1", "s2", 1)])
+            self.assertEqual(plan.saving, 39)
+
+            result = apply_basket_plan(client, plan)
+            self.assertEqual(result["errors"], {})
+            self.assertEqual(stub.cart_counts(), {"s2": 1, "s4": 1, "s6": 1})
+
+    def test_shopping_list_needs(self) -> None:
+        self.assertEqual(needs_from_list(["2 liter milk", "Eggs"]), [Need("milk", 2000, "ml"), Need("Eggs", 1, PACK)])
+
+
+if __name__ == "__main__":
+    unittest.main()
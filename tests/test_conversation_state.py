@@ -0,0 +1,131 @@
+import array
+import asyncio
+import contextlib
+import io
+import unittest
+
+from audio import InMemoryAudioBackend, is_speech
+from conversation_state import AUDIO_TOKENS_PER_SECOND, ConversationState
+from fake_live import ScriptedLiveSession, silence
+from picnic_agent import AudioLoop
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from tools.picnic_tools import ShopperSession, use_session
+
+CART = [{"price": 119, "product_name": "Halfvolle melk", "product_id": "s1001", "count": 1}]
+
+
+def cart_response(cart: list, call_id: str) -> dict:
+    return {"name": "get_all_current_products_in_cart", "response": {"result": {"picnic_response": cart}},
+            "id": call_id}
+
+
+def shopping_turn(index: int) -> list[dict]:
+    return [{"event": "tool_call", "function_calls": [
+        {"name": "add_product_to_cart", "args": {"product_id": "s1001"}, "id": f"add-{index}"},
+        {"name": "get_all_current_products_in_cart", "args": {}, "id": f"cart-{index}"}]},
+        {"event": "text", "text": f"Your cart now has {index} bottles of milk."}]
+
+
+class TestConversationState(unittest.TestCase):
+    def test_unchanged_cart_is_sent_as_reference(self) -> None:
+        conversation = ConversationState()
+        first = conversation.tool_response("get_all_current_products_in_cart", {}, cart_response(CART, "call-1"))
+        second = conversation.tool_response("get_all_current_products_in_cart", {}, cart_response(CART, "call-2"))
+
+        self.assertEqual(first["response"]["result"]["picnic_response"], CART)
+        self.assertIsInstance(second["response"]["result"]["picnic_response"], str)
+        self.assertEqual(second["id"], "call-2")
+        self.assertGreater(conversation.saved_tokens, 0)
+
+    def test_summary_holds_tool_calls_and_only_the_latest_cart(self) -> None:
+        conversation = ConversationState()
+        conversation.prompt("I need milk")
+        conversation.tool_response("get_all_current_products_in_cart", {}, cart_response(CART, "call-1"))
+        conversation.reply("I added milk.")
+        conversation.end_turn()
+        latest = [{**CART[0], "count": 2}]
+        conversation.tool_response("get_all_current_products_in_cart", {}, cart_response(latest, "call-2"))
+        conversation.end_turn()
+
+        summary = conversation.rotate()
+        self.assertIn("User: I need milk", summary)
+        self.assertIn("Tool call: get_all_current_products_in_cart() -> cart", summary)
+        self.assertIn('"count":2', summary)
+        self.assertNotIn('"count":1', summary)
+        self.assertEqual(conversation.rotations, 1)
+        self.assertLess(conversation.context_tokens, len(summary))
+
+        # The fresh session is seeded with the latest cart, so it is not sent again.
+        again = conversation.tool_response("get_all_current_products_in_cart", {}, cart_response(latest, "call-3"))
+        self.assertIsInstance(again["response"]["result"]["picnic_response"], str)
+
+    def test_cart_changed_after_the_last_fetch_is_not_seeded(self) -> None:
+        conversation = ConversationState()
+        conversation.tool_response("get_all_current_products_in_cart", {}, cart_response(CART, "call-1"))
+        conversation.tool_response("add_product_to_cart", {"product_id": "s1003"}, {
+            "name": "add_product_to_cart", "response": {"result": {"picnic_response": "Successfully added Butter"}},
+            "id": "call-2"})
+        conversation.end_turn()
+
+        summary = conversation.rotate()
+        self.assertNotIn("Halfvolle melk", summary)
+        self.assertIn("changed after it was last fetched", summary)
+        # The fresh session does not have the old cart, so it is sent in full again.
+        again = conversation.tool_response("get_all_current_products_in_cart", {}, cart_response(CART, "call-3"))
+        self.assertEqual(again["response"]["result"]["picnic_response"], CART)
+        self.assertIn("Halfvolle melk", conversation.rotate())
+
+    def test_idle_microphone_does_not_fill_the_context(self) -> None:
+        conversation = ConversationState(token_limit=1000)
+        chunk = 1024 / 16000
+        # Two hours of an open microphone in a quiet room.
+        for _ in range(int(2 * 3600 / chunk)):
+            conversation.microphone_audio(chunk, speech=False)
+        self.assertEqual(conversation.context_tokens, 0)
+
+        # Speech counts, and so do the pauses in it, but not the silence after the user stopped.
+        for speech in [True] * 10 + [False] * 5 + [True] * 10 + [False] * 1000:
+            conversation.microphone_audio(1.0, speech)
+        self.assertEqual(conversation.context_tokens, (10 + 2 + 10 + 2) * AUDIO_TOKENS_PER_SECOND)
+        self.assertFalse(conversation.needs_rotation)
+
+    def test_speech_is_told_apart_from_silence(self) -> None:
+        self.assertFalse(is_speech(bytes(2048)))
+        self.assertFalse(is_speech(array.array("h", [30, -30] * 512).tobytes()))
+        self.assertTrue(is_speech(array.array("h", [3000, -3000] * 512).tobytes()))
+        self.assertFalse(is_speech(b"\x01"))
+
+    def test_audio_loop_starts_seeded_session_when_context_is_full(self) -> None:
+        turns = 30
+        scripted = ScriptedLiveSession([shopping_turn(index) for index in range(1, turns + 1)])
+        conversation = ConversationState(token_limit=800)
+
+        async def converse() -> None:
+            audio_loop = AudioLoop(audio=InMemoryAudioBackend(realtime=False), connect=scripted.connect,
+                                   speak=silence, conversation=conversation)
+            audio_loop.session = scripted
+            audio_loop.audio_in_queue = asyncio.Queue()
+            task = asyncio.create_task(audio_loop.receive_audio())
+            for count in range(1, turns + 1):
+                await audio_loop.send_prompt("Add another milk")
+                await scripted.wait_for_turns(count)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        with PicnicStubServer() as stub, contextlib.redirect_stdout(io.StringIO()):
+            session = ShopperSession(picnic=stub.client())
+            self.addCleanup(session.close)
+            use_session(session)
+            asyncio.run(converse())
+
+        self.assertGreater(conversation.rotations, 0)
+        self.assertLess(conversation.rotations, turns // 2)
+        self.assertEqual(scripted.connections, conversation.rotations)
+        seeds = [input for input in scripted.sent if isinstance(input, str) and input.startswith("This conversation")]
+        self.assertEqual(len(seeds), conversation.rotations)
+        self.assertIn('"product_id":"s1001"', seeds[-1])
+        self.assertLessEqual(conversation.context_tokens, 800)
+
+
+if __name__ == "__main__":
+    unittest.main()
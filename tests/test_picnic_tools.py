@@ -0,0 +1,127 @@
+import threading
+import unittest
+from unittest import mock
+
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from tools import picnic_tools
+from tools.picnic_tools import ShopperSession, handle_picnic_tool_operations, reorder_stats, use_session
+
+
+class TestShopperSessions(unittest.TestCase):
+    def test_sessions_of_concurrent_shoppers_are_isolated(self) -> None:
+        stub = self.enterContext(PicnicStubServer())
+        products = {"alice": "s1001", "bob": "s1005"}
+        carts = {}
+
+        def shop(shopper: str) -> None:
+            session = ShopperSession(picnic=stub.client(auth_token=shopper))
+            self.addCleanup(session.close)
+            use_session(session)
+            handle_picnic_tool_operations("add_product_to_cart", {"product_id": products[shopper]}, "call-1")
+            response = handle_picnic_tool_operations("get_all_current_products_in_cart", {}, "call-2")
+            carts[shopper] = [product["product_id"] for product in response["response"]["result"]["picnic_response"]]
+
+        threads = [threading.Thread(target=shop, args=(shopper,)) for shopper in products]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(carts, {"alice": ["s1001"], "bob": ["s1005"]})
+        self.assertEqual(stub.cart_counts("alice"), {"s1001": 1})
+        self.assertEqual(stub.cart_counts("bob"), {"s1005": 1})
+        self.assertEqual(stub.cart_counts(), {})
+
+    def test_browse_category_fetches_only_the_browsed_categories(self) -> None:
+        stub = self.enterContext(PicnicStubServer())
+        session = ShopperSession(picnic=stub.client())
+        self.addCleanup(session.close)
+        use_session(session)
+
+        def browse(category: str) -> dict:
+            response = handle_picnic_tool_operations("browse_category", {"category": category}, "call")
+            return response["response"]["result"]
+
+        self.assertEqual(browse("")["categories"], ["Dairy & eggs", "Coffee & breakfast", "Fruit & vegetables"])
+        self.assertEqual(browse("dairy"), {"category": "Dairy & eggs", "categories": ["Milk", "Butter", "Eggs"]})
+        milk = browse("milk")
+        self.assertEqual(milk["category"], "Dairy & eggs / Milk")
+        self.assertEqual([product["id"] for product in milk["products"]], ["s1001", "s1002"])
+        self.assertIn("s1002", session.product_catalog)
+        self.assertIn("No category", browse("caviar")["picnic_response"])
+        self.assertNotIn("/my_store?depth=2", [f"{path}?depth={query.get('depth')}" for _, path, query, _ in
+                                                stub.requests])
+
+    def test_optimistic_add_does_not_fetch_the_cart(self) -> None:
+        self.enterContext(mock.patch.object(picnic_tools, "OPTIMISTIC_CART_MUTATIONS", True))
+        stub = self.enterContext(PicnicStubServer())
+        session = ShopperSession(picnic=stub.client())
+        self.addCleanup(session.close)
+        use_session(session)
+
+        response = handle_picnic_tool_operations("add_product_to_cart", {"product_id": "s1001"}, "call-1")
+        self.assertEqual(response["response"]["result"]["picnic_response"],
+                         "Successfully added product to shopping cart")
+        self.assertTrue(session.optimistic_cart.wait(5))
+        self.assertNotIn(("GET", "/cart"), [(method, path) for method, path, _, _ in stub.requests])
+        # A later add of the same product names it after the line of the cart that the session holds.
+        handle_picnic_tool_operations("get_all_current_products_in_cart", {}, "call-2")
+        response = handle_picnic_tool_operations("add_product_to_cart", {"product_id": "s1001"}, "call-3")
+        self.assertEqual(response["response"]["result"]["picnic_response"], "Successfully added Milk to shopping cart")
+        self.assertTrue(session.optimistic_cart.wait(5))
+        self.assertEqual(stub.cart_counts(), {"s1001": 2})
+
+    def test_closed_session_shuts_down_its_parsing_workers(self) -> None:
+        self.enterContext(mock.patch.object(picnic_tools, "PARSE_WORKERS", 1))
+        environ = self.enterContext(mock.patch.dict("os.environ", {"PICNIC_REGION": "NL"}))
+        # Without credentials the client does not log in.
+        environ.pop("PICNIC_USERNAME", None)
+        session = ShopperSession()
+        use_session(session)
+
+        executor = picnic_tools.get_picnic().parsing_executor
+        self.assertIs(executor, session.parsing_executor)
+        shutdown = self.enterContext(mock.patch.object(executor, "shutdown", wraps=executor.shutdown))
+        session.close()
+        shutdown.assert_called_once_with()
+
+    def test_reorder_from_list_adds_all_products_with_one_tool_call(self) -> None:
+        stub = self.enterContext(PicnicStubServer())
+        stub.failures["s1006"] = "PRODUCT_UNAVAILABLE"
+        session = ShopperSession(picnic=stub.client())
+        self.addCleanup(session.close)
+        use_session(session)
+        before = reorder_stats()
+
+        response = handle_picnic_tool_operations("reorder_from_list", {"list_id": "purchases",
+                                                                       "sublist_id": "last-week"}, "call")
+        result = response["response"]["result"]
+
+        self.assertEqual(result["added_products"], ["2x Milk", "1x Butter"])
+        self.assertEqual(result["failed_products"],
+                         [{"product_id": "s1006", "name": "Bananas", "error": "PRODUCT_UNAVAILABLE"}])
+        self.assertEqual({line["product_id"] for line in result["picnic_response"]}, {"s1001", "s1003"})
+        stats = reorder_stats()
+        self.assertEqual((stats.reorders - before.reorders, stats.items - before.items,
+                          stats.failed_items - before.failed_items), (1, 3, 1))
+        self.assertEqual(stats.tool_calls_saved - before.tool_calls_saved, 5)
+        self.assertIn("NOT_FOUND", handle_picnic_tool_operations(
+            "reorder_from_list", {"list_id": "unknown"}, "call")["response"]["result"]["picnic_response"])
+
+    def test_reorder_of_past_orders_needs_a_sublist(self) -> None:
+        stub = self.enterContext(PicnicStubServer())
+        session = ShopperSession(picnic=stub.client())
+        self.addCleanup(session.close)
+        use_session(session)
+
+        response = handle_picnic_tool_operations("reorder_from_list", {"list_id": "purchases"}, "call")
+        result = response["response"]["result"]
+
+        self.assertEqual(result["sublists"], [{"id": "last-week", "name": "Last week"},
+                                              {"id": "two-weeks-ago", "name": "Two weeks ago"}])
+        self.assertIn("Nothing was added", result["picnic_response"])
+        self.assertEqual(stub.cart_counts(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
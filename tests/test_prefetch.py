@@ -0,0 +1,81 @@
+import threading
+import time
+import unittest
+
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from tools.picnic_tools import ShopperSession, handle_picnic_tool_operations, use_session
+from tools.prefetch import PrefetchEngine
+
+
+class TestPrefetchEngine(unittest.TestCase):
+    def setUp(self) -> None:
+        self.engine = PrefetchEngine(max_workers=1, budget=2)
+        self.addCleanup(self.engine.close)
+        self.loaded: list[str] = []
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def load(self, key: str) -> None:
+        self.release.wait(5)
+        self.loaded.append(key)
+
+    def wait_for_loads(self) -> None:
+        self.release.set()
+        done = threading.Event()
+        self.engine._executor.submit(done.set)
+        done.wait(5)
+
+    def test_only_the_budget_of_a_round_is_prefetched(self) -> None:
+        self.engine.prefetch("recipe", ["a", "b", "c"], self.load)
+        self.wait_for_loads()
+
+        self.assertEqual(self.loaded, ["a", "b"])
+        self.assertEqual((self.engine.stats.scheduled, self.engine.stats.completed), (2, 2))
+
+    def test_new_round_cancels_prefetches_that_did_not_start(self) -> None:
+        self.engine.prefetch("recipe", ["a", "b"], self.load)
+        # "a" is running and blocks the only worker, "b" waits.
+        self.engine.prefetch("recipe", ["c"], self.load)
+        self.wait_for_loads()
+
+        self.assertEqual(self.loaded, ["a", "c"])
+        self.assertEqual(self.engine.stats.cancelled, 1)
+        self.assertFalse(self.engine.record_use("recipe", "b", cached=True))
+
+    def test_hit_needs_a_prefetch_and_a_cached_result(self) -> None:
+        self.engine.prefetch("recipe", ["a", "b"], self.load)
+        self.wait_for_loads()
+
+        self.assertTrue(self.engine.record_use("recipe", "a", cached=True))
+        # Evicted, or not loaded in time.
+        self.assertFalse(self.engine.record_use("recipe", "b", cached=False))
+        # Not prefetched, or already used.
+        self.assertFalse(self.engine.record_use("recipe", "c", cached=True))
+        self.assertFalse(self.engine.record_use("recipe", "a", cached=True))
+        stats = self.engine.stats
+        self.assertEqual((stats.hits, stats.misses), (1, 3))
+        self.assertEqual(stats.hit_rate, 0.25)
+
+
+class TestRecipePrefetch(unittest.TestCase):
+    def test_recipe_added_after_a_search_is_a_hit(self) -> None:
+        stub = self.enterContext(PicnicStubServer())
+        session = ShopperSession(picnic=stub.client())
+        self.addCleanup(session.close)
+        use_session(session)
+
+        result = handle_picnic_tool_operations("search_for_recipes", {"search_query": "pancakes"}, "call-1")
+        recipe_id = result["response"]["result"]["recipes"][0]["id"]
+        deadline = time.monotonic() + 5
+        while session.prefetcher.stats.completed < session.prefetcher.stats.scheduled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        handle_picnic_tool_operations("add_recipe_to_cart", {"recipe_id": recipe_id}, "call-2")
+
+        self.assertEqual((session.prefetcher.stats.hits, session.prefetcher.stats.misses), (1, 0))
+        details_requests = [path for method, path, query, body in stub.requests
+                            if path == "/pages/recipe-details-page"]
+        self.assertEqual(len(details_requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
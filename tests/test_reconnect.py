@@ -0,0 +1,106 @@
+import asyncio
+import contextlib
+import io
+import unittest
+
+from audio import InMemoryAudioBackend
+from fake_live import FaultInjectingLiveServer, silence
+from picnic_agent import AudioLoop
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from reconnect import Backoff
+from tools.picnic_tools import ShopperSession, use_session
+
+TURNS: list[list[dict]] = [
+    [{"event": "tool_call", "function_calls": [
+        {"name": "add_product_to_cart", "args": {"product_id": "s1001"}, "id": "call-1"},
+        {"name": "get_all_current_products_in_cart", "args": {}, "id": "call-2"}]},
+     {"event": "text", "text": "I added the milk."}],
+    # Lost: the connection drops while this turn is received.
+    [{"event": "text", "text": "Let me look for butter."},
+     {"event": "text", "text": "I found butter."}],
+    [{"event": "text", "text": "Here is the butter you asked for."}],
+]
+
+
+class TestReconnect(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stub = self.enterContext(PicnicStubServer())
+        session = ShopperSession(picnic=self.stub.client())
+        self.addCleanup(session.close)
+        use_session(session)
+        self.stdout = self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+
+    async def start(self, audio_loop: AudioLoop) -> list[asyncio.Task]:
+        await audio_loop.connect_session()
+        audio_loop.audio_in_queue = asyncio.Queue()
+        audio_loop.out_queue = asyncio.Queue(maxsize=5)
+        return [asyncio.create_task(task()) for task in [audio_loop.receive_audio, audio_loop.send_realtime,
+                                                         audio_loop.listen_audio, audio_loop.play_audio]]
+
+    def test_dropped_session_is_resumed_with_pending_prompt_and_buffered_audio(self) -> None:
+        # Every attempt takes a while, so that mic audio is captured while reconnecting whatever the backoff jitter.
+        server = FaultInjectingLiveServer(TURNS, latency=0.05, connect_latency=0.1)
+        audio_loop = AudioLoop(audio=InMemoryAudioBackend(realtime=True), connect=server.connect, speak=silence,
+                               backoff=Backoff(initial=0.2, attempts=5))
+
+        async def converse() -> None:
+            tasks = await self.start(audio_loop)
+            supervisor = asyncio.create_task(audio_loop.supervise())
+            await audio_loop.send_prompt("Add milk")
+            await server.wait_for_turns(1)
+
+            await audio_loop.send_prompt("I need butter")
+            await asyncio.sleep(0.07)
+            server.refuse(1)
+            server.drop()
+            await asyncio.wait_for(server.wait_for_turns(2), 5)
+            # Mic audio keeps flowing into the fresh session.
+            await asyncio.sleep(0.2)
+
+            self.assertFalse(any(task.done() for task in [*tasks, supervisor]))
+            for task in [*tasks, supervisor]:
+                task.cancel()
+            await asyncio.gather(*tasks, supervisor, return_exceptions=True)
+
+        asyncio.run(converse())
+
+        stats = audio_loop.reconnect_stats
+        self.assertEqual((stats.disconnects, stats.reconnects, stats.failed_attempts), (1, 1, 1))
+        self.assertGreater(stats.max_seconds, 0)
+        self.assertGreater(stats.buffered_audio_chunks, 0)
+        self.assertEqual(stats.dropped_audio_chunks, 0)
+        self.assertEqual(len(server.sessions), 2)
+
+        seed = server.sessions[1].sent[0]
+        self.assertIn("User: Add milk", seed)
+        self.assertIn('"product_id":"s1001"', seed)
+        self.assertIn("last request of the user: I need butter", seed)
+        self.assertEqual(audio_loop.conversation.pending_prompt, None)
+        # Replies are shown to the user as they arrive, whatever the log level.
+        self.assertIn("I added the milk.\n", self.stdout.getvalue())
+        # Every mic chunk was sent, the ones captured during the gap included.
+        self.assertGreaterEqual(len(server.audio), stats.buffered_audio_chunks)
+
+    def test_gives_up_after_all_attempts(self) -> None:
+        server = FaultInjectingLiveServer(TURNS)
+        audio_loop = AudioLoop(audio=InMemoryAudioBackend(realtime=False), connect=server.connect, speak=silence,
+                               backoff=Backoff(initial=0.01, attempts=3))
+
+        async def converse() -> None:
+            await audio_loop.connect_session()
+            audio_loop.audio_in_queue = asyncio.Queue()
+            receive = asyncio.create_task(audio_loop.receive_audio())
+            server.refuse(10)
+            server.drop()
+            with self.assertRaises(ConnectionError):
+                await asyncio.wait_for(audio_loop.supervise(), 5)
+            receive.cancel()
+            await asyncio.gather(receive, return_exceptions=True)
+
+        asyncio.run(converse())
+        self.assertEqual(audio_loop.reconnect_stats.failed_attempts, 3)
+        self.assertFalse(audio_loop.connected.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import asyncio
+import contextlib
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+from audio import InMemoryAudioBackend
+from fake_live import ScriptedLiveSession, silence
+from picnic_agent import AudioLoop
+from python_picnic_api.python_picnic_api import PicnicAPI
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from recording import RecordingHTTPAdapter, ReplayHTTPAdapter, ReplayLiveSession, SessionRecorder, \
+    install_http_adapter, load_recording, recording_connect, replay_session
+from tools.picnic_tools import use_picnic
+
+TURNS: list[list[dict]] = [
+    [{"event": "tool_call", "function_calls": [
+        {"name": "search_for_products", "args": {"search_query": "milk"}, "id": "call-1"}]},
+     {"event": "text", "text": "I found milk."}],
+    [{"event": "tool_call", "function_calls": [
+        {"name": "add_product_to_cart", "args": {"product_id": "s1002"}, "id": "call-2"}]},
+     {"event": "text", "text": "Added."}],
+]
+
+
+def tool_responses(sent: list) -> list:
+    return [input for input in sent if isinstance(input, list)]
+
+
+class TestRecordAndReplay(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "session.jsonl.gz"
+        self.output = self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+
+    async def record(self) -> list:
+        with PicnicStubServer(latency=0.02) as stub, SessionRecorder(self.path) as recorder:
+            client = stub.client()
+            install_http_adapter(client.session, RecordingHTTPAdapter(recorder))
+            use_picnic(client)
+            scripted = ScriptedLiveSession(TURNS, latency=0.05)
+            audio_loop = AudioLoop(audio=InMemoryAudioBackend(realtime=False), speak=silence)
+            async with recording_connect(scripted.connect, recorder)() as session:
+                audio_loop.session = session
+                audio_loop.audio_in_queue = asyncio.Queue()
+                task = asyncio.create_task(audio_loop.receive_audio())
+                for count, prompt in enumerate(["I need milk", "Add the organic one"], start=1):
+                    await session.send(prompt, end_of_turn=True)
+                    await scripted.wait_for_turns(count)
+                task.cancel()
+        return tool_responses(scripted.sent)
+
+    async def replay(self, speed: float) -> ReplayLiveSession:
+        events = load_recording(self.path)
+        client = PicnicAPI(auth_token="replay")
+        install_http_adapter(client.session, ReplayHTTPAdapter(events, speed=speed))
+        use_picnic(client)
+        session = ReplayLiveSession(events, speed=speed)
+        await asyncio.wait_for(
+            replay_session(AudioLoop(audio=InMemoryAudioBackend(realtime=False), speak=silence), session), 10)
+        return session
+
+    def test_replay_reproduces_tool_responses_without_network(self) -> None:
+        recorded = asyncio.run(self.record())
+        events = load_recording(self.path)
+        self.assertEqual([event["event"] for event in events if event["kind"] == "received"],
+                         ["tool_call", "text", "turn_complete"] * 2)
+        self.assertTrue(any(event["kind"] == "http" and event["path"].endswith("/cart/add_product")
+                            for event in events))
+
+        # The stub server is gone, so every Picnic response comes from the recording.
+        session = asyncio.run(self.replay(speed=1.0))
+        self.assertEqual(tool_responses([input for kind, input in session.sent]), recorded)
+        self.assertEqual(len(session.turn_latencies), 2)
+
+    def test_accelerated_replay(self) -> None:
+        asyncio.run(self.record())
+        normal = asyncio.run(self.replay(speed=1.0))
+        fast = asyncio.run(self.replay(speed=20.0))
+        self.assertLess(sum(fast.turn_latencies), sum(normal.turn_latencies) / 3)
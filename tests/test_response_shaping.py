@@ -0,0 +1,140 @@
+import unittest
+
+from tools.response_shaping import BYTES_PER_TOKEN, CART_SUMMARY_THRESHOLD, CART_TOP_LINES, MAX_NAME_LENGTH, \
+    PayloadStats, _fit_budget, payload_size, payload_stats, shape_tool_result, truncate_name
+
+LONG_NAME = "Biologische halfvolle melk van weidekoeien uit de regio, extra romig en vers"
+
+
+def cart_line(index: int, price: int, name: str = "Melk") -> dict:
+    return {"product_id": f"s{index}", "product_name": name, "count": 1, "price": price}
+
+
+class TestShapers(unittest.TestCase):
+    def test_truncate_name(self) -> None:
+        self.assertEqual(truncate_name("Melk"), "Melk")
+        shortened = truncate_name(LONG_NAME)
+        self.assertLessEqual(len(shortened), MAX_NAME_LENGTH)
+        self.assertTrue(shortened.endswith("…"))
+
+    def test_product_names_are_truncated(self) -> None:
+        result = {"products": [{"id": "s1", "name": LONG_NAME, "price": 119}]}
+        for name in ("search_for_products", "browse_category"):
+            with self.subTest(tool=name):
+                shaped = shape_tool_result(name, result)
+                self.assertEqual(shaped["products"], [{"id": "s1", "name": truncate_name(LONG_NAME), "price": 119}])
+
+    def test_shopping_list_entries_keep_their_term(self) -> None:
+        result = {"shopping_list": [{"search_term": "milk", "products": [{"id": "s1", "name": LONG_NAME}]}]}
+        shaped = shape_tool_result("search_shopping_list", result)
+        self.assertEqual(shaped, {"shopping_list": [
+            {"search_term": "milk", "products": [{"id": "s1", "name": truncate_name(LONG_NAME)}]}]})
+
+    def test_recipes_leave_out_unknown_details(self) -> None:
+        result = {"recipes": [{"id": "r1", "name": LONG_NAME, "preparation_time": None, "servings": 2}],
+                  "next_offset": 10}
+        shaped = shape_tool_result("search_for_recipes", result)
+        self.assertEqual(shaped, {"recipes": [{"id": "r1", "name": truncate_name(LONG_NAME), "servings": 2}],
+                                  "next_offset": 10})
+
+    def test_error_results_are_passed_through(self) -> None:
+        for name in ("search_for_products", "search_for_recipes", "search_for_cheaper_product_alternative",
+                     "get_all_current_products_in_cart"):
+            with self.subTest(tool=name):
+                result = {"picnic_response": "Picnic could not be reached", "products": None, "recipes": None}
+                self.assertEqual(shape_tool_result(name, result), result)
+
+    def test_small_cart_is_sent_line_by_line(self) -> None:
+        lines = [cart_line(index, 100, LONG_NAME) for index in range(CART_SUMMARY_THRESHOLD)]
+        shaped = shape_tool_result("get_all_current_products_in_cart", {"picnic_response": lines})
+        self.assertEqual(len(shaped["picnic_response"]), CART_SUMMARY_THRESHOLD)
+        self.assertEqual(shaped["picnic_response"][0]["product_name"], truncate_name(LONG_NAME))
+
+    def test_large_cart_is_summarised(self) -> None:
+        lines = [cart_line(index, 100 * index) for index in range(1, CART_SUMMARY_THRESHOLD + 2)]
+        shaped = shape_tool_result("get_all_current_products_in_cart", {"picnic_response": lines})
+        summary = shaped["picnic_response"]
+        self.assertEqual(summary["total_price"], f"{sum(line['price'] for line in lines) / 100:.2f} Euro")
+        self.assertEqual(summary["line_count"], len(lines))
+        self.assertEqual([line["product_id"] for line in summary["most_expensive_lines"]],
+                         [f"s{index}" for index in range(len(lines), len(lines) - CART_TOP_LINES, -1)])
+        self.assertEqual(summary["omitted_line_count"], len(lines) - CART_TOP_LINES)
+
+    def test_meal_plan_keeps_its_recipes_next_to_the_summarised_cart(self) -> None:
+        lines = [cart_line(index, 100) for index in range(CART_SUMMARY_THRESHOLD + 1)]
+        result = {"picnic_response": lines, "recipes": [{"recipe_id": "r1", "ingredient_count": 3}]}
+        shaped = shape_tool_result("plan_meals", result)
+        self.assertEqual(shaped["recipes"], result["recipes"])
+        self.assertEqual(shaped["picnic_response"]["line_count"], len(lines))
+
+    def test_tools_without_a_shaper_are_unchanged(self) -> None:
+        result = {"picnic_response": "Successfully added Melk"}
+        self.assertEqual(shape_tool_result("add_product_to_cart", result), result)
+
+
+class TestFitBudget(unittest.TestCase):
+    def test_result_within_budget_is_unchanged(self) -> None:
+        result = {"products": [{"id": "s1"}]}
+        self.assertIs(_fit_budget(result, 100), result)
+
+    def test_longest_list_is_trimmed_from_the_end(self) -> None:
+        products = [{"id": f"s{index}", "name": "x" * 20} for index in range(40)]
+        result = {"products": products, "terms": ["milk", "butter"]}
+        max_tokens = 100
+        shaped = _fit_budget(result, max_tokens)
+
+        kept = len(shaped["products"])
+        self.assertLessEqual(payload_size({**result, "products": products[:kept]}),
+                             max_tokens * BYTES_PER_TOKEN)
+        self.assertGreater(payload_size({**result, "products": products[:kept + 1]}),
+                           max_tokens * BYTES_PER_TOKEN)
+        self.assertGreater(kept, 0)
+        self.assertEqual(shaped["products"], products[:kept])
+        self.assertEqual(shaped["omitted_entry_count"], 40 - kept)
+        self.assertEqual(shaped["terms"], ["milk", "butter"])
+        # The result of the tool itself is left alone.
+        self.assertEqual(len(products), 40)
+
+    def test_budget_smaller_than_any_entry_drops_the_whole_list(self) -> None:
+        result = {"products": [{"id": "s1", "name": "x" * 40}]}
+        self.assertEqual(_fit_budget(result, 1), {"products": [], "omitted_entry_count": 1})
+
+    def test_result_without_a_list_is_not_trimmed(self) -> None:
+        result = {"picnic_response": "x" * 100, "products": []}
+        shaped = _fit_budget(result, 1)
+        self.assertEqual(shaped, result)
+        self.assertNotIn("omitted_entry_count", shaped)
+
+    def test_shape_tool_result_applies_the_budget(self) -> None:
+        result = {"products": [{"id": f"s{index}", "name": "Melk"} for index in range(20)]}
+        shaped = shape_tool_result("search_for_products", result, max_tokens=20)
+        self.assertLess(len(shaped["products"]), 20)
+        self.assertEqual(shaped["omitted_entry_count"], 20 - len(shaped["products"]))
+
+
+class TestPayloadStats(unittest.TestCase):
+    def test_sizes_are_accumulated_per_tool(self) -> None:
+        name = "test_payload_stats_tool"
+        result = {"products": [{"id": "s1", "name": LONG_NAME}]}
+        shape_tool_result(name, result)
+        shape_tool_result(name, result, max_tokens=1)
+
+        stats = payload_stats()[name]
+        self.assertEqual(stats.calls, 2)
+        self.assertEqual(stats.raw_bytes, 2 * payload_size(result))
+        self.assertEqual(stats.shaped_bytes,
+                         payload_size(result) + payload_size({"products": [], "omitted_entry_count": 1}))
+        self.assertAlmostEqual(stats.saved_ratio, 1 - stats.shaped_bytes / stats.raw_bytes)
+
+    def test_returned_stats_are_a_copy(self) -> None:
+        name = "test_payload_stats_copy"
+        shape_tool_result(name, {"picnic_response": "ok"})
+        payload_stats()[name].calls += 10
+        self.assertEqual(payload_stats()[name].calls, 1)
+
+    def test_saved_ratio_without_calls(self) -> None:
+        self.assertEqual(PayloadStats().saved_ratio, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import io
+import json
+import logging
+import threading
+import time
+import unittest
+from dataclasses import asdict
+from typing import Any
+from unittest import mock
+
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from structured_logging import LogWriter, configure_logging, log_event, log_stats
+from tools import picnic_tools
+
+logger = logging.getLogger("tests.structured_logging")
+
+
+class Payload:
+    """A field that counts how often it was formatted."""
+    formatted = 0
+
+    def __repr__(self) -> str:
+        Payload.formatted += 1
+        return "payload"
+
+
+class BlockingStream(io.StringIO):
+    def __init__(self) -> None:
+        super().__init__()
+        self.released = threading.Event()
+
+    def write(self, text: str) -> int:
+        self.released.wait(5)
+        return super().write(text)
+
+
+class TestStructuredLogging(unittest.TestCase):
+    def setUp(self) -> None:
+        root = logging.getLogger()
+        self.addCleanup(root.setLevel, root.level)
+        self.stats_before = asdict(log_stats())
+
+    def configure(self, **kwargs: Any) -> LogWriter:
+        writer = configure_logging(**kwargs)
+        self.addCleanup(writer.stop)
+        return writer
+
+    def counted(self, name: str) -> int:
+        return getattr(log_stats(), name) - self.stats_before[name]
+
+    def test_disabled_and_sampled_out_events_are_not_formatted(self) -> None:
+        stream = io.StringIO()
+        writer = self.configure(level=logging.INFO, stream=stream)
+        Payload.formatted = 0
+        log_event(logger, logging.DEBUG, "tool_responses", responses=Payload())
+        log_event(logger, logging.INFO, "model_text", sample=0.0, text=Payload())
+        writer.stop()
+
+        self.assertEqual(Payload.formatted, 0)
+        self.assertEqual(stream.getvalue(), "")
+        self.assertEqual(self.counted("sampled_out"), 1)
+
+    def test_events_are_written_as_json_lines_with_large_fields_cut(self) -> None:
+        stream = io.StringIO()
+        writer = self.configure(level=logging.DEBUG, stream=stream, json_lines=True, max_field_bytes=40)
+        with PicnicStubServer() as stub:
+            stub.client().get_cart()
+        log_event(logger, logging.INFO, "tool_call", name="get_all_current_products_in_cart",
+                  result=[{"product_id": f"s{index}"} for index in range(100)])
+        writer.stop()
+
+        events = {event["event"]: event for event in map(json.loads, stream.getvalue().splitlines())
+                  if event["logger"] in {logger.name, "python_picnic_api.python_picnic_api.client"}}
+        self.assertTrue(events["picnic_request"]["url"].endswith("/cart"))
+        self.assertEqual(events["picnic_request"]["method"], "GET")
+        tool_call = events["tool_call"]
+        self.assertEqual((tool_call["level"], tool_call["name"]), ("INFO", "get_all_current_products_in_cart"))
+        self.assertTrue(tool_call["result"].startswith('[{"product_id":"s0"}'))
+        self.assertIn("bytes)", tool_call["result"])
+        self.assertEqual(self.counted("truncated_fields"), 1)
+
+    def test_tool_call_is_logged_with_its_failed_cart_updates(self) -> None:
+        stream = BlockingStream()
+        writer = self.configure(level=logging.DEBUG, stream=stream, json_lines=True)
+        failures = ["Could not add 1x Milk: SOLD_OUT"]
+        self.enterContext(mock.patch.object(picnic_tools, "drain_cart_failures", return_value=failures))
+        stub = self.enterContext(PicnicStubServer())
+        session = picnic_tools.ShopperSession(picnic=stub.client())
+        self.addCleanup(session.close)
+        picnic_tools.use_session(session)
+
+        response = picnic_tools.handle_picnic_tool_operations("add_product_to_cart", {"product_id": "s1003"}, "call")
+        stream.released.set()
+        writer.stop()
+
+        self.assertEqual(response["response"]["result"]["failed_cart_updates"], failures)
+        events = {event["event"]: event for event in map(json.loads, stream.getvalue().splitlines())}
+        self.assertEqual(json.loads(events["cart_updates_failed"]["failures"]), failures)
+        self.assertEqual(json.loads(events["tool_call"]["result"]), response["response"]["result"])
+
+    def test_slow_stream_does_not_block_the_caller(self) -> None:
+        stream = BlockingStream()
+        writer = self.configure(level=logging.INFO, stream=stream, max_queued_events=2)
+        start = time.perf_counter()
+        for index in range(10):
+            log_event(logger, logging.INFO, "reply", text=f"Reply {index}")
+        elapsed = time.perf_counter() - start
+        stream.released.set()
+        writer.stop()
+
+        self.assertLess(elapsed, 1)
+        self.assertGreater(self.counted("dropped"), 0)
+        self.assertEqual(self.counted("written") + self.counted("dropped"), 10)
+        self.assertIn("reply text=Reply 0", stream.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from tools.registry import ToolArgumentError, ToolRegistry
+
+
+def add_items(item_ids: list[str], count: int = 1, note: str | None = None) -> dict:
+    return {"item_ids": item_ids, "count": count, "note": note}
+
+
+def list_items() -> list:
+    return []
+
+
+class TestToolRegistry(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = ToolRegistry()
+        self.registry.register(add_items, "Adds items.", {"item_ids": "The items.", "count": "How many.",
+                                                          "note": "A note."})
+
+    def test_declaration_is_generated_from_the_signature(self) -> None:
+        self.assertEqual(self.registry.function_declarations(), [{
+            "name": "add_items",
+            "description": "Adds items.",
+            "parameters": {
+                "type": "OBJECT",
+                "properties": {
+                    "item_ids": {"type": "ARRAY", "items": {"type": "STRING"}, "description": "The items."},
+                    "count": {"type": "NUMBER", "description": "How many."},
+                    "note": {"type": "STRING", "description": "A note."},
+                },
+                "required": ["item_ids"],
+            },
+        }])
+
+    def test_arguments_are_coerced_and_defaults_filled_in(self) -> None:
+        result = self.registry.call("add_items", {"item_ids": ["a", 2], "count": 2.0, "unknown": True})
+        self.assertEqual(result, {"item_ids": ["a", "2"], "count": 2, "note": None})
+        self.assertEqual(self.registry.call("add_items", {"item_ids": [], "count": None, "note": None})["count"], 1)
+
+    def test_call_without_arguments(self) -> None:
+        self.registry.register(list_items, "Lists items.")
+        self.assertEqual(self.registry.call("list_items", None), [])
+        self.assertEqual(self.registry["list_items"].bind(None), {})
+        with self.assertRaises(ToolArgumentError):
+            self.registry.call("add_items", None)
+
+    def test_invalid_calls_raise_and_are_counted(self) -> None:
+        for args in [{}, {"item_ids": "a"}, {"item_ids": [], "count": 1.5}, {"item_ids": [], "count": "many"}]:
+            with self.subTest(args=args), self.assertRaises(ToolArgumentError):
+                self.registry.call("add_items", args)
+        with self.assertRaises(ValueError):
+            self.registry.call("remove_items", {})
+        self.registry.call("add_items", {"item_ids": ["a"]})
+
+        stats = self.registry.stats()["add_items"]
+        self.assertEqual((stats.calls, stats.errors), (5, 4))
+        self.assertGreater(stats.total_seconds, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
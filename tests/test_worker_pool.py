@@ -0,0 +1,101 @@
+import os
+import signal
+import time
+import unittest
+
+from fake_live import scripted_conversation
+from python_picnic_api.python_picnic_api.testing import PicnicStubServer
+from worker_pool import AFFINITY_SLACK, WorkerMetrics, WorkerPool, choose_worker
+
+TURNS: list[list[dict]] = [
+    [{"event": "tool_call", "function_calls": [
+        {"name": "add_product_to_cart", "args": {"product_id": "s1001"}, "id": "call-1"}]},
+     {"event": "text", "text": "I added the milk."}],
+    [{"event": "text", "text": "Anything else?"}],
+]
+
+
+def workers(*loads: int) -> list[WorkerMetrics]:
+    return [WorkerMetrics(index, accepting=True, alive=True, active=active) for index, active in enumerate(loads)]
+
+
+class TestChooseWorker(unittest.TestCase):
+    def test_conversations_keep_their_worker_while_it_is_not_much_busier(self) -> None:
+        pool = workers(0, 0, 0, 0)
+        preferred = {conversation_id: choose_worker(conversation_id, pool) for conversation_id in map(str, range(40))}
+        self.assertEqual(len({worker.index for worker in preferred.values() if worker}), 4)
+
+        for conversation_id, worker in preferred.items():
+            assert worker is not None
+            worker.active += int(AFFINITY_SLACK)
+            self.assertIs(choose_worker(conversation_id, pool), worker)
+            worker.active += 1
+            self.assertIsNot(choose_worker(conversation_id, pool), worker)
+            worker.active = 0
+
+    def test_only_accepting_workers_are_chosen(self) -> None:
+        pool = workers(0, 0)
+        pool[0].accepting = False
+        self.assertTrue(all(choose_worker(str(index), pool) is pool[1] for index in range(20)))
+        pool[1].alive = False
+        self.assertIsNone(choose_worker("0", pool))
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stub = self.enterContext(PicnicStubServer())
+        self.pool = self.enterContext(WorkerPool(scripted_conversation, workers=2, metrics_interval=0.05))
+
+    def converse(self, conversation_ids: list[str]) -> list[dict]:
+        futures = [self.pool.submit(conversation_id, {"picnic_url": self.stub.url, "turns": TURNS,
+                                                      "prompts": ["Add milk", "Thanks"]})
+                   for conversation_id in conversation_ids]
+        return [future.result(60) for future in futures]
+
+    def test_conversations_run_on_all_workers_with_their_own_carts(self) -> None:
+        results = self.converse([f"shopper-{index}" for index in range(6)])
+
+        self.assertEqual({(result["turns"], result["tool_responses"]) for result in results}, {(2, 1)})
+        self.assertEqual(len({result["pid"] for result in results}), 2)
+        for index in range(6):
+            self.assertEqual(self.stub.cart_counts(f"shopper-{index}"), {"s1001": 1})
+        metrics = self.pool.metrics()
+        self.assertEqual((metrics.completed, metrics.failed, metrics.active), (6, 0, 0))
+        self.assertGreater(metrics.mean_conversation_seconds, 0)
+        future = self.pool.submit("shopper-0", {"picnic_url": self.stub.url, "turns": TURNS, "prompts": []})
+        with self.assertRaises(ValueError):
+            self.pool.submit("shopper-0", {})
+        future.result(60)
+
+    def test_restarted_worker_is_replaced_and_keeps_serving(self) -> None:
+        pids = [worker.pid for worker in self.pool.metrics().workers]
+        self.pool.restart(0)
+        # The other worker serves while one is drained.
+        self.pool.drain(1)
+        self.assertEqual({result["pid"] for result in self.converse(["shopper-0", "shopper-1"])},
+                         {self.pool.metrics().workers[0].pid})
+        self.pool.restart(1)
+
+        metrics = self.pool.metrics()
+        self.assertEqual(metrics.restarts, 2)
+        self.assertTrue(all(worker.accepting for worker in metrics.workers))
+        self.assertTrue(set(pids).isdisjoint(worker.pid for worker in metrics.workers))
+
+    def test_crashed_worker_is_restarted(self) -> None:
+        pid = self.pool.metrics().workers[0].pid
+        assert pid is not None
+        os.kill(pid, signal.SIGKILL)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            worker = self.pool.metrics().workers[0]
+            if worker.restarts and worker.accepting:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual((worker.restarts, worker.alive), (1, True))
+        self.assertNotEqual(worker.pid, pid)
+        self.assertEqual(len(self.converse(["shopper-0", "shopper-1", "shopper-2"])), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+"""Cheapest basket for a whole shopping list or cart.
+
+Every line of the cart (or item of a shopping list) is a need: an amount of grams, milliliters or pieces, parsed from
+the unit quantity of the product, e.g. 2 x "1 liter" is 2000 ml. Candidates for every need are gathered with one
+concurrent multi-term search. The cost of covering each need with each candidate, in whole packs, is then scored for
+all needs at once as NumPy arrays, and the cheapest candidate whose packs do not exceed the need by more than the
+allowed overbuy is picked. The resulting plan is applied with one batched cart update.
+"""
+import re
+from dataclasses import dataclass
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from python_picnic_api.python_picnic_api import Cart, PicnicAPI
+from python_picnic_api.python_picnic_api.helper import _normalize_search_terms
+
+# Packs may exceed the need by at most this fraction, e.g. 1 kg instead of 750 g is fine, 1 kg instead of 250 g not.
+MAX_OVERBUY = 0.5
+
+UNIT_QUANTITY_PATTERN = re.compile(
+    r"(?:(\d+)\s*[x×]\s*)?(\d+(?:[.,]\d+)?)\s*(kg|kilo|gram|gr|g|liter|litre|l|ml|cl|stuks|stuk|st|pieces|piece|stück)\b",
+    re.IGNORECASE)
+PER_PIECE_PATTERN = re.compile(r"\bper\s+(?:stuk|stück|piece)\b", re.IGNORECASE)
+# Unit -> (base unit, factor to the base unit)
+_UNITS = {
+    "kg": ("g", 1000), "kilo": ("g", 1000), "gram": ("g", 1), "gr": ("g", 1), "g": ("g", 1),
+    "liter": ("ml", 1000), "litre": ("ml", 1000), "l": ("ml", 1000), "ml": ("ml", 1), "cl": ("ml", 10),
+    "stuks": ("piece", 1), "stuk": ("piece", 1), "st": ("piece", 1), "pieces": ("piece", 1), "piece": ("piece", 1),
+    "stück": ("piece", 1),
+}
+# Unit of needs without a quantity, e.g. "milk" on a shopping list: one pack of any size.
+PACK = "pack"
+
+
+def parse_unit_quantity(unit_quantity: str | None) -> tuple[float, str] | None:
+    """Return the amount in its base unit (g, ml or piece) of a unit quantity like "6 x 330 ml", or None."""
+    if not unit_quantity:
+        return None
+    match = UNIT_QUANTITY_PATTERN.search(unit_quantity)
+    if match is None:
+        return (1.0, "piece") if PER_PIECE_PATTERN.search(unit_quantity) else None
+    multiple, amount, unit = match.groups()
+    base_unit, factor = _UNITS[unit.lower()]
+    return int(multiple or 1) * float(amount.replace(",", ".")) * factor, base_unit
+
+
+@dataclass(frozen=True)
+class Need:
+    """An amount of something to buy, and the product in the cart that covers it now, if any."""
+    term: str
+    amount: float
+    unit: str
+    product_id: str | None = None
+    count: int = 0
+    price: int = 0
+
+
+@dataclass(frozen=True)
+class Candidate:
+    product_id: str
+    name: str
+    price: int
+    amount: float
+    unit: str
+
+
+@dataclass(frozen=True)
+class Replacement:
+    """Buy count packs of a product instead of the current product of a need (or in addition to nothing)."""
+    term: str
+    product_id: str
+    name: str
+    count: int
+    price: int
+    old_product_id: str | None = None
+    old_count: int = 0
+    old_price: int = 0
+
+    @property
+    def saving(self) -> int:
+        return self.old_price - self.price if self.old_product_id else 0
+
+
+@dataclass(frozen=True)
+class BasketPlan:
+    """Replacements that make the basket cheaper, and the terms that no candidate could cover."""
+    replacements: tuple[Replacement, ...] = ()
+    unmatched: tuple[str, ...] = ()
+
+    @property
+    def saving(self) -> int:
+        return sum(replacement.saving for replacement in self.replacements)
+
+    def cart_changes(self) -> dict[str, int]:
+        """Return the count changes by product id that carry out the plan."""
+        changes: dict[str, int] = {}
+        for replacement in self.replacements:
+            if replacement.old_product_id:
+                changes[replacement.old_product_id] = changes.get(replacement.old_product_id, 0) - replacement.old_count
+            changes[replacement.product_id] = changes.get(replacement.product_id, 0) + replacement.count
+        return changes
+
+
+def needs_from_cart(cart: Cart) -> list[Need]:
+    """Return a need for every cart line whose unit quantity is known; other lines cannot be compared."""
+    needs = []
+    for line in cart:
+        quantity = parse_unit_quantity(line.unit_quantity)
+        if quantity is not None:
+            amount, unit = quantity
+            needs.append(Need(line.name, amount * line.count, unit, line.product_id, line.count, line.display_price))
+    return needs
+
+
+def needs_from_list(items: Iterable[str]) -> list[Need]:
+    """Return a need for every shopping list item, e.g. "2 liter milk", or one pack of "eggs"."""
+    needs = []
+    for item in items:
+        quantity = parse_unit_quantity(item)
+        term = " ".join(UNIT_QUANTITY_PATTERN.sub(" ", item).split()) or item.strip()
+        if quantity is None:
+            needs.append(Need(term, 1, PACK))
+        else:
+            needs.append(Need(term, *quantity))
+    return needs
+
+
+def candidates_from_search(items: list[dict]) -> list[Candidate]:
+    """Return the search results with a known unit quantity as candidates."""
+    candidates = []
+    for item in items:
+        quantity = parse_unit_quantity(item.get("unit_quantity"))
+        if quantity is not None and item.get("display_price") is not None:
+            candidates.append(Candidate(item["id"], item.get("name", ""), int(item["display_price"]), *quantity))
+    return candidates
+
+
+def select_candidates(
+        needs: Sequence[Need], candidates: Sequence[Sequence[Candidate]], max_overbuy: float = MAX_OVERBUY
+) -> list[tuple[int, int] | None]:
+    """Pick the cheapest feasible candidate of every need.
+
+    All needs are scored at once: the candidates are laid out as a needs x candidates array, padded with infeasible
+    entries. A candidate is feasible if its unit fits the need and the whole packs that cover the need exceed it by at
+    most max_overbuy. Of equally cheap candidates, the one that exceeds the need the least wins.
+
+    Returns:
+        The index of the chosen candidate and its number of packs per need, or None if no candidate is feasible.
+    """
+    if not needs:
+        return []
+    width = max(1, max(len(need_candidates) for need_candidates in candidates))
+    prices = np.full((len(needs), width), np.inf)
+    amounts = np.ones((len(needs), width))
+    compatible: np.ndarray = np.zeros((len(needs), width), dtype=bool)
+    for row, (need, need_candidates) in enumerate(zip(needs, candidates)):
+        for column, candidate in enumerate(need_candidates):
+            prices[row, column] = candidate.price
+            if need.unit == PACK:
+                compatible[row, column] = True
+            elif candidate.unit == need.unit:
+                amounts[row, column] = candidate.amount
+                compatible[row, column] = True
+    needed = np.array([need.amount for need in needs])[:, None]
+
+    # The small tolerance keeps rounding errors like 0.3 / 0.1 from adding a pack.
+    packs = np.maximum(np.ceil(needed / amounts - 1e-9), 1)
+    overbuy = packs * amounts / needed - 1
+    feasible = compatible & (overbuy <= max_overbuy + 1e-9)
+    costs = np.where(feasible, packs * prices, np.inf)
+    # Overbuy is below one cent per unit of fraction, so it only breaks ties.
+    best = np.argmin(costs + np.minimum(overbuy, 1) * 1e-3, axis=1)
+    rows = np.arange(len(needs))
+    found = np.isfinite(costs[rows, best])
+    return [(int(column), int(count)) if ok else None
+            for column, count, ok in zip(best, packs[rows, best], found)]
+
+
+def plan_basket(picnic: PicnicAPI, needs: Sequence[Need], max_overbuy: float = MAX_OVERBUY) -> BasketPlan:
+    """Search candidates for all needs at once and plan the cheapest basket that covers them."""
+    results = picnic.search_many([need.term for need in needs])
+    candidates = []
+    for need in needs:
+        # search_many keys its results by the normalized terms.
+        terms = _normalize_search_terms([need.term])
+        result = results.get(terms[0] if terms else "", {"items": []})
+        need_candidates = candidates_from_search(result["items"])
+        if need.product_id and all(candidate.product_id != need.product_id for candidate in need_candidates):
+            # The current product always covers its need exactly, so there is something to compare with.
+            need_candidates.append(Candidate(need.product_id, need.term, need.price // max(need.count, 1),
+                                             need.amount / max(need.count, 1), need.unit))
+        candidates.append(need_candidates)
+
+    replacements = []
+    unmatched = []
+    for need, need_candidates, selection in zip(needs, candidates, select_candidates(needs, candidates, max_overbuy)):
+        if selection is None:
+            unmatched.append(need.term)
+            continue
+        candidate = need_candidates[selection[0]]
+        count = selection[1]
+        replacement = Replacement(need.term, candidate.product_id, candidate.name, count, candidate.price * count,
+                                  need.product_id, need.count, need.price)
+        if need.product_id is None or (candidate.product_id != need.product_id and replacement.saving > 0):
+            replacements.append(replacement)
+    return BasketPlan(tuple(replacements), tuple(unmatched))
+
+
+def apply_basket_plan(picnic: PicnicAPI, plan: BasketPlan) -> dict:
+    """Carry out a plan with one batched cart update. Returns the errors by product id and the cart afterwards."""
+    return picnic.update_cart(plan.cart_changes())
@@ -1,15 +1,241 @@
+import functools
+import logging
 import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable
 
 from dotenv import load_dotenv
 
-from ai_helper_functions import find_product_in_cart
-from python_picnic_api.python_picnic_api import PicnicAPI
+from python_picnic_api.python_picnic_api import Cart, PicnicAPI
+from python_picnic_api.python_picnic_api.cache import Cache
+from python_picnic_api.python_picnic_api.categories import LazyCategoryTree
+from python_picnic_api.python_picnic_api.optimistic import OptimisticCart
+from python_picnic_api.python_picnic_api.parsing import ParsingExecutor
+from structured_logging import log_event
+from tools.prefetch import PrefetchEngine
+from tools.registry import ToolRegistry
+from tools.response_shaping import shape_tool_result
+
+if TYPE_CHECKING:
+    from python_picnic_api.python_picnic_api.shared_cache import SharedCacheStore
+    from tools.basket_optimizer import BasketPlan
 
 load_dotenv()
 
-picnic = PicnicAPI(username=os.environ.get("PICNIC_USERNAME"),
-                   password=os.environ.get("PICNIC_PASSWORD"),
-                   country_code=os.environ.get("PICNIC_REGION"))
+logger = logging.getLogger(__name__)
+
+# Number of worker processes that parse search and recipe pages; with 0 they are parsed in the calling thread.
+PARSE_WORKERS = int(os.environ.get("PICNIC_PARSE_WORKERS", "0"))
+
+# File of the cache that is shared by all worker processes of a host. Without it, every process caches on its own.
+SHARED_CACHE_PATH = os.environ.get("PICNIC_SHARED_CACHE")
+
+# The cart is re-fetched only if it was neither fetched nor mutated for this many seconds,
+# e.g. to pick up changes that were made in the Picnic app in the meantime.
+CART_MAX_AGE_SECONDS = 60
+
+# If enabled, cart mutations are confirmed right away from a locally predicted cart while Picnic is updated in the
+# background. Failed updates are reported with the next tool response or turn.
+OPTIMISTIC_CART_MUTATIONS = os.environ.get("PICNIC_OPTIMISTIC_CART", "false").lower() == "true"
+
+# Tool calls that adding a product of a list takes without reorder_from_list: a search and an add.
+TOOL_CALLS_PER_REORDERED_ITEM = 2
+
+
+@dataclass
+class ShopperSession:
+    """State of the tools for one shopper: the Picnic client, the local cart and the products shown to the shopper.
+
+    The agent has a single shopper, whose session is used by default. Several shoppers can be served by one process,
+    e.g. by a load test, by using a session per thread or task, see use_session.
+    """
+    picnic: PicnicAPI | None = None
+    cart: Cart | None = None
+    cart_updated_at: float = 0.0
+    cart_lock: threading.Lock = field(default_factory=threading.Lock)
+    # Name and unit price of products that were recently shown to the shopper, used to predict new cart lines.
+    product_catalog: dict[str, tuple[str, int]] = field(default_factory=dict)
+    optimistic_cart: OptimisticCart | None = None
+    # Warms the caches for the follow-up calls that usually come after a recipe search.
+    prefetcher: PrefetchEngine = field(default_factory=PrefetchEngine)
+    # Finds the product of the cart that a product name refers to, with Gemini if not set.
+    product_matcher: Callable[[list[dict], str], Any] | None = None
+    # The last basket plan proposed to the shopper, which is carried out once they agree.
+    basket_plan: "BasketPlan | None" = None
+    # Categories browsed by the shopper, loaded one category at a time.
+    category_tree: LazyCategoryTree | None = None
+    # Worker processes that parse the pages of the client that get_picnic created, if PARSE_WORKERS is set.
+    parsing_executor: ParsingExecutor | None = None
+
+    def close(self) -> None:
+        """Stop the background work of the session."""
+        self.prefetcher.close()
+        if self.parsing_executor is not None:
+            self.parsing_executor.shutdown()
+        if self.category_tree is not None:
+            self.category_tree.close()
+        if self.optimistic_cart is not None:
+            self.optimistic_cart.close()
+
+
+_default_session = ShopperSession()
+_current_session: ContextVar[ShopperSession] = ContextVar("shopper_session", default=_default_session)
+_picnic_lock = threading.Lock()
+
+# Prefetch engine of the default session.
+prefetcher = _default_session.prefetcher
+
+
+def current_session() -> ShopperSession:
+    return _current_session.get()
+
+
+def use_session(session: ShopperSession) -> None:
+    """Use the given session for the tool calls of the current thread or task."""
+    _current_session.set(session)
+
+
+@functools.cache
+def shared_cache_store() -> "SharedCacheStore | None":
+    """Return the cache store shared with the other worker processes, if one is configured."""
+    if not SHARED_CACHE_PATH:
+        return None
+    from python_picnic_api.python_picnic_api.shared_cache import SharedCacheStore
+    return SharedCacheStore(SHARED_CACHE_PATH)
+
+
+def get_picnic() -> PicnicAPI:
+    """Return the Picnic client, logging in on first use."""
+    session = current_session()
+    if session.picnic is None:
+        with _picnic_lock:
+            if session.picnic is None:
+                if PARSE_WORKERS and session.parsing_executor is None:
+                    session.parsing_executor = ParsingExecutor(PARSE_WORKERS)
+                session.picnic = PicnicAPI(username=os.environ.get("PICNIC_USERNAME"),
+                                           password=os.environ.get("PICNIC_PASSWORD"),
+                                           country_code=os.environ.get("PICNIC_REGION"),
+                                           parsing_executor=session.parsing_executor,
+                                           cache_store=shared_cache_store())
+    return session.picnic
+
+
+def use_picnic(picnic: PicnicAPI) -> None:
+    """Use the given client for all tools, e.g. a client of the stub server or of a replayed recording.
+
+    The local cart and the remembered products of the previous client are dropped.
+    """
+    session = current_session()
+    with _picnic_lock:
+        session.picnic = picnic
+        if session.category_tree is not None:
+            session.category_tree.close()
+            session.category_tree = None
+    with session.cart_lock:
+        session.cart = None
+        session.product_catalog.clear()
+
+
+def persistent_caches() -> dict[str, Cache]:
+    """Return the caches of the Picnic client that are worth keeping across restarts, by snapshot namespace."""
+    picnic = get_picnic()
+    return {
+        "search": picnic.search_cache,
+        "recipe_ingredients": picnic.recipe_ingredients_cache,
+        "articles": picnic.article_cache,
+        "categories": picnic.categories_cache,
+        "category_lists": picnic.category_lists_cache,
+    }
+
+
+def _update_cart(payload: dict, session: ShopperSession | None = None) -> Cart:
+    """Update the local cart from a cart payload returned by Picnic."""
+    session = session or current_session()
+    with session.cart_lock:
+        session.cart = Cart.from_payload(payload, previous=session.cart)
+        session.cart_updated_at = time.monotonic()
+        return session.cart
+
+
+def _get_optimistic_cart() -> OptimisticCart | None:
+    """Return the optimistic cart if optimistic mutations are enabled."""
+    session = current_session()
+    if OPTIMISTIC_CART_MUTATIONS and session.optimistic_cart is None:
+        with session.cart_lock:
+            if session.optimistic_cart is None:
+                # Confirmations arrive on worker threads, which do not share the context of this one.
+                session.optimistic_cart = OptimisticCart(
+                    get_picnic(), on_confirmed=partial(_update_cart, session=session))
+    return session.optimistic_cart
+
+
+def _invalidate_cart() -> None:
+    """Mark the local cart as outdated after a mutation that does not return the cart."""
+    current_session().cart_updated_at = float("-inf")
+
+
+def _current_cart() -> Cart:
+    """Return the local cart, fetching it from Picnic only if it is missing or outdated."""
+    session = current_session()
+    cart = session.cart
+    if cart is None or time.monotonic() - session.cart_updated_at > CART_MAX_AGE_SECONDS:
+        cart = _update_cart(get_picnic().get_cart())
+    if optimistic_cart := _get_optimistic_cart():
+        return optimistic_cart.predict(cart)
+    return cart
+
+
+def _remember_products(products: list[dict]) -> None:
+    product_catalog = current_session().product_catalog
+    for product in products:
+        product_catalog[product["id"]] = (product["name"], product["display_price"])
+
+
+@dataclass
+class ReorderStats:
+    """Accumulated batched reorders, and the time they saved compared to adding their products one by one."""
+    reorders: int = 0
+    items: int = 0
+    failed_items: int = 0
+    seconds: float = 0.0
+    # Time the requests of the reorders would have taken one after another.
+    sequential_seconds: float = 0.0
+
+    @property
+    def seconds_saved(self) -> float:
+        return self.sequential_seconds - self.seconds
+
+    @property
+    def tool_calls_saved(self) -> int:
+        # Product by product, the model would search and add every product with a tool call each.
+        return TOOL_CALLS_PER_REORDERED_ITEM * self.items - self.reorders
+
+
+_reorder_stats = ReorderStats()
+_reorder_stats_lock = threading.Lock()
+
+
+def reorder_stats() -> ReorderStats:
+    """Return a copy of the accumulated reorder stats of all sessions."""
+    with _reorder_stats_lock:
+        return ReorderStats(**vars(_reorder_stats))
+
+
+def drain_cart_failures() -> list[str]:
+    """Return descriptions of the background cart updates that failed since the last call."""
+    optimistic_cart = current_session().optimistic_cart
+    if optimistic_cart is None:
+        return []
+    return [f"Could not {failure.action} {failure.count}x {failure.name or failure.product_id}: {failure.code}"
+            for failure in optimistic_cart.drain_failures()]
+
+
+# The tools that the model can call, registered with their descriptions for the model below.
+registry = ToolRegistry()
 
 
 def format_price(value: int) -> str:
@@ -17,6 +243,11 @@ def format_price(value: int) -> str:
     return f"{euros:.2f} Euro"
 
 
+@registry.tool(
+    "Searches for products on the online grocery platform Picnic.",
+    search_query="The name of the product that shall be searched such as milk or apples",
+    max_item_return_count="Number of returned products. Can be between 0 and 10."
+)
 def search_for_products(search_query: str, max_item_return_count: int = 3) -> dict:
     """Search for products on the Picnic platform.
 
@@ -27,25 +258,57 @@ def search_for_products(search_query: str, max_item_return_count: int = 3) -> di
     Returns:
         A list of products that are available on the Picnic platform, sorted by price.
     """
-    products = picnic.search(search_query)[0]["items"]
-    filtered_products = []
-    if len(products) > 0:
-        products = sorted(products, key=lambda x: x['display_price'])
-        for product in products[0:max_item_return_count]:
-            filtered_products.append({
-                "name": product['name'].replace(",", "."),
-                "price": format_price(product['display_price']),
-                "id": product['id']
-            })
-    else:
-        return {
-            "products": "No product could be found!"
-        }
+    products = get_picnic().search(search_query)[0]["items"]
+    _remember_products(products)
     return {
-        "products": filtered_products
+        "products": _cheapest_products(products, max_item_return_count)
     }
 
 
+def _cheapest_products(products: list[dict], max_item_return_count: int) -> list[dict] | str:
+    """Return the cheapest products with name, price and id, or a message for the model if there are none."""
+    if len(products) == 0:
+        return "No product could be found!"
+    products = sorted(products, key=lambda x: x['display_price'])
+    return [{
+        "name": product['name'].replace(",", "."),
+        "price": format_price(product['display_price']),
+        "id": product['id']
+    } for product in products[0:max_item_return_count]]
+
+
+@registry.tool(
+    "Searches for all products of a shopping list at once on the online grocery platform Picnic. Use it instead of "
+    "searching the products one by one when the user names several products.",
+    items="The names of the products on the shopping list, such as milk, eggs and butter.",
+    max_item_return_count="Number of returned products per item. Can be between 0 and 10."
+)
+def search_shopping_list(items: list[str], max_item_return_count: int = 3) -> dict:
+    """Search for all products of a shopping list on the Picnic platform at once.
+
+    Args:
+        items: Names of the products on the list; duplicates are searched once.
+        max_item_return_count: Maximum number of returned products per item.
+
+    Returns:
+        For every item, a list of products that are available on the Picnic platform, sorted by price.
+    """
+    results = get_picnic().search_many(items)
+    shopping_list = []
+    for item, result in results.items():
+        _remember_products(result["items"])
+        entry = {"item": item, "products": _cheapest_products(result["items"], max_item_return_count)}
+        if result.get("error"):
+            entry["error"] = result["error"].get("code")
+        shopping_list.append(entry)
+    return {"shopping_list": shopping_list}
+
+
+@registry.tool(
+    "Adds a product to the Picnic platform shopping cart.",
+    product_id="The ID of the product that shall be added to the online picnic shopping cart.",
+    count="The amount of products to add to the online picnic shopping cart. Default to 1."
+)
 def add_product_to_cart(product_id: str, count: int = 1) -> dict:
     """Adds a product to your online shopping cart.
 
@@ -57,16 +320,35 @@ def add_product_to_cart(product_id: str, count: int = 1) -> dict:
         The name of the product that was added.
     """
     product_id = product_id.lower().strip()
-    response = picnic.add_product(product_id, count=count)
+    if optimistic_cart := _get_optimistic_cart():
+        session = current_session()
+        # Only data that is already at hand, so that the add does not wait for Picnic.
+        line = optimistic_cart.predict(session.cart).get(product_id) if session.cart is not None else None
+        article = get_picnic().article_cache.get(product_id)
+        if product_id in session.product_catalog:
+            name, price = session.product_catalog[product_id]
+        elif line:
+            name, price = line.name, line.price
+        elif article:
+            name, price = article.get("name"), article.get("display_price", article.get("price"))
+        else:
+            name, price = None, None
+        optimistic_cart.add_product(product_id, count=count, name=name, price=price)
+        return {"picnic_response": f"Successfully added {name or 'product'} to shopping cart"}
+    response = get_picnic().add_product(product_id, count=count)
     if response["error"]:
         return {"picnic_response": response["error"]["code"]}
-    for item in response["items"]:
-        if item["items"][0]["id"] == product_id:
-            item_name = item["items"][0]["name"]
-            return {"picnic_response": f"Successfully added {item_name} to shopping cart"}
+    item_name = _update_cart(response).name_of(product_id)
+    if item_name:
+        return {"picnic_response": f"Successfully added {item_name} to shopping cart"}
     return {"picnic_response": "Successfully added product to shopping cart"}
 
 
+@registry.tool(
+    "Removes a product from the Picnic platform shopping cart.",
+    product_id="The ID of the product that shall be removed from the online picnic shopping cart.",
+    count="The amount of products to remove from the online picnic shopping cart. Default to 1."
+)
 def remove_product_from_cart(product_id: str, count: int = 1) -> dict:
     """Removes a product from the shopping cart.
 
@@ -78,36 +360,56 @@ def remove_product_from_cart(product_id: str, count: int = 1) -> dict:
         The name of the product that was removed.
     """
     product_id = product_id.lower().strip()
-    response = picnic.remove_product(product_id, count=count)
+    # The product might be gone from the returned cart, so its name is looked up before removing it.
+    cart = current_session().cart
+    item_name = cart.name_of(product_id) if cart is not None else None
+    if optimistic_cart := _get_optimistic_cart():
+        optimistic_cart.remove_product(product_id, count=count)
+        return {"picnic_response": f"Successfully removed {item_name or 'product'} from shopping cart"}
+    response = get_picnic().remove_product(product_id, count=count)
     if response["error"]:
         return {"picnic_response": response["error"]["code"]}
-    for item in response["items"]:
-        if item["items"][0]["id"] == product_id:
-            item_name = item["items"][0]["name"]
-            return {"picnic_response": f"Successfully removed {item_name} from shopping cart"}
+    item_name = _update_cart(response).name_of(product_id) or item_name
+    if item_name:
+        return {"picnic_response": f"Successfully removed {item_name} from shopping cart"}
     return {"picnic_response": "Successfully removed product from shopping cart"}
 
 
-def search_for_recipes(search_query: str, max_item_return_count: int = 3) -> dict:
+@registry.tool(
+    "Searches for recipes on the online grocery platform Picnic.",
+    search_query="Name of the recipe that shall be searched such as pizza or spaghetti bolognese.",
+    max_item_return_count="Number of returned recipes. Can be between 0 and 10.",
+    offset="Number of recipes to skip, e.g. the next_offset of a previous search."
+)
+def search_for_recipes(search_query: str, max_item_return_count: int = 3, offset: int = 0) -> dict:
     """Search for recipes on the Picnic platform.
 
     Args:
         search_query: Recipe that shall be searched.
         max_item_return_count: Maximum number of returned recipes.
+        offset: Number of recipes to skip, to get further results of the same search.
 
     Returns:
-        A list of recipes that are available on the Picnic platform, sortd by relevance.
+        A list of recipes that are available on the Picnic platform, sortd by relevance. Every recipe has its id,
+        name, preparation time in minutes and servings, so it can be added to the cart right away.
     """
-    recipes = picnic.search_recipe(search_query)[0]["items"]
-    if len(recipes) == 0:
+    page = get_picnic().search_recipe(search_query, max_items=int(max_item_return_count), offset=int(offset))[0]
+    if len(page["items"]) == 0:
         return {
             "recipes": "No recipes could be found!"
         }
-    return {
-        "recipes": recipes[0:max_item_return_count]
-    }
-
-
+    recipes = [{"id": recipe["id"], "name": recipe["name"], "preparation_time": recipe["preparation_time"],
+                "servings": recipe["servings"]} for recipe in page["items"] if recipe["id"]]
+    result: dict = {"recipes": recipes}
+    if page["next_offset"] is not None:
+        result["next_offset"] = page["next_offset"]
+    return result
+
+
+@registry.tool(
+    "Adds a recipe to the Picnic platform shopping cart.",
+    recipe_id="The ID of the recipe that shall be added to the online picnic shopping cart."
+)
 def add_recipe_to_cart(recipe_id: str) -> dict:
     """Adds a recipe to your online shopping cart.
 
@@ -118,12 +420,93 @@ def add_recipe_to_cart(recipe_id: str) -> dict:
         The name of the recipe that was added.
     """
     recipe_id = recipe_id.lower().strip()
-    response = picnic.add_recipe_to_cart(recipe_id)
+    _record_recipe_use(recipe_id)
+    response = get_picnic().add_recipe_to_cart(recipe_id)
     if response["error"]:
         return {"picnic_response": response["error"]["code"]}
+    _invalidate_cart()
     return {"picnic_response": "Successfully added the recipe to your shopping cart"}
 
 
+@registry.tool(
+    "Adds several recipes to the Picnic platform shopping cart at once, one recipe per day. Ingredients that several "
+    "recipes share are added together, in the quantity all of them need.",
+    recipe_ids="The IDs of the recipes that shall be added, in the order of the days.",
+    portions="Number of portions of every recipe. By default the servings of each recipe."
+)
+def plan_meals(recipe_ids: list[str], portions: int | None = None) -> dict:
+    """Adds several recipes to your online shopping cart at once, one per day.
+
+    Args:
+        recipe_ids: IDs of the recipes that shall be added, in the order of the days.
+        portions: Portions of every recipe; by default the servings of each recipe.
+
+    Returns:
+        The planned and failed recipes, the number of ingredients that several recipes share and were added together,
+        and the products in the shopping cart afterwards.
+    """
+    recipe_ids = [str(recipe_id).lower().strip() for recipe_id in recipe_ids]
+    for recipe_id in recipe_ids:
+        _record_recipe_use(recipe_id)
+    result = get_picnic().plan_meals(recipe_ids, portions=int(portions) if portions else None)
+    _update_cart(result["cart"])
+    return {
+        "planned_recipes": [{"id": recipe["recipe_id"], "day_offset": recipe["day_offset"],
+                             "portions": recipe["portions"]} for recipe in result["recipes"] if not recipe["error"]],
+        "failed_recipes": [{"id": recipe["recipe_id"], "error": recipe["error"]}
+                           for recipe in result["recipes"] if recipe["error"]],
+        "shared_ingredient_count": result["shared_ingredient_count"],
+        "picnic_response": _current_cart().to_products(),
+    }
+
+
+def _category_tree() -> LazyCategoryTree:
+    session = current_session()
+    picnic = get_picnic()
+    with _picnic_lock:
+        if session.category_tree is None:
+            session.category_tree = LazyCategoryTree(picnic)
+        return session.category_tree
+
+
+@registry.tool(
+    "Browses the categories of the Picnic store. Without a category, it returns the top-level categories. For a "
+    "category, it returns its subcategories, or its products if it has no subcategories.",
+    category="The name of the category to browse, such as dairy or coffee. Leave it empty for the top-level "
+             "categories.",
+    max_item_return_count="Number of returned products. Can be between 0 and 20."
+)
+def browse_category(category: str = "", max_item_return_count: int = 10) -> dict:
+    """Browse the category tree of the Picnic platform.
+
+    Only the browsed categories are fetched, not the whole catalog.
+
+    Args:
+        category: Name of the category to browse, or an empty string for the top-level categories.
+        max_item_return_count: Maximum number of returned products.
+
+    Returns:
+        The subcategories or the products of the category, sorted by price.
+    """
+    tree = _category_tree()
+    if not category.strip():
+        return {"categories": [node.name for node in tree.roots()]}
+    node = tree.find(category)
+    if node is None:
+        return {"picnic_response": f"No category could be found for {category}!",
+                "categories": [root.name for root in tree.roots()]}
+    children = tree.children(node)
+    if children and all(child.is_category for child in children):
+        return {"category": node.path, "categories": [child.name for child in children]}
+    products = [child.item for child in children if not child.is_category]
+    _remember_products(products)
+    return {"category": node.path, "products": _cheapest_products(products, max_item_return_count)}
+
+
+@registry.tool(
+    "Returns a list of product alternatives, sorted by its price, starting with the cheapest.",
+    product_name="The name of the product that we want to search cheaper alternatives for."
+)
 def search_for_cheaper_product_alternative(product_name: str) -> dict:
     """
     Search for a cheaper alternative product on the Picnic platform.
@@ -131,14 +514,15 @@ def search_for_cheaper_product_alternative(product_name: str) -> dict:
     Args:
         product_name: Name of the product that shall be replaced.
     """
+    product_matcher = current_session().product_matcher
+    if product_matcher is None:
+        from ai_helper_functions import find_product_in_cart
+        product_matcher = find_product_in_cart
+
     MAX_PRODUCTS_TO_RETURN = 6
-    current_cart = picnic.get_cart()
-    cart_items = current_cart.get("items", [])
-    filtered_cart_items = [
-        {"price": item["display_price"], "product_name": item["items"][0]["name"], "product_id": item["items"][0]["id"]}
-        for item in cart_items]
-    product_to_replace = find_product_in_cart(filtered_cart_items, product_name)
-    products = picnic.search(product_to_replace.short_product_name_version)[0]["items"]
+    product_to_replace: Any = product_matcher(_current_cart().to_products(), product_name)
+    products = get_picnic().search(product_to_replace.short_product_name_version)[0]["items"]
+    _remember_products(products)
     filtered_products = [
         {"price": product["display_price"], "product_name": product["name"], "product_id": product["id"]} for product in
         products[0:MAX_PRODUCTS_TO_RETURN]]
@@ -146,6 +530,121 @@ def search_for_cheaper_product_alternative(product_name: str) -> dict:
     return {"picnic_response": sorted_products}
 
 
+@registry.tool(
+    "Finds the cheapest basket: for every product in the shopping cart, or every item of a shopping list, the "
+    "cheapest products that cover the same amount. Returns the proposed replacements and savings; nothing is "
+    "changed until apply_cheapest_basket is called.",
+    shopping_list="Optional items of a shopping list with amounts, such as 2 liter milk or 500 g butter. By default "
+                  "the products in the shopping cart."
+)
+def find_cheapest_basket(shopping_list: list[str] | None = None) -> dict:
+    """Plan the cheapest basket for the cart or a shopping list, to be carried out with apply_cheapest_basket.
+
+    Args:
+        shopping_list: Items with optional amounts; by default the lines of the current cart.
+
+    Returns:
+        The proposed replacements with their savings, the total saving and the items no product was found for.
+    """
+    from tools.basket_optimizer import needs_from_cart, needs_from_list, plan_basket
+
+    needs = needs_from_list(shopping_list) if shopping_list else needs_from_cart(_current_cart())
+    plan = plan_basket(get_picnic(), needs)
+    current_session().basket_plan = plan
+    if not plan.replacements:
+        return {"picnic_response": "The basket is already the cheapest one.", "unmatched": list(plan.unmatched)}
+    return {
+        "replacements": [{
+            "item": replacement.term,
+            "buy": f"{replacement.count}x {replacement.name}",
+            "product_id": replacement.product_id,
+            "price": format_price(replacement.price),
+            "saving": format_price(replacement.saving) if replacement.old_product_id else None,
+        } for replacement in plan.replacements],
+        "total_saving": format_price(plan.saving),
+        "unmatched": list(plan.unmatched),
+    }
+
+
+@registry.tool("Carries out the replacements that find_cheapest_basket proposed, all at once.")
+def apply_cheapest_basket() -> dict:
+    """Carry out the last plan of find_cheapest_basket with one batched cart update."""
+    from tools.basket_optimizer import apply_basket_plan
+
+    session = current_session()
+    plan, session.basket_plan = session.basket_plan, None
+    if plan is None or not plan.replacements:
+        return {"picnic_response": "There is no basket plan to apply."}
+    result = apply_basket_plan(get_picnic(), plan)
+    _update_cart(result["cart"])
+    response: dict = {"picnic_response": _current_cart().to_products()}
+    if result["errors"]:
+        response["failed_products"] = result["errors"]
+    return response
+
+
+@registry.tool(
+    "Adds all products of a Picnic list to the shopping cart at once, such as the products that were bought last "
+    "week. Use it instead of searching and adding the products one by one when the user wants to buy them again.",
+    list_id="The ID of the list, such as purchases for the previously bought products.",
+    sublist_id="The ID of a sublist of the list, such as last-week. Lists of sublists, like the past orders of "
+               "purchases, need one; leave it empty to get the sublists to choose from."
+)
+def reorder_from_list(list_id: str, sublist_id: str = "") -> dict:
+    """Add all products of a list or sublist to the shopping cart with one batched cart update.
+
+    A list whose entries are sublists, e.g. the past orders of the shopper, is never added as a whole, which would
+    buy everything that was ever ordered. Its sublists are returned to choose from instead.
+
+    Args:
+        list_id: ID of the list.
+        sublist_id: ID of the sublist, or an empty string for the whole list.
+
+    Returns:
+        The added products, the products and sublists that could not be added with their Picnic error code, and the
+        products in the shopping cart afterwards. Or the sublists of a list of sublists, with nothing added.
+    """
+    list_id, sublist_id = list_id.strip(), sublist_id.strip()
+    if not sublist_id:
+        # A list of entries, or a dict with the error.
+        entries: Any = get_picnic().get_lists(list_id)
+        if isinstance(entries, dict) and entries.get("error"):
+            return {"picnic_response": entries["error"].get("code", "UNKNOWN_ERROR")}
+        sublists = [{"id": entry["id"], "name": entry.get("name")} for entry in entries
+                    if entry.get("type") == "CATEGORY"] if isinstance(entries, list) else []
+        if sublists:
+            return {"picnic_response": "Nothing was added. Ask the user which of the sublists to add and call "
+                                       "reorder_from_list again with its sublist_id.", "sublists": sublists}
+    result = get_picnic().reorder_list(list_id, sublist_id or None)
+    if result.get("error"):
+        return {"picnic_response": result["error"]}
+    _update_cart(result["cart"])
+    items = result["items"]
+    failed = [item for item in items if item["error"]]
+    with _reorder_stats_lock:
+        _reorder_stats.reorders += 1
+        _reorder_stats.items += len(items)
+        _reorder_stats.failed_items += len(failed)
+        _reorder_stats.seconds += result["seconds"]
+        _reorder_stats.sequential_seconds += result["sequential_seconds"]
+    response: dict = {
+        "added_products": [f"{item['count']}x {item['name'] or item['product_id']}"
+                           for item in items if not item["error"]],
+        "picnic_response": _current_cart().to_products(),
+    }
+    if failed:
+        response["failed_products"] = [{"product_id": item["product_id"], "name": item["name"], "error": item["error"]}
+                                       for item in failed]
+    if result["failed_sublists"]:
+        response["failed_sublists"] = result["failed_sublists"]
+    return response
+
+
+@registry.tool(
+    "Replace an existing product in the users shopping cart with a new one.",
+    old_product_id="Product id of the old product that shall be replaced.",
+    new_product_id="Product id of the new product."
+)
 def replace_existing_product(old_product_id: str, new_product_id: str) -> dict:
     """
     Replace an existing product in the users shopping cart with a new one.
@@ -154,80 +653,57 @@ def replace_existing_product(old_product_id: str, new_product_id: str) -> dict:
         old_product_id: Product id of the old product that shall be replaced.
         new_product_id: Product id of the new product.
     """
-    response = picnic.remove_product(product_id=old_product_id)
+    if _get_optimistic_cart() is not None:
+        # Both mutations have to be queued behind any pending mutation of the same products.
+        remove_product_from_cart(old_product_id)
+        add_product_to_cart(new_product_id)
+        return {"picnic_response": "Successfully replaced the product in your shopping cart."}
+    response = get_picnic().remove_product(product_id=old_product_id)
     if response["error"]:
         return {"picnic_response": response["error"]["code"]}
-    response = picnic.add_product(product_id=new_product_id)
+    _update_cart(response)
+    response = get_picnic().add_product(product_id=new_product_id)
     if response["error"]:
         return {"picnic_response": response["error"]["code"]}
+    _update_cart(response)
     return {"picnic_response": "Successfully replaced the product in your shopping cart."}
 
 
+@registry.tool("Get a list of all products that are currently in the shopping cart.")
 def get_all_current_products_in_cart() -> dict:
     """Get all products that are currently in the shopping cart.    """
-    current_cart = picnic.get_cart()
-    cart_items = current_cart.get("items", {})
-    filtered_cart_items = [
-        {"price": item["display_price"], "product_name": item["items"][0]["name"], "product_id": item["items"][0]["id"]}
-        for item in cart_items]
-    return {"picnic_response": filtered_cart_items}
+    return {"picnic_response": _current_cart().to_products()}
+
+
+def _prefetch_follow_ups(name: str, args: dict, result: dict) -> None:
+    """Prefetch what the likely next tool call needs, or cancel the prefetches once the conversation moved on."""
+    prefetcher = current_session().prefetcher
+    if name == "search_for_recipes" and isinstance(result.get("recipes"), list):
+        recipe_ids = [recipe["id"] for recipe in result["recipes"] if recipe.get("id")]
+        prefetcher.prefetch("recipe", recipe_ids, get_picnic().get_recipe_ingredients)
+    elif name not in ("add_recipe_to_cart", "plan_meals"):
+        # The other recipes of the search can still be added next, after any other call they are unlikely to be.
+        prefetcher.cancel()
+
+
+def _record_recipe_use(recipe_id: str) -> None:
+    """Count whether the ingredients of a recipe that is about to be added were prefetched, before they are read."""
+    cached = recipe_id in get_picnic().recipe_ingredients_cache
+    current_session().prefetcher.record_use("recipe", recipe_id, cached=cached)
 
 
 def handle_picnic_tool_operations(name: str, args: dict, call_id: str) -> dict:
     """Function that handles the different operations that can be performed by the Picnic assistant."""
-    def handle_product_search() -> dict:
-        search_query = args["search_query"]
-        return search_for_products(search_query)
-
-    def handle_recipe_search() -> dict:
-        search_query = args["search_query"]
-        return search_for_recipes(search_query)
-
-    def handle_add_recipe() -> dict:
-        recipe_id = args["recipe_id"]
-        return add_recipe_to_cart(str(recipe_id))
-
-    def handle_alternative_product_search() -> dict:
-        product_name = args["product_name"]
-        return search_for_cheaper_product_alternative(product_name)
-
-    def handle_add_product() -> dict:
-        product_id = args["product_id"]
-        count = args.get("count", 1)
-        return add_product_to_cart(str(product_id), int(count))
-
-    def handle_get_products() -> dict:
-        return get_all_current_products_in_cart()
-
-    def handle_remove_product() -> dict:
-        product_id = args["product_id"]
-        count = args.get("count", 1)
-        return remove_product_from_cart(str(product_id), int(count))
-
-    def handle_replace_product() -> dict:
-        return replace_existing_product(
-            str(args["old_product_id"]),
-            str(args["new_product_id"])
-        )
-
-    operations = {
-        "search_for_products": handle_product_search,
-        "search_for_recipes": handle_recipe_search,
-        "add_recipe_to_cart": handle_add_recipe,
-        "search_for_cheaper_product_alternative": handle_alternative_product_search,
-        "add_product_to_cart": handle_add_product,
-        "get_all_current_products_in_cart": handle_get_products,
-        "remove_product_from_cart": handle_remove_product,
-        "replace_existing_product": handle_replace_product
+    raw_result = registry.call(name, args)
+    _prefetch_follow_ups(name, args, raw_result)
+    result = shape_tool_result(name, raw_result)
+    # Completed before the result is logged, the writer formats the logged fields later.
+    if failures := drain_cart_failures():
+        log_event(logger, logging.WARNING, "cart_updates_failed", failures=failures)
+        result = {**result, "failed_cart_updates": failures}
+    log_event(logger, logging.DEBUG, "tool_call", name=name, args=args, result=result)
+    return {
+        "name": name,
+        "response": {"result": result},
+        "id": call_id
     }
-
-    if name in operations:
-        result = operations[name]()
-        response = {
-            "name": name,
-            "response": {"result": result},
-            "id": call_id
-        }
-        return response
-
-    raise ValueError(f"Unknown operation: {name}")
\ No newline at end of file
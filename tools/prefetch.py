@@ -0,0 +1,106 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+MAX_REMEMBERED_PREFETCHES = 256
+
+
+@dataclass(frozen=True)
+class PrefetchStats:
+    """Counters of the prefetch engine.
+
+    scheduled: Prefetches that were submitted.
+    completed: Prefetches that finished loading.
+    cancelled: Prefetches that were cancelled before they started.
+    failed: Prefetches that raised an error.
+    hits: Follow-up calls that were served from the cache with prefetched data.
+    misses: Follow-up calls that were not.
+    """
+    scheduled: int = 0
+    completed: int = 0
+    cancelled: int = 0
+    failed: int = 0
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        uses = self.hits + self.misses
+        return self.hits / uses if uses else 0.0
+
+
+class PrefetchEngine:
+    """Warms caches in the background for the tool calls that are likely to follow.
+
+    Every call to prefetch() starts a new round and cancels the prefetches of the previous round that did not start
+    yet. Loads that already started run to completion, their results end up in the caches anyway.
+
+    Args:
+        max_workers: Number of prefetches that run at the same time.
+        budget: Maximum number of keys that are prefetched per round.
+    """
+
+    def __init__(self, max_workers: int = 2, budget: int = 3):
+        self.budget = budget
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="picnic-prefetch")
+        self._lock = threading.Lock()
+        self._futures: list[tuple[Future, str, str]] = []
+        # (kind, key) of the recent prefetches that were not used yet, oldest first.
+        self._prefetched: dict[tuple[str, str], None] = {}
+        self._counters = dict(scheduled=0, completed=0, cancelled=0, failed=0, hits=0, misses=0)
+
+    def prefetch(self, kind: str, keys: Iterable[str], load: Callable[[str], object]) -> None:
+        """Cancel the previous round and load the first keys in the background."""
+        self.cancel()
+        with self._lock:
+            for key in list(keys)[:self.budget]:
+                if (kind, key) in self._prefetched:
+                    continue
+                self._prefetched[(kind, key)] = None
+                self._futures.append((self._executor.submit(self._load, kind, key, load), kind, key))
+                self._counters["scheduled"] += 1
+            while len(self._prefetched) > MAX_REMEMBERED_PREFETCHES:
+                del self._prefetched[next(iter(self._prefetched))]
+
+    def cancel(self) -> None:
+        """Cancel all prefetches that did not start yet, e.g. because the conversation moved on."""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        for future, kind, key in futures:
+            if future.cancel():
+                with self._lock:
+                    self._prefetched.pop((kind, key), None)
+                    self._counters["cancelled"] += 1
+
+    def record_use(self, kind: str, key: str, cached: bool) -> bool:
+        """Record that a follow-up call needs the data of a key, and whether its cache held the data.
+
+        Only a call whose data was prefetched and still cached when the call came counts as a hit; a prefetch that
+        did not finish in time, or whose data was evicted, saved nothing. Returns whether the call was a hit.
+        """
+        with self._lock:
+            hit = cached and (kind, key) in self._prefetched
+            self._prefetched.pop((kind, key), None)
+            self._counters["hits" if hit else "misses"] += 1
+        return hit
+
+    @property
+    def stats(self) -> PrefetchStats:
+        with self._lock:
+            return PrefetchStats(**self._counters)
+
+    def close(self) -> None:
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _load(self, kind: str, key: str, load: Callable[[str], object]) -> None:
+        try:
+            load(key)
+        except Exception:
+            with self._lock:
+                self._prefetched.pop((kind, key), None)
+                self._counters["failed"] += 1
+        else:
+            with self._lock:
+                self._counters["completed"] += 1
@@ -0,0 +1,265 @@
+"""Registry of the tools that the model can call.
+
+A tool is a plain function with typed parameters. Its function declaration is generated from its signature and the
+descriptions given at registration, and the converters that validate and coerce the arguments of a call are compiled
+from the parameter types once, when the tool is registered. Calls are dispatched through a table built at import.
+"""
+import inspect
+import threading
+import time
+import types
+import typing
+from dataclasses import dataclass
+from typing import Any, Callable, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_MISSING = object()
+
+
+class ToolArgumentError(ValueError):
+    """Raised if the arguments of a tool call do not fit the parameters of the tool."""
+
+
+@dataclass
+class ToolStats:
+    """Accumulated calls of a single tool."""
+    calls: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.calls if self.calls else 0.0
+
+
+def _to_str(value: Any) -> str:
+    if isinstance(value, (dict, list)):
+        raise TypeError("expected a string")
+    return str(value)
+
+
+def _to_int(value: Any) -> int:
+    # The model sends numbers as floats, e.g. 2.0, or sometimes as strings.
+    if isinstance(value, bool):
+        raise TypeError("expected a whole number")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return int(value.strip())
+    raise TypeError("expected a whole number")
+
+
+def _to_float(value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise TypeError("expected a number")
+    return float(value)
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    raise TypeError("expected true or false")
+
+
+_SCALARS: dict[type, tuple[str, Callable[[Any], Any]]] = {
+    str: ("STRING", _to_str),
+    int: ("NUMBER", _to_int),
+    float: ("NUMBER", _to_float),
+    bool: ("BOOLEAN", _to_bool),
+}
+
+
+def _compile(annotation: Any) -> tuple[dict, Callable[[Any], Any], type | None, bool]:
+    """Return the schema, the converter, the type that needs no conversion and whether None is allowed for a
+    parameter type."""
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType):
+        members = [member for member in typing.get_args(annotation) if member is not type(None)]
+        if len(members) != 1:
+            raise TypeError(f"Unsupported tool parameter type: {annotation}")
+        schema, convert, exact_type, _ = _compile(members[0])
+        return schema, convert, exact_type, True
+    if origin is list:
+        (item_annotation,) = typing.get_args(annotation) or (str,)
+        item_schema, convert_item, _, _ = _compile(item_annotation)
+
+        def convert_list(value: Any) -> list:
+            if not isinstance(value, (list, tuple)):
+                raise TypeError("expected a list")
+            return [convert_item(item) for item in value]
+
+        return {"type": "ARRAY", "items": item_schema}, convert_list, None, False
+    if annotation in _SCALARS:
+        schema_type, convert = _SCALARS[annotation]
+        return {"type": schema_type}, convert, annotation, False
+    raise TypeError(f"Unsupported tool parameter type: {annotation}")
+
+
+def _compile_binder(tool_name: str, parameters: list[tuple[str, Callable[[Any], Any], type | None, Any, bool]]
+                    ) -> Callable[[dict | None], dict]:
+    """Generate the function that validates and coerces the arguments of a tool, specialized to its parameters.
+
+    Every parameter is (name, converter, type that needs no conversion, default or _MISSING, whether None is
+    allowed). Like dataclasses do for __init__, the source is generated and compiled once, so that a call runs
+    straight-line code without looping over the parameters or looking up their properties.
+    """
+    namespace: dict[str, Any] = {"MISSING": _MISSING, "ToolArgumentError": ToolArgumentError}
+    # The model sends no arguments at all, rather than an empty object, for a call without any.
+    lines = ["def bind(args):", "    get = (args or {}).get"]
+    for index, (name, convert, exact_type, default, nullable) in enumerate(parameters):
+        namespace[f"convert_{index}"] = convert
+        namespace[f"type_{index}"] = exact_type
+        namespace[f"default_{index}"] = default
+        lines.append(f"    value = get({name!r}, MISSING)")
+        lines.append(f"    if value.__class__ is not type_{index}:")
+        if nullable:
+            lines.append("        if value is None:")
+            lines.append("            pass")
+            lines.append("        elif value is MISSING:")
+        else:
+            lines.append("        if value is MISSING or value is None:")
+        if default is _MISSING:
+            lines.append(f"            raise ToolArgumentError('{tool_name}: missing argument {name}')")
+        else:
+            lines.append(f"            value = default_{index}")
+        lines.append("        else:")
+        lines.append("            try:")
+        lines.append(f"                value = convert_{index}(value)")
+        lines.append("            except (TypeError, ValueError) as e:")
+        lines.append(f"                raise ToolArgumentError(f'{tool_name}: invalid argument {name}={{value!r}}: "
+                     "{e}') from None")
+        lines.append(f"    arg_{index} = value")
+    arguments = ", ".join(f"{name!r}: arg_{index}" for index, (name, *_) in enumerate(parameters))
+    lines.append(f"    return {{{arguments}}}")
+    exec("\n".join(lines), namespace)
+    return namespace["bind"]
+
+
+class Tool:
+    """A registered tool with its function declaration and the compiled converters of its parameters.
+
+    Args:
+        function: The function that implements the tool; its name is the name of the tool.
+        description: Description of the tool for the model.
+        parameter_descriptions: Description of every parameter for the model, by parameter name.
+    """
+
+    def __init__(self, function: Callable[..., Any], description: str, parameter_descriptions: dict[str, str]):
+        self.name = function.__name__
+        self.function = function
+        hints = typing.get_type_hints(function)
+        properties = {}
+        required = []
+        parameters = []
+        for parameter in inspect.signature(function).parameters.values():
+            schema, convert, exact_type, nullable = _compile(hints.get(parameter.name, str))
+            if parameter.name not in parameter_descriptions:
+                raise ValueError(f"Missing description of parameter {parameter.name} of tool {self.name}")
+            properties[parameter.name] = {**schema, "description": parameter_descriptions[parameter.name]}
+            if parameter.default is inspect.Parameter.empty:
+                required.append(parameter.name)
+            default = _MISSING if parameter.default is inspect.Parameter.empty else parameter.default
+            parameters.append((parameter.name, convert, exact_type, default, nullable))
+        # Validates and coerces the arguments of a call. Arguments the tool does not have are ignored.
+        self.bind = _compile_binder(self.name, parameters)
+
+        self.declaration: dict = {"name": self.name, "description": description}
+        if properties:
+            self.declaration["parameters"] = {"type": "OBJECT", "properties": properties, "required": required}
+
+
+class ToolRegistry:
+    """Tools by name, with their declarations for the model and timing and error counters per tool.
+
+    Every thread counts its calls separately, so that counting takes no lock; stats() adds them up.
+    """
+
+    def __init__(self) -> None:
+        self._tools: dict[str, Tool] = {}
+        self._local = threading.local()
+        # The counters of every thread that called a tool, each one only written by its own thread.
+        self._thread_stats: list[dict[str, ToolStats]] = []
+        self._stats_lock = threading.Lock()
+
+    def tool(self, description: str, **parameter_descriptions: str) -> Callable[[F], F]:
+        """Decorator that registers a function as a tool and returns it unchanged."""
+        def register(function: F) -> F:
+            self.register(function, description, parameter_descriptions)
+            return function
+
+        return register
+
+    def register(
+            self, function: Callable[..., Any], description: str, parameter_descriptions: dict[str, str] | None = None
+    ) -> Tool:
+        tool = Tool(function, description, parameter_descriptions or {})
+        self._tools[tool.name] = tool
+        return tool
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def __getitem__(self, name: str) -> Tool:
+        return self._tools[name]
+
+    def function_declarations(self) -> list[dict]:
+        """Return the function declarations of all tools, in the order they were registered."""
+        return [tool.declaration for tool in self._tools.values()]
+
+    def call(self, name: str, args: dict | None) -> Any:
+        """Call a tool with the arguments the model sent.
+
+        Raises:
+            ValueError: If there is no tool with the name.
+            ToolArgumentError: If the arguments do not fit the parameters of the tool.
+        """
+        tool = self._tools.get(name)
+        if tool is None:
+            raise ValueError(f"Unknown operation: {name}")
+        start = time.perf_counter()
+        try:
+            result = tool.function(**tool.bind(args))
+        except Exception:
+            self._count(name, time.perf_counter() - start, failed=True)
+            raise
+        self._count(name, time.perf_counter() - start, failed=False)
+        return result
+
+    def _count(self, name: str, elapsed: float, failed: bool) -> None:
+        try:
+            stats = self._local.stats[name]
+        except (AttributeError, KeyError):
+            stats = self._new_thread_stats(name)
+        stats.calls += 1
+        stats.errors += failed
+        stats.total_seconds += elapsed
+        if elapsed > stats.max_seconds:
+            stats.max_seconds = elapsed
+
+    def _new_thread_stats(self, name: str) -> ToolStats:
+        thread_stats = getattr(self._local, "stats", None)
+        if thread_stats is None:
+            thread_stats = self._local.stats = {}
+            with self._stats_lock:
+                self._thread_stats.append(thread_stats)
+        with self._stats_lock:
+            return thread_stats.setdefault(name, ToolStats())
+
+    def stats(self) -> dict[str, ToolStats]:
+        """Return the accumulated calls per tool that was called."""
+        totals: dict[str, ToolStats] = {}
+        with self._stats_lock:
+            for thread_stats in self._thread_stats:
+                for name, stats in list(thread_stats.items()):
+                    total = totals.setdefault(name, ToolStats())
+                    total.calls += stats.calls
+                    total.errors += stats.errors
+                    total.total_seconds += stats.total_seconds
+                    total.max_seconds = max(total.max_seconds, stats.max_seconds)
+        return totals
@@ -0,0 +1,145 @@
+import json
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable
+
+# Product and recipe names longer than this are cut off; the ids identify them anyway.
+MAX_NAME_LENGTH = 48
+# Rough token budget of a single tool response, estimated from its compact JSON size.
+MAX_RESPONSE_TOKENS = 800
+BYTES_PER_TOKEN = 4
+# Carts with more lines than this are summarised by their totals and most expensive lines.
+CART_SUMMARY_THRESHOLD = 15
+CART_TOP_LINES = 8
+
+
+@dataclass
+class PayloadStats:
+    """Accumulated response sizes of a single tool."""
+    calls: int = 0
+    raw_bytes: int = 0
+    shaped_bytes: int = 0
+
+    @property
+    def saved_ratio(self) -> float:
+        return 1 - self.shaped_bytes / self.raw_bytes if self.raw_bytes else 0.0
+
+
+_stats: dict[str, PayloadStats] = {}
+_stats_lock = threading.Lock()
+
+
+def payload_size(value: Any) -> int:
+    """Return the number of bytes of a value in compact JSON encoding."""
+    return len(json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def truncate_name(name: str, max_length: int = MAX_NAME_LENGTH) -> str:
+    if len(name) <= max_length:
+        return name
+    return name[:max_length - 1].rstrip() + "…"
+
+
+def _format_price(value: int) -> str:
+    return f"{value / 100:.2f} Euro"
+
+
+def _shape_products(result: dict) -> dict:
+    products = result.get("products")
+    if not isinstance(products, list):
+        return result
+    return {"products": [{**product, "name": truncate_name(product["name"])} for product in products]}
+
+
+def _shape_shopping_list(result: dict) -> dict:
+    return {"shopping_list": [{**entry, **_shape_products(entry)} for entry in result["shopping_list"]]}
+
+
+def _shape_recipes(result: dict) -> dict:
+    recipes = result.get("recipes")
+    if not isinstance(recipes, list):
+        return result
+    # Preparation time and servings are left out if the recipe tile did not show them.
+    shaped = {"recipes": [{**{key: value for key, value in recipe.items() if value is not None},
+                           "name": truncate_name(recipe.get("name") or "")} for recipe in recipes]}
+    if "next_offset" in result:
+        shaped["next_offset"] = result["next_offset"]
+    return shaped
+
+
+def _shape_product_lines(result: dict) -> dict:
+    lines = result.get("picnic_response")
+    if not isinstance(lines, list):
+        return result
+    return {"picnic_response": [{**line, "product_name": truncate_name(line["product_name"])} for line in lines]}
+
+
+def _shape_cart(result: dict) -> dict:
+    lines = result.get("picnic_response")
+    if not isinstance(lines, list) or len(lines) <= CART_SUMMARY_THRESHOLD:
+        return _shape_product_lines(result)
+    top_lines = sorted(lines, key=lambda line: line["price"], reverse=True)[:CART_TOP_LINES]
+    return {"picnic_response": {
+        "total_price": _format_price(sum(line["price"] for line in lines)),
+        "line_count": len(lines),
+        "most_expensive_lines": _shape_product_lines({"picnic_response": top_lines})["picnic_response"],
+        "omitted_line_count": len(lines) - len(top_lines),
+    }}
+
+
+def _shape_meal_plan(result: dict) -> dict:
+    return {**result, **_shape_cart(result)}
+
+
+def _shape_category(result: dict) -> dict:
+    return {**result, **_shape_products(result)}
+
+
+_SHAPERS: dict[str, Callable[[dict], dict]] = {
+    "search_for_products": _shape_products,
+    "search_shopping_list": _shape_shopping_list,
+    "search_for_recipes": _shape_recipes,
+    "search_for_cheaper_product_alternative": _shape_product_lines,
+    "get_all_current_products_in_cart": _shape_cart,
+    "plan_meals": _shape_meal_plan,
+    "browse_category": _shape_category,
+    "reorder_from_list": _shape_meal_plan,
+}
+
+
+def _fit_budget(result: dict, max_tokens: int) -> dict:
+    """Drop entries from the end of the longest list in the result until it fits the token budget."""
+    max_bytes = max_tokens * BYTES_PER_TOKEN
+    size = payload_size(result)
+    if size <= max_bytes:
+        return result
+    result = dict(result)
+    lists = [key for key, value in result.items() if isinstance(value, list) and value]
+    if not lists:
+        return result
+    key = max(lists, key=lambda k: len(result[k]))
+    items = list(result[key])
+    while items and size > max_bytes:
+        size -= payload_size(items.pop()) + 1
+    result["omitted_entry_count"] = len(result[key]) - len(items)
+    result[key] = items
+    return result
+
+
+def shape_tool_result(name: str, result: dict, max_tokens: int = MAX_RESPONSE_TOKENS) -> dict:
+    """Project a tool result to the fields the model needs and keep it within the token budget."""
+    shaper = _SHAPERS.get(name)
+    shaped = _fit_budget(shaper(result) if shaper else result, max_tokens)
+    raw_bytes, shaped_bytes = payload_size(result), payload_size(shaped)
+    with _stats_lock:
+        stats = _stats.setdefault(name, PayloadStats())
+        stats.calls += 1
+        stats.raw_bytes += raw_bytes
+        stats.shaped_bytes += shaped_bytes
+    return shaped
+
+
+def payload_stats() -> dict[str, PayloadStats]:
+    """Return the accumulated response sizes per tool."""
+    with _stats_lock:
+        return {name: PayloadStats(stats.calls, stats.raw_bytes, stats.shaped_bytes) for name, stats in _stats.items()}
@@ -0,0 +1,388 @@
+"""Hosting conversations on several cores: a supervisor with worker processes that each run their own event loop.
+
+One process hosts its conversations on a single core, which audio handling, JSON parsing and tool logic share. The
+WorkerPool starts a number of worker processes and routes every conversation to one of them. A conversation id is
+routed to the same worker whenever it can be, e.g. when a shopper reconnects, so that its caches are warm there,
+unless that worker is busier than the least busy one by more than AFFINITY_SLACK. Workers can be drained, i.e. they
+finish their conversations without taking new ones, and restarted one at a time. A worker that dies is restarted,
+and its conversations fail.
+
+A conversation is run by the host of the pool: a coroutine function host(conversation_id, params), which must be
+importable by the worker processes, i.e. defined at module level. Its result is the result of the conversation.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, cast
+
+Host = Callable[[str, dict], Awaitable[Any]]
+
+# Workers send their metrics every this many seconds.
+METRICS_INTERVAL = 0.5
+# A conversation goes to its preferred worker unless that one is busier than the least busy one by more than this.
+AFFINITY_SLACK = 2.0
+# A worker whose event loop is busy all the time counts as busy as this many additional conversations.
+CPU_LOAD_WEIGHT = 4.0
+
+
+@dataclass
+class WorkerMetrics:
+    """State of a worker process, as seen by the supervisor."""
+    index: int
+    pid: int | None = None
+    accepting: bool = False
+    alive: bool = False
+    active: int = 0
+    completed: int = 0
+    failed: int = 0
+    restarts: int = 0
+    # Share of the time the process spent on the CPU, and the delay of its event loop, in the last interval.
+    cpu_load: float = 0.0
+    loop_lag_seconds: float = 0.0
+    conversation_seconds: float = 0.0
+
+    @property
+    def load(self) -> float:
+        return self.active + CPU_LOAD_WEIGHT * min(self.cpu_load, 1.0)
+
+
+@dataclass
+class PoolMetrics:
+    """Metrics of all workers of a pool."""
+    workers: List[WorkerMetrics] = field(default_factory=list)
+
+    @property
+    def active(self) -> int:
+        return sum(worker.active for worker in self.workers)
+
+    @property
+    def completed(self) -> int:
+        return sum(worker.completed for worker in self.workers)
+
+    @property
+    def failed(self) -> int:
+        return sum(worker.failed for worker in self.workers)
+
+    @property
+    def restarts(self) -> int:
+        return sum(worker.restarts for worker in self.workers)
+
+    @property
+    def mean_conversation_seconds(self) -> float:
+        finished = self.completed + self.failed
+        return sum(worker.conversation_seconds for worker in self.workers) / finished if finished else 0.0
+
+    @property
+    def max_loop_lag_seconds(self) -> float:
+        return max((worker.loop_lag_seconds for worker in self.workers), default=0.0)
+
+
+def _affinity(conversation_id: str, index: int) -> int:
+    digest = hashlib.blake2b(f"{conversation_id}/{index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def choose_worker(conversation_id: str, workers: List[WorkerMetrics]) -> WorkerMetrics | None:
+    """Return the worker that a conversation should be routed to, or None if no worker accepts conversations.
+
+    Every conversation id prefers one worker by rendezvous hashing, which only changes for the ids of a worker that
+    stops accepting conversations. The preferred worker is taken unless its load exceeds the lowest load by more
+    than AFFINITY_SLACK, in which case the least loaded worker is.
+    """
+    accepting = [worker for worker in workers if worker.accepting and worker.alive]
+    if not accepting:
+        return None
+    preferred = max(accepting, key=lambda worker: _affinity(conversation_id, worker.index))
+    least_loaded = min(accepting, key=lambda worker: worker.load)
+    return preferred if preferred.load - least_loaded.load <= AFFINITY_SLACK else least_loaded
+
+
+class _Worker:
+    """The event loop of a worker process, which runs the conversations it is sent."""
+
+    def __init__(self, host: Host, commands: multiprocessing.connection.Connection,
+                 events: multiprocessing.connection.Connection, metrics_interval: float):
+        self.host = host
+        self.commands = commands
+        self.events = events
+        self.metrics_interval = metrics_interval
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.draining = False
+
+    async def run(self) -> None:
+        metrics = asyncio.create_task(self.report_metrics())
+        self.events.send(("ready", os.getpid()))
+        try:
+            while True:
+                command = await asyncio.to_thread(self.commands.recv)
+                if command[0] == "start":
+                    _, conversation_id, params = command
+                    if self.draining:
+                        self.events.send(("rejected", conversation_id))
+                    else:
+                        self.tasks[conversation_id] = asyncio.create_task(self.converse(conversation_id, params))
+                elif command[0] == "drain":
+                    self.draining = True
+                    if self.tasks:
+                        await asyncio.wait(list(self.tasks.values()))
+                    break
+        finally:
+            metrics.cancel()
+            self.events.send(("exited",))
+
+    async def converse(self, conversation_id: str, params: dict) -> None:
+        started_at = time.perf_counter()
+        try:
+            result = await self.host(conversation_id, params)
+        except BaseException as e:
+            self.events.send(("finished", conversation_id, time.perf_counter() - started_at, None, repr(e)))
+            if not isinstance(e, Exception):
+                raise
+        else:
+            self.events.send(("finished", conversation_id, time.perf_counter() - started_at, result, None))
+        finally:
+            self.tasks.pop(conversation_id, None)
+
+    async def report_metrics(self) -> None:
+        cpu_seconds, wall_seconds = time.process_time(), time.perf_counter()
+        while True:
+            expected = time.perf_counter() + self.metrics_interval
+            await asyncio.sleep(self.metrics_interval)
+            now = time.perf_counter()
+            cpu_now = time.process_time()
+            cpu_load = (cpu_now - cpu_seconds) / (now - wall_seconds)
+            cpu_seconds, wall_seconds = cpu_now, now
+            self.events.send(("metrics", cpu_load, max(0.0, now - expected)))
+
+
+def _worker_main(host: Host, commands: multiprocessing.connection.Connection,
+                 events: multiprocessing.connection.Connection, metrics_interval: float) -> None:
+    asyncio.run(_Worker(host, commands, events, metrics_interval).run())
+
+
+@dataclass
+class _Process:
+    process: Any
+    commands: multiprocessing.connection.Connection
+    events: multiprocessing.connection.Connection
+    ready: threading.Event = field(default_factory=threading.Event)
+    exited: threading.Event = field(default_factory=threading.Event)
+    # Whether the worker is stopped on purpose, and should not be restarted.
+    retiring: bool = False
+
+
+class WorkerPool:
+    """Supervisor of worker processes that host conversations, see the module documentation.
+
+    Args:
+        host: Coroutine function that runs a conversation in a worker, defined at module level.
+        workers: Number of worker processes, by default one per core.
+        metrics_interval: Seconds between the metrics that workers send.
+        start_method: multiprocessing start method of the workers.
+    """
+
+    def __init__(self, host: Host, workers: int | None = None, metrics_interval: float = METRICS_INTERVAL,
+                 start_method: str = "spawn"):
+        self.host = host
+        self.metrics_interval = metrics_interval
+        self._context = multiprocessing.get_context(start_method)
+        self._lock = threading.Lock()
+        self._workers = [WorkerMetrics(index) for index in range(workers or os.cpu_count() or 1)]
+        self._processes: Dict[int, _Process] = {}
+        # Conversation id -> (worker index, params, future) of the conversations that did not finish yet.
+        self._conversations: Dict[str, Tuple[int, dict, Future]] = {}
+        self._monitor: threading.Thread | None = None
+        self._closed = False
+        self._wakeup_reader, self._wakeup_writer = self._context.Pipe(duplex=False)
+
+    def __enter__(self) -> "WorkerPool":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def start(self, timeout: float = 60.0) -> "WorkerPool":
+        """Start the workers and wait until they are ready."""
+        with self._lock:
+            for worker in self._workers:
+                self._spawn(worker)
+        self._monitor = threading.Thread(target=self._monitor_events, name="worker-pool", daemon=True)
+        self._monitor.start()
+        self._wait_ready(list(self._processes.values()), timeout)
+        return self
+
+    def submit(self, conversation_id: str, params: dict | None = None) -> Future:
+        """Route a conversation to a worker and return a future of its result."""
+        future: Future = Future()
+        with self._lock:
+            if conversation_id in self._conversations:
+                raise ValueError(f"Conversation {conversation_id} is already running")
+            self._route(conversation_id, params or {}, future)
+        return future
+
+    def metrics(self) -> PoolMetrics:
+        """Return a snapshot of the metrics of all workers."""
+        with self._lock:
+            return PoolMetrics([WorkerMetrics(**vars(worker)) for worker in self._workers])
+
+    def drain(self, index: int, timeout: float | None = None) -> None:
+        """Stop routing conversations to a worker, let it finish its conversations and stop it."""
+        with self._lock:
+            worker = self._workers[index]
+            process = self._processes[index]
+            worker.accepting = False
+            process.retiring = True
+            if not process.exited.is_set():
+                process.commands.send(("drain",))
+        process.exited.wait(timeout)
+        process.process.join(timeout)
+
+    def restart(self, index: int, timeout: float = 60.0) -> None:
+        """Drain a worker and start a fresh process in its place."""
+        self.drain(index, timeout)
+        with self._lock:
+            self._workers[index].restarts += 1
+            process = self._spawn(self._workers[index])
+        self._wait_ready([process], timeout)
+
+    def rolling_restart(self, timeout: float = 60.0) -> None:
+        """Restart all workers one after another, so that the others keep serving."""
+        for index in range(len(self._workers)):
+            self.restart(index, timeout)
+
+    def close(self, timeout: float = 60.0) -> None:
+        """Drain all workers and stop the supervisor."""
+        with self._lock:
+            self._closed = True
+            processes = list(self._processes.items())
+            for index, process in processes:
+                self._workers[index].accepting = False
+                process.retiring = True
+                if not process.exited.is_set():
+                    process.commands.send(("drain",))
+        deadline = time.monotonic() + timeout
+        for _, process in processes:
+            process.exited.wait(max(0.0, deadline - time.monotonic()))
+            process.process.join(max(0.0, deadline - time.monotonic()))
+            if process.process.is_alive():
+                process.process.terminate()
+        self._wakeup_writer.send(None)
+        if self._monitor is not None:
+            self._monitor.join(timeout)
+
+    def _spawn(self, worker: WorkerMetrics) -> _Process:
+        command_reader, command_writer = self._context.Pipe(duplex=False)
+        event_reader, event_writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_worker_main, name=f"conversation-worker-{worker.index}",
+                                        args=(self.host, command_reader, event_writer, self.metrics_interval),
+                                        daemon=True)
+        process.start()
+        # The ends of the worker are closed here, so that reading its events fails once it exited.
+        command_reader.close()
+        event_writer.close()
+        self._processes[worker.index] = _Process(process, command_writer, event_reader)
+        worker.pid, worker.alive, worker.accepting = process.pid, False, False
+        worker.active, worker.cpu_load, worker.loop_lag_seconds = 0, 0.0, 0.0
+        if self._monitor is not None:
+            self._wakeup_writer.send(None)
+        return self._processes[worker.index]
+
+    @staticmethod
+    def _wait_ready(processes: List[_Process], timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            if not process.ready.wait(max(0.0, deadline - time.monotonic())):
+                raise TimeoutError(f"Worker {process.process.name} did not start within {timeout} seconds")
+
+    def _route(self, conversation_id: str, params: dict, future: Future) -> None:
+        # Called with the lock held.
+        while (worker := choose_worker(conversation_id, self._workers)) is not None:
+            try:
+                self._processes[worker.index].commands.send(("start", conversation_id, params))
+            except OSError:
+                # The worker exited, which the monitor did not see yet.
+                worker.accepting = False
+                continue
+            worker.active += 1
+            self._conversations[conversation_id] = (worker.index, params, future)
+            return
+        future.set_exception(RuntimeError("No worker accepts conversations"))
+
+    def _monitor_events(self) -> None:
+        while True:
+            with self._lock:
+                readers = {process.events: (index, process) for index, process in self._processes.items()
+                           if not process.exited.is_set()}
+                if self._closed and not readers:
+                    return
+            for ready in multiprocessing.connection.wait([*readers, self._wakeup_reader]):
+                if ready is self._wakeup_reader:
+                    self._wakeup_reader.recv()
+                    continue
+                process_events = cast(multiprocessing.connection.Connection, ready)
+                index, process = readers[process_events]
+                try:
+                    event = process_events.recv()
+                except (EOFError, OSError):
+                    event = ("exited",)
+                self._handle(index, process, event)
+                if process.exited.is_set():
+                    process_events.close()
+
+    def _handle(self, index: int, process: _Process, event: tuple) -> None:
+        with self._lock:
+            worker = self._workers[index]
+            kind = event[0]
+            if kind == "ready":
+                worker.alive = True
+                worker.accepting = not process.retiring
+                process.ready.set()
+            elif kind == "metrics":
+                _, worker.cpu_load, worker.loop_lag_seconds = event
+            elif kind == "finished":
+                _, conversation_id, seconds, result, error = event
+                _, _, future = self._conversations.pop(conversation_id)
+                worker.active -= 1
+                worker.conversation_seconds += seconds
+                if error is None:
+                    worker.completed += 1
+                    future.set_result(result)
+                else:
+                    worker.failed += 1
+                    future.set_exception(RuntimeError(f"Conversation {conversation_id} failed: {error}"))
+            elif kind == "rejected":
+                # The worker started draining after the conversation was routed to it.
+                conversation_id = event[1]
+                _, params, future = self._conversations.pop(conversation_id)
+                worker.active -= 1
+                self._route(conversation_id, params, future)
+            elif kind == "exited":
+                self._exited(worker, process)
+
+    def _exited(self, worker: WorkerMetrics, process: _Process) -> None:
+        # Called with the lock held.
+        if process.exited.is_set():
+            return
+        process.exited.set()
+        process.ready.set()
+        process.commands.close()
+        worker.alive = worker.accepting = False
+        for conversation_id, (index, _, future) in list(self._conversations.items()):
+            if index == worker.index:
+                del self._conversations[conversation_id]
+                worker.failed += 1
+                future.set_exception(RuntimeError(f"Worker {worker.index} exited during conversation "
+                                                  f"{conversation_id}"))
+        worker.active = 0
+        if not process.retiring and not self._closed:
+            worker.restarts += 1
+            self._spawn(worker)
+
+
+__all__ = ["PoolMetrics", "WorkerMetrics", "WorkerPool", "choose_worker"]